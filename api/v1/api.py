@@ -8,6 +8,8 @@ from api.v1.endpoints import (
     settings,
     appointment_requests,
     cart,
+    orders,
+    reports,
 )
 
 api_router = APIRouter()
@@ -22,4 +24,6 @@ api_router.include_router(
     prefix="/appointment-requests",
     tags=["appointment-requests"],
 )
-api_router.include_router(cart.router, prefix="/cart", tags=["cart"])
\ No newline at end of file
+api_router.include_router(cart.router, prefix="/cart", tags=["cart"])
+api_router.include_router(orders.router, prefix="/orders", tags=["orders"])
+api_router.include_router(reports.router, prefix="/reports", tags=["reports"])
@@ -0,0 +1,81 @@
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Query, Response, status
+
+from crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, Page, QueryFilter
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MISSING_IDS_HEADER = "X-Missing-Ids"
+
+
+class PaginationParams:
+    """Parámetros comunes de paginación para los listados.
+
+    Por defecto los listados están paginados; el comportamiento anterior
+    (devolver la colección completa) solo se obtiene con ``?all=true``.
+    """
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="Token opaco devuelto en X-Next-Cursor"),
+        descending: bool = Query(False, alias="desc"),
+        fetch_all: bool = Query(False, alias="all", description="Devuelve la colección completa sin paginar"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.descending = descending
+        self.fetch_all = fetch_all
+
+
+def build_filters(*candidates: QueryFilter) -> List[QueryFilter]:
+    """Descarta los filtros cuyo valor no fue enviado en la petición."""
+    return [(field, op, value) for field, op, value in candidates if value is not None]
+
+
+async def fetch_page(
+    get_page: Callable[..., Awaitable[Page]],
+    response: Response,
+    params: PaginationParams,
+    **query: Any,
+) -> Page:
+    """Ejecuta ``get_page`` del CRUD y publica el cursor siguiente en la cabecera.
+
+    Los errores de cursor o de combinación de filtros se devuelven como 400.
+    """
+    try:
+        page = await get_page(
+            limit=None if params.fetch_all else params.limit,
+            cursor=params.cursor,
+            descending=params.descending,
+            **query,
+        )
+    except (InvalidCursorError, ValueError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return page
+
+
+def parse_ids(ids: str) -> List[str]:
+    """Convierte ``?ids=a,b,c`` en lista, validando el máximo por petición."""
+    parsed = [i.strip() for i in ids.split(",") if i.strip()]
+    if len(parsed) > MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se admiten como máximo {MAX_PAGE_SIZE} ids por petición",
+        )
+    return parsed
+
+
+async def fetch_many(
+    get_many: Callable[[List[str]], Awaitable[Tuple[List[dict], List[str]]]],
+    response: Response,
+    ids: str,
+) -> List[dict]:
+    """Lectura por lotes; los ids inexistentes se informan en X-Missing-Ids."""
+    items, missing = await get_many(parse_ids(ids))
+    if missing:
+        response.headers[MISSING_IDS_HEADER] = ",".join(missing)
+    return items
@@ -1,9 +1,11 @@
 from datetime import datetime
-from typing import List
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 
-from crud.firebase_crud import FirebaseAppointmentRequestCRUD
+from api.v1.deps import PaginationParams, build_filters, fetch_page
+from crud.async_firebase_crud import AsyncFirebaseAppointmentRequestCRUD
+from crud.firebase_crud import WriteConflictError
 from schemas.appointment_request import (
     AppointmentRequestCreate,
     AppointmentRequestInDB,
@@ -12,44 +14,63 @@ from schemas.appointment_request import (
 
 router = APIRouter()
 
-request_crud = FirebaseAppointmentRequestCRUD()
+request_crud = AsyncFirebaseAppointmentRequestCRUD()
 
 
 @router.get("/", response_model=List[AppointmentRequestInDB])
-def get_all_requests():
-    return request_crud.get_all()
+async def get_all_requests(
+    response: Response,
+    pagination: PaginationParams = Depends(),
+    estado: Optional[Literal['pendiente', 'gestionada', 'rechazada']] = None,
+    creada_desde: Optional[str] = None,
+    creada_hasta: Optional[str] = None,
+    order_by: Optional[Literal["creadaEn"]] = None,
+):
+    filters = build_filters(
+        ("estado", "==", estado),
+        ("creadaEn", ">=", creada_desde),
+        ("creadaEn", "<=", creada_hasta),
+    )
+    page = await fetch_page(request_crud.get_page, response, pagination, filters=filters, order_by=order_by)
+    return page.items
 
 
 @router.get("/{request_id}", response_model=AppointmentRequestInDB)
-def get_request(request_id: str):
-    req = request_crud.get_by_id(request_id)
+async def get_request(request_id: str):
+    req = await request_crud.get_by_id(request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Solicitud no encontrada")
     return req
 
 
 @router.post("/", response_model=AppointmentRequestInDB, status_code=status.HTTP_201_CREATED)
-def create_request(request: AppointmentRequestCreate):
+async def create_request(request: AppointmentRequestCreate):
     data = request.model_dump()
     # Si no viene creadaEn, registramos ahora
     if not data.get("creadaEn"):
         data["creadaEn"] = datetime.utcnow().isoformat()
-    created = request_crud.create(data)
+    created = await request_crud.create(data)
     return created
 
 
 @router.put("/{request_id}", response_model=AppointmentRequestInDB)
-def update_request(request_id: str, request_update: AppointmentRequestUpdate):
+async def update_request(request_id: str, request_update: AppointmentRequestUpdate):
     update_data = request_update.model_dump(exclude_unset=True)
-    updated = request_crud.update(request_id, update_data)
+    try:
+        updated = await request_crud.update(request_id, update_data)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Solicitud no encontrada")
     return updated
 
 
 @router.delete("/{request_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_request(request_id: str):
-    deleted = request_crud.delete(request_id)
+async def delete_request(request_id: str):
+    try:
+        deleted = await request_crud.delete(request_id)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not deleted:
         raise HTTPException(status_code=404, detail="Solicitud no encontrada")
     return None
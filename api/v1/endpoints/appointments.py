@@ -1,64 +1,47 @@
-from fastapi import APIRouter, HTTPException, status, BackgroundTasks
-from typing import List
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, status, Depends, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Literal, Optional
 from datetime import datetime, time as dt_time
-import smtplib
-from email.mime.text import MIMEText
 
 from schemas.appointment import AppointmentInDB, AppointmentCreate, AppointmentUpdate
-from crud.firebase_crud import FirebaseAppointmentCRUD, FirebasePatientCRUD
-from core.config import settings
+from crud.async_firebase_crud import AsyncFirebaseAppointmentCRUD, AsyncFirebasePatientCRUD
+from crud.firebase_crud import SlotUnavailableError, WriteConflictError
+from core.jobs import send_email
+from core.mailer import EmailTemplate
+from core.reminders import hora_am_pm
+from api.v1.deps import PaginationParams, build_filters, fetch_page
+from core.streaming import ExportFormat, stream_documents
 
-router = APIRouter()
-
-appointment_crud = FirebaseAppointmentCRUD()
-patient_crud = FirebasePatientCRUD()
-
-
-def send_appointment_email(to_email: str, appointment: dict) -> None:
-    """Envía un correo simple de confirmación de cita.
-
-    Usa configuración SMTP definida en variables de entorno. Si falta
-    configuración o se produce un error, se ignora silenciosamente.
-    """
+logger = logging.getLogger(__name__)
 
-    if not (settings.SMTP_HOST and settings.SMTP_USER and settings.SMTP_PASSWORD and settings.SMTP_FROM):
-        return
-
-    subject = f"Confirmación de cita para {appointment.get('pacienteNombre', '')}"
-    fecha = appointment.get("fecha", "")
-    hora = appointment.get("hora", "")
-    motivo = appointment.get("motivo", "")
-    propietario = appointment.get("propietario", "")
+router = APIRouter()
 
-    # Formatear hora a formato AM/PM si es posible (por ejemplo 10:00 AM)
-    hora_am_pm = hora
-    try:
-        if hora:
-            from datetime import datetime as _dt
+appointment_crud = AsyncFirebaseAppointmentCRUD()
+patient_crud = AsyncFirebasePatientCRUD()
 
-            parsed_time = _dt.strptime(hora, "%H:%M")
-            hora_am_pm = parsed_time.strftime("%I:%M %p") 
-    except Exception:
-        # Si falla el parseo, se deja la hora original
-        hora_am_pm = hora
 
-    body = f"""
+# Se compila una vez al importar; cada correo solo completa los campos
+APPOINTMENT_EMAIL = EmailTemplate(
+    subject="Confirmación de cita para {{pacienteNombre}}",
+    body="""
     <html>
       <head>
         <meta charset="UTF-8" />
         <style>
-          body {{ font-family: system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; background-color: #f5f7fb; margin: 0; padding: 0; }}
-          .container {{ max-width: 560px; margin: 24px auto; background: #ffffff; border-radius: 12px; box-shadow: 0 10px 30px rgba(15, 23, 42, 0.08); overflow: hidden; }}
-          .header {{ background: linear-gradient(135deg, #2563eb, #1d4ed8); color: #ffffff; padding: 20px 24px; }}
-          .header h1 {{ margin: 0; font-size: 20px; font-weight: 700; }}
-          .content {{ padding: 24px; color: #0f172a; font-size: 14px; line-height: 1.6; }}
-          .content p {{ margin: 0 0 12px 0; }}
-          .card {{ background-color: #f9fafb; border-radius: 10px; padding: 16px 18px; margin: 12px 0 20px 0; border: 1px solid #e5e7eb; }}
-          .card-title {{ font-weight: 600; margin-bottom: 8px; color: #111827; }}
-          .row {{ display: flex; justify-content: space-between; margin-bottom: 6px; }}
-          .label {{ font-weight: 500; color: #6b7280; margin-right: 8px; }}
-          .value {{ font-weight: 600; color: #111827; }}
-          .footer {{ padding: 18px 24px 22px 24px; border-top: 1px solid #e5e7eb; font-size: 12px; color: #6b7280; background-color: #f9fafb; }}
+          body { font-family: system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif; background-color: #f5f7fb; margin: 0; padding: 0; }
+          .container { max-width: 560px; margin: 24px auto; background: #ffffff; border-radius: 12px; box-shadow: 0 10px 30px rgba(15, 23, 42, 0.08); overflow: hidden; }
+          .header { background: linear-gradient(135deg, #2563eb, #1d4ed8); color: #ffffff; padding: 20px 24px; }
+          .header h1 { margin: 0; font-size: 20px; font-weight: 700; }
+          .content { padding: 24px; color: #0f172a; font-size: 14px; line-height: 1.6; }
+          .content p { margin: 0 0 12px 0; }
+          .card { background-color: #f9fafb; border-radius: 10px; padding: 16px 18px; margin: 12px 0 20px 0; border: 1px solid #e5e7eb; }
+          .card-title { font-weight: 600; margin-bottom: 8px; color: #111827; }
+          .row { display: flex; justify-content: space-between; margin-bottom: 6px; }
+          .label { font-weight: 500; color: #6b7280; margin-right: 8px; }
+          .value { font-weight: 600; color: #111827; }
+          .footer { padding: 18px 24px 22px 24px; border-top: 1px solid #e5e7eb; font-size: 12px; color: #6b7280; background-color: #f9fafb; }
         </style>
       </head>
       <body>
@@ -67,23 +50,23 @@ def send_appointment_email(to_email: str, appointment: dict) -> None:
             <h1>Confirmación de cita</h1>
           </div>
           <div class="content">
-            <p>Hola <strong>{propietario}</strong>,</p>
+            <p>Hola <strong>{{propietario}}</strong>,</p>
             <p>
-              Hemos registrado una cita para tu mascota <strong>{appointment.get('pacienteNombre', '')}</strong> con la siguiente información:
+              Hemos registrado una cita para tu mascota <strong>{{pacienteNombre}}</strong> con la siguiente información:
             </p>
             <div class="card">
               <div class="card-title">Detalles de la cita</div>
               <div class="row">
                 <span class="label">Fecha</span>
-                <span class="value">{fecha}</span>
+                <span class="value">{{fecha}}</span>
               </div>
               <div class="row">
                 <span class="label">Hora</span>
-                <span class="value">{hora_am_pm}</span>
+                <span class="value">{{hora}}</span>
               </div>
               <div class="row">
                 <span class="label">Motivo</span>
-                <span class="value">{motivo}</span>
+                <span class="value">{{motivo}}</span>
               </div>
             </div>
             <p>
@@ -103,39 +86,66 @@ def send_appointment_email(to_email: str, appointment: dict) -> None:
         </div>
       </body>
     </html>
-    """
+    """,
+)
 
-    msg = MIMEText(body, "html", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = settings.SMTP_FROM
-    msg["To"] = to_email
 
-    try:
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            if settings.SMTP_TLS:
-                server.starttls()
-            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.sendmail(settings.SMTP_FROM, [to_email], msg.as_string())
-    except Exception:
-        # No interrumpir el flujo de la API por errores de envío de correo
-        return
+def send_appointment_email(to_email: str, appointment: dict) -> bool:
+    """Encola el correo de confirmación de cita en el outbox.
+
+    Lo envía el worker de trabajos (``core.jobs``), con reintentos. Si
+    falta configuración SMTP no se envía nada y se devuelve False.
+    """
+    subject, body = APPOINTMENT_EMAIL.render(
+        pacienteNombre=appointment.get("pacienteNombre", ""),
+        propietario=appointment.get("propietario", ""),
+        fecha=appointment.get("fecha", ""),
+        hora=hora_am_pm(appointment.get("hora", "")),
+        motivo=appointment.get("motivo", ""),
+    )
+    return send_email(to_email, subject, body)
 
 
 @router.get("/", response_model=List[AppointmentInDB])
-def get_all_appointments():
-    return appointment_crud.get_all()
+async def get_all_appointments(
+    response: Response,
+    pagination: PaginationParams = Depends(),
+    estado: Optional[Literal['pendiente', 'completada', 'cancelada', 'en-proceso']] = None,
+    pacienteId: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    order_by: Optional[Literal["fecha", "hora"]] = None,
+):
+    filters = build_filters(
+        ("estado", "==", estado),
+        ("pacienteId", "==", pacienteId),
+        ("fecha", ">=", fecha_desde),
+        ("fecha", "<=", fecha_hasta),
+    )
+    page = await fetch_page(appointment_crud.get_page, response, pagination, filters=filters, order_by=order_by)
+    return page.items
+
+
+@router.get("/export")
+async def export_appointments(
+    format: ExportFormat = "ndjson",
+    estado: Optional[Literal['pendiente', 'completada', 'cancelada', 'en-proceso']] = None,
+):
+    """Exporta las citas en streaming (NDJSON o array JSON)."""
+    docs = appointment_crud.iter_all(filters=build_filters(("estado", "==", estado)))
+    return stream_documents(docs, AppointmentInDB, format, filename="appointments")
 
 
 @router.get("/{appointment_id}", response_model=AppointmentInDB)
-def get_appointment(appointment_id: str):
-    appointment = appointment_crud.get_by_id(appointment_id)
+async def get_appointment(appointment_id: str):
+    appointment = await appointment_crud.get_by_id(appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     return appointment
 
 
 @router.post("/", response_model=AppointmentInDB, status_code=status.HTTP_201_CREATED)
-def create_appointment(appointment: AppointmentCreate, background_tasks: BackgroundTasks):
+async def create_appointment(appointment: AppointmentCreate):
     """Crear una cita aplicando reglas de negocio básicas."""
 
     # Validar formato de fecha y hora y evitar citas en el pasado
@@ -164,47 +174,61 @@ def create_appointment(appointment: AppointmentCreate, background_tasks: Backgro
             detail="La hora de la cita debe estar entre 08:00 y 20:00",
         )
 
-    # Evitar doble reserva en misma fecha y hora (para cualquier paciente que no esté cancelada)
-    existing_appointments = appointment_crud.get_all()
-    for existing in existing_appointments:
-        if (
-            existing.get("fecha") == appointment.fecha
-            and existing.get("hora") == appointment.hora
-            and existing.get("estado") != "cancelada"
-        ):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ya existe una cita programada en esa fecha y hora",
-            )
-
-    new_appointment = appointment_crud.create(appointment.model_dump())
-
-    # Intentar enviar correo de confirmación al dueño
-    try:
-        patient = patient_crud.get_by_id(appointment.pacienteId)
-        if patient:
-            to_email = patient.get("tutor_email") or patient.get("email")
-            if to_email:
-                background_tasks.add_task(send_appointment_email, to_email, new_appointment)
-    except Exception:
-        # No bloquear la creación de la cita si falla la obtención del paciente o el envío de correo
-        pass
+    # Evitar doble reserva en misma fecha y hora: el CRUD reserva el horario
+    # en la misma escritura que la cita y falla si ya está ocupado. La lectura
+    # del paciente (para el correo) es independiente y se lanza a la vez.
+    new_appointment, patient = await asyncio.gather(
+        appointment_crud.create(appointment.model_dump()),
+        patient_crud.get_by_id(appointment.pacienteId),
+        return_exceptions=True,
+    )
+    if isinstance(new_appointment, SlotUnavailableError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(new_appointment),
+        )
+    if isinstance(new_appointment, BaseException):
+        raise new_appointment
+
+    # Intentar enviar correo de confirmación al dueño. Si falló la obtención
+    # del paciente o el encolado del correo no se bloquea la creación de la
+    # cita: ya está guardada y un error aquí haría que el cliente reintente
+    # contra su propio horario.
+    if isinstance(patient, dict):
+        to_email = patient.get("tutor_email") or patient.get("email")
+        if to_email:
+            try:
+                # Encolar en el outbox es una escritura de sqlite: fuera del event loop
+                await run_in_threadpool(send_appointment_email, to_email, new_appointment)
+            except Exception:
+                logger.exception("No se pudo encolar el correo de la cita %s", new_appointment.get("id"))
 
     return new_appointment
 
 
 @router.put("/{appointment_id}", response_model=AppointmentInDB)
-def update_appointment(appointment_id: str, appointment_update: AppointmentUpdate):
+async def update_appointment(appointment_id: str, appointment_update: AppointmentUpdate):
     update_data = appointment_update.model_dump(exclude_unset=True)
-    updated = appointment_crud.update(appointment_id, update_data)
+    try:
+        updated = await appointment_crud.update(appointment_id, update_data)
+    except SlotUnavailableError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc),
+        )
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     return updated
 
 
 @router.delete("/{appointment_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_appointment(appointment_id: str):
-    deleted = appointment_crud.delete(appointment_id)
+async def delete_appointment(appointment_id: str):
+    try:
+        deleted = await appointment_crud.delete(appointment_id)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not deleted:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
     return None
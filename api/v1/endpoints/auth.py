@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
-from crud.firebase_crud import FirebaseUserCRUD
+from crud.async_firebase_crud import AsyncFirebaseUserCRUD
+from core.security import create_access_token
 import hashlib
 
 
 router = APIRouter()
 
-user_crud = FirebaseUserCRUD()
+user_crud = AsyncFirebaseUserCRUD()
 
 
 class LoginRequest(BaseModel):
@@ -24,8 +25,8 @@ class LoginResponse(BaseModel):
 
 
 @router.post("/login", response_model=LoginResponse)
-def login(request: LoginRequest):
-    user = user_crud.get_by_email(request.email)
+async def login(request: LoginRequest):
+    user = await user_crud.get_by_email(request.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -41,8 +42,8 @@ def login(request: LoginRequest):
             detail="Credenciales inválidas",
         )
 
-    # Token ficticio; aquí luego integrarás Firebase Auth / JWT real
-    token = f"fake-token-for-{user['id']}"
+    # Token firmado con el rol embebido; se valida localmente en cada petición
+    token = create_access_token(user)
     return LoginResponse(
         access_token=token,
         user_id=user["id"],
@@ -1,25 +1,26 @@
 import uuid
 from fastapi import APIRouter, HTTPException, status
-from typing import List
+from typing import List, Optional
 from schemas.cart import Cart, CartItem, CheckoutRequest, CheckoutResponse, PaymentDetails
-from crud.firebase_crud import FirebaseCartCRUD, FirebaseProductCRUD, FirebaseOrderCRUD
+from crud.async_firebase_crud import AsyncFirebaseCartCRUD, AsyncFirebaseProductCRUD, AsyncFirebaseOrderCRUD
+from crud.firebase_crud import EmptyCartError, ProductUnavailableError
 
 router = APIRouter()
 
-cart_crud = FirebaseCartCRUD()
-product_crud = FirebaseProductCRUD()
-order_crud = FirebaseOrderCRUD()
+cart_crud = AsyncFirebaseCartCRUD()
+product_crud = AsyncFirebaseProductCRUD()
+order_crud = AsyncFirebaseOrderCRUD()
 
 
 @router.get("/{user_id}", response_model=Cart)
-def get_cart(user_id: str):
-    cart_data = cart_crud.get_cart(user_id)
+async def get_cart(user_id: str):
+    cart_data = await cart_crud.get_cart(user_id)
     return Cart(user_id=cart_data["user_id"], items=cart_data.get("items", []))
 
 
 @router.post("/{user_id}/items", response_model=Cart, status_code=status.HTTP_201_CREATED)
-def add_item_to_cart(user_id: str, item: CartItem):
-    product = product_crud.get_by_id(item.product_id)
+async def add_item_to_cart(user_id: str, item: CartItem):
+    product = await product_crud.get_by_id(item.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     stored_item = {
@@ -29,34 +30,24 @@ def add_item_to_cart(user_id: str, item: CartItem):
         "quantity": item.quantity,
         "image_url": item.image_url or product.get("image_url"),
     }
-    cart_data = cart_crud.add_or_update_item(user_id, stored_item)
+    cart_data = await cart_crud.add_or_update_item(user_id, stored_item)
     return Cart(user_id=cart_data["user_id"], items=cart_data.get("items", []))
 
 
 @router.delete("/{user_id}/items/{product_id}", response_model=Cart)
-def remove_item_from_cart(user_id: str, product_id: str):
-    cart_data = cart_crud.remove_item(user_id, product_id)
+async def remove_item_from_cart(user_id: str, product_id: str):
+    cart_data = await cart_crud.remove_item(user_id, product_id)
     return Cart(user_id=cart_data["user_id"], items=cart_data.get("items", []))
 
 
 @router.delete("/{user_id}", response_model=Cart)
-def clear_cart(user_id: str):
-    cart_data = cart_crud.clear_cart(user_id)
+async def clear_cart(user_id: str):
+    cart_data = await cart_crud.clear_cart(user_id)
     return Cart(user_id=cart_data["user_id"], items=cart_data.get("items", []))
 
 
 @router.post("/{user_id}/checkout", response_model=CheckoutResponse)
-def checkout_cart(user_id: str, checkout: CheckoutRequest):
-    cart_data = cart_crud.get_cart(user_id)
-    items = cart_data.get("items", [])
-    if not items:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El carrito está vacío",
-        )
-
-    total = sum(float(item.get("price", 0)) * int(item.get("quantity", 1)) for item in items)
-
+async def checkout_cart(user_id: str, checkout: CheckoutRequest):
     payment_details: Optional[dict] = None
 
     if checkout.payment_method == "tarjeta":
@@ -93,25 +84,32 @@ def checkout_cart(user_id: str, checkout: CheckoutRequest):
             "method": checkout.payment_method,
         }
 
-    order_data = {
-        "user_id": user_id,
-        "items": items,
-        "total": total,
+    order_fields = {
         "payment_method": checkout.payment_method,
         "status": "creada",
         "payment_details": payment_details,
     }
 
-    created_order = order_crud.create(order_data)
-
-    cart_crud.clear_cart(user_id)
+    # Precios, stock, orden y vaciado del carrito en una sola transacción
+    try:
+        created_order = await order_crud.create_from_cart(user_id, order_fields)
+    except EmptyCartError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc),
+        )
+    except ProductUnavailableError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(exc), "product_ids": exc.product_ids},
+        )
 
     return CheckoutResponse(
         order_id=created_order["id"],
         user_id=user_id,
-        items=[CartItem(**item) for item in items],
-        total=total,
+        items=[CartItem(**item) for item in created_order["items"]],
+        total=created_order["total"],
         payment_method=checkout.payment_method,
-        status=order_data["status"],
+        status=created_order["status"],
         payment_details=PaymentDetails(**payment_details) if payment_details else None,
     )
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from typing import List, Optional
+from schemas.order import Order, OrderSummary
+from crud.async_firebase_crud import AsyncFirebaseOrderCRUD
+from crud.pagination import MAX_PAGE_SIZE, InvalidCursorError
+from api.v1.deps import NEXT_CURSOR_HEADER
+from core.security import get_current_user
+from models.user import User
+
+
+router = APIRouter()
+
+order_crud = AsyncFirebaseOrderCRUD()
+
+DEFAULT_ORDERS_PAGE_SIZE = 20
+# Valores que admite un filtro ``in`` de Firestore
+MAX_STATUS_FILTERS = 30
+
+
+async def order_owner(user_id: str, current_user: User = Depends(get_current_user)) -> User:
+    """Solo el dueño de las órdenes o un admin puede verlas."""
+
+    if current_user.id != user_id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para ver estas órdenes",
+        )
+    return current_user
+
+
+@router.get("/{user_id}", response_model=List[OrderSummary])
+async def get_user_orders(
+    user_id: str,
+    response: Response,
+    current_user: User = Depends(order_owner),
+    limit: int = Query(DEFAULT_ORDERS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Token opaco devuelto en X-Next-Cursor"),
+    status_filter: Optional[str] = Query(None, alias="status", description="Uno o varios estados separados por coma"),
+):
+    """Historial de órdenes del usuario, de la más reciente a la más antigua.
+
+    Devuelve resúmenes (total, cantidad de items, imagen del primero); la
+    orden completa está en ``GET /orders/{user_id}/{order_id}``. El cursor
+    de la página siguiente va en la cabecera X-Next-Cursor.
+    """
+    statuses = list(dict.fromkeys(s.strip() for s in (status_filter or "").split(",") if s.strip()))
+    if len(statuses) > MAX_STATUS_FILTERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se admiten como máximo {MAX_STATUS_FILTERS} estados por petición",
+        )
+    try:
+        page = await order_crud.get_user_page(user_id, limit=limit, cursor=cursor, statuses=statuses)
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return page.items
+
+
+@router.get("/{user_id}/{order_id}", response_model=Order)
+async def get_user_order(user_id: str, order_id: str, current_user: User = Depends(order_owner)):
+    order = await order_crud.get_by_id(order_id)
+    if not order or order.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="Orden no encontrada")
+    return order
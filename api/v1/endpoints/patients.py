@@ -1,45 +1,112 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-from schemas.patient import PatientInDB, PatientCreate, PatientUpdate
-from crud.firebase_crud import FirebasePatientCRUD
+from fastapi import APIRouter, HTTPException, status, Depends, File, Form, Query, Response, UploadFile
+from typing import List, Literal, Optional
+from schemas.patient import PatientInDB, PatientCreate, PatientSearchResult, PatientUpdate
+from schemas.bulk_import import ImportReport
+from crud.firebase_crud import FirebasePatientCRUD, WriteConflictError
+from crud.async_firebase_crud import AsyncFirebasePatientCRUD
+from crud.bulk_import import ImportFormat, detect_format, import_stream
+from crud.search import patient_index
+from api.v1.deps import PaginationParams, build_filters, fetch_many, fetch_page
+from core.serialization import ListSerializer
+from core.streaming import ExportFormat, stream_documents
 
 
 router = APIRouter()
 
-patient_crud = FirebasePatientCRUD()
+patient_list = ListSerializer(PatientInDB)
+
+patient_crud = AsyncFirebasePatientCRUD()
+# La importación masiva usa el cliente síncrono (WriteBatch + hilos)
+import_crud = FirebasePatientCRUD()
 
 
 @router.get("/", response_model=List[PatientInDB])
-def get_all_patients():
-    return patient_crud.get_all()
+async def get_all_patients(
+    response: Response,
+    pagination: PaginationParams = Depends(),
+    email: Optional[str] = None,
+    tutor_numero_documento: Optional[str] = None,
+    mascota_especie: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    order_by: Optional[Literal["nombre", "propietario", "fecha"]] = None,
+    ids: Optional[str] = Query(None, description="Ids separados por coma; se devuelven en ese orden"),
+):
+    if ids is not None:
+        items = await fetch_many(patient_crud.get_many, response, ids)
+        return patient_list.render(items, response.headers)
+
+    filters = build_filters(
+        ("email", "==", email),
+        ("tutor_numero_documento", "==", tutor_numero_documento),
+        ("mascota_especie", "==", mascota_especie),
+        ("fecha", ">=", fecha_desde),
+        ("fecha", "<=", fecha_hasta),
+    )
+    page = await fetch_page(patient_crud.get_page, response, pagination, filters=filters, order_by=order_by)
+    return patient_list.render(page.items, response.headers)
+
+
+@router.get("/search", response_model=List[PatientSearchResult])
+def search_patients(
+    q: str = Query(..., min_length=1, max_length=100, description="Mascota, tutor, documento, teléfono o correo"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Búsqueda por prefijo y aproximada sobre el índice en memoria (ver crud.search).
+
+    Es síncrona porque la primera búsqueda del proceso carga el índice.
+    """
+    return patient_index.search(q, limit)
+
+
+@router.get("/export")
+async def export_patients(format: ExportFormat = "ndjson"):
+    """Exporta todos los pacientes en streaming (NDJSON o array JSON)."""
+    return stream_documents(patient_crud.iter_all(), PatientInDB, format, filename="patients")
 
 
 @router.get("/{patient_id}", response_model=PatientInDB)
-def get_patient(patient_id: str):
-    patient = patient_crud.get_by_id(patient_id)
+async def get_patient(patient_id: str):
+    patient = await patient_crud.get_by_id(patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     return patient
 
 
 @router.post("/", response_model=PatientInDB, status_code=status.HTTP_201_CREATED)
-def create_patient(patient: PatientCreate):
-    new_patient = patient_crud.create(patient.model_dump())
+async def create_patient(patient: PatientCreate):
+    new_patient = await patient_crud.create(patient.model_dump())
     return new_patient
 
 
+@router.post("/import", response_model=ImportReport)
+def import_patients(file: UploadFile = File(...), format: Optional[ImportFormat] = Form(None)):
+    """Importa pacientes desde CSV o NDJSON con escrituras por lotes."""
+    try:
+        fmt = format or detect_format(file.filename)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return import_stream(import_crud, PatientCreate, file.file, fmt)
+
+
 @router.put("/{patient_id}", response_model=PatientInDB)
-def update_patient(patient_id: str, patient_update: PatientUpdate):
+async def update_patient(patient_id: str, patient_update: PatientUpdate):
     update_data = patient_update.model_dump(exclude_unset=True)
-    updated = patient_crud.update(patient_id, update_data)
+    try:
+        updated = await patient_crud.update(patient_id, update_data)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     return updated
 
 
 @router.delete("/{patient_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_patient(patient_id: str):
-    deleted = patient_crud.delete(patient_id)
+async def delete_patient(patient_id: str):
+    try:
+        deleted = await patient_crud.delete(patient_id)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not deleted:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     return None
@@ -1,49 +1,221 @@
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form, Depends
-from typing import List, Optional
-from schemas.product import ProductInDB, ProductCreate, ProductUpdate
-from crud.firebase_crud import FirebaseProductCRUD
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form, Depends, Query, Request, Response
+from typing import Iterable, List, Literal, Optional
+from fastapi.concurrency import run_in_threadpool
+from schemas.product import ProductInDB, ProductCreate, ProductSearchResult, ProductUpdate, StockShardsUpdate
+from schemas.bulk_import import ImportReport
+from crud.firebase_crud import FirebaseProductCRUD, WriteConflictError
+from crud.async_firebase_crud import AsyncFirebaseProductCRUD
+from crud.bulk_import import ImportFormat, detect_format, import_stream
+from crud.catalog_index import CatalogQuery, catalog_index
+from core.compression import EncodedBody
+from core.images import (
+    ImageTooLargeError,
+    InvalidImageError,
+    ReceivedImage,
+    delete_images,
+    receive_image,
+)
+from core.jobs import schedule_image_variants
 from core.security import get_current_admin
+from core.serialization import ListSerializer
+from api.v1.deps import NEXT_CURSOR_HEADER, PaginationParams, build_filters, fetch_many, fetch_page
+from models.product import Product
 
 from pathlib import Path
-import os
-import shutil
 
 router = APIRouter()
 
-product_crud = FirebaseProductCRUD()
+product_list = ListSerializer(ProductInDB)
+
+product_crud = AsyncFirebaseProductCRUD()
+# La importación masiva usa el cliente síncrono (WriteBatch + hilos)
+import_crud = FirebaseProductCRUD()
 UPLOAD_DIR = Path("static") / "products"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
+IMAGE_URL_PREFIX = "/static/products/"
+
+
+def _image_url(path: Path) -> str:
+    return f"{IMAGE_URL_PREFIX}{path.name}"
+
+
+def _image_urls(product: Optional[dict]) -> List[str]:
+    """URLs locales de la imagen del producto y sus versiones."""
+    if not product:
+        return []
+    urls = [product.get("image_url")] + list((product.get("image_variants") or {}).values())
+    return [url for url in urls if url and url.startswith(IMAGE_URL_PREFIX)]
+
+
+def _image_paths(urls: Iterable[str]) -> List[Path]:
+    return [UPLOAD_DIR / Path(url[len(IMAGE_URL_PREFIX):]).name for url in urls]
+
+
+async def _receive(file: UploadFile) -> ReceivedImage:
+    try:
+        return await receive_image(file, UPLOAD_DIR)
+    except ImageTooLargeError as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except InvalidImageError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+async def _attach_image(
+    product_id: str, image: ReceivedImage, previous: Optional[dict] = None
+) -> Optional[dict]:
+    """Publica la imagen del producto y encola sus versiones reducidas.
+
+    El nombre del archivo lleva el hash del contenido, así que la URL
+    cambia con cada imagen nueva. Los archivos de la imagen anterior se
+    borran una vez que el producto apunta a la nueva; sus versiones se
+    quitan del producto hasta que estén las nuevas y mientras tanto el
+    cliente puede usar ``image_url``.
+    """
+    path = image.move_to(UPLOAD_DIR, product_id)
+    image_url = _image_url(path)
+    if previous and previous.get("image_url") == image_url and previous.get("image_variants"):
+        # Se volvió a subir la misma imagen: no hay nada que regenerar
+        return previous
+    try:
+        updated = await product_crud.update(product_id, {"image_url": image_url, "image_variants": None})
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+    if updated is None:
+        return None
+    stale = [url for url in _image_urls(previous) if url != image_url]
+    await run_in_threadpool(delete_images, _image_paths(stale))
+    await run_in_threadpool(schedule_image_variants, product_id, path, image_url)
+    return updated
+
+
 @router.get("/", response_model=List[ProductInDB])
-def get_all_products():
-    """Obtiene todos los productos usando los modelos de dominio internamente.
+async def get_all_products(
+    request: Request,
+    response: Response,
+    pagination: PaginationParams = Depends(),
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    order_by: Optional[Literal["name", "price", "category"]] = None,
+    ids: Optional[str] = Query(None, description="Ids separados por coma; se devuelven en ese orden"),
+):
+    """Obtiene los productos paginados desde la caché del catálogo.
+
+    Los items ya vienen normalizados por el modelo de dominio Product y la
+    respuesta sigue siendo una lista de ProductInDB; el cursor de la página
+    siguiente se envía en la cabecera X-Next-Cursor. Con ``ids`` se leen
+    solo esos productos en una llamada y los inexistentes van en X-Missing-Ids.
+    Con ``JSON_FAST_PATH`` activo la lista se codifica sin volver a pasar
+    por el response_model.
+
+    Las páginas del catálogo se guardan ya codificadas (y comprimidas a
+    medida que los clientes lo piden) en la caché del catálogo.
+    """
+    if ids is not None:
+        items = await fetch_many(product_crud.get_many, response, ids)
+        items = [Product.from_dict(data).to_dict(include_id=True) for data in items]
+        return product_list.render(items, response.headers)
+
+    filters = build_filters(
+        ("category", "==", category),
+        ("price", ">=", min_price),
+        ("price", "<=", max_price),
+    )
+    key = (
+        "body",
+        pagination.limit,
+        pagination.cursor,
+        pagination.descending,
+        pagination.fetch_all,
+        order_by,
+        tuple(filters),
+    )
+
+    async def render() -> EncodedBody:
+        page = await fetch_page(
+            product_crud.get_catalog_page,
+            response,
+            pagination,
+            filters=filters,
+            order_by=order_by,
+        )
+        headers = {NEXT_CURSOR_HEADER: page.next_cursor} if page.next_cursor else {}
+        return EncodedBody(product_list.dump(page.items), headers)
+
+    body = await product_crud.catalog_cache.aget_or_load(key, render)
+    return body.response(request)
+
+
+@router.get("/search", response_model=ProductSearchResult)
+def search_products(
+    q: Optional[str] = Query(None, max_length=100),
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = False,
+    sort: Literal["name", "price_asc", "price_desc"] = "name",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Catálogo filtrado con facets, resuelto sobre el índice en memoria.
 
-    La respuesta sigue siendo una lista de ProductInDB para el cliente.
+    Devuelve la página pedida, el total de resultados y cuántos productos
+    hay por categoría, por tramo de precio y con stock (ver
+    crud.catalog_index). Es síncrona porque la primera consulta del
+    proceso carga el índice.
     """
-    products = product_crud.get_all_models()
-    return [p.to_dict(include_id=True) for p in products]
+    result = catalog_index.query(CatalogQuery(
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock,
+        q=q,
+        sort=sort,
+        offset=offset,
+        limit=limit,
+    ))
+    return {"items": result.items, "total": result.total, "facets": result.facets}
 
 
 @router.get("/{product_id}", response_model=ProductInDB)
-def get_product(product_id: str):
+async def get_product(product_id: str):
     """Obtiene un producto por id usando el modelo de dominio internamente.
 
     Si no se encuentra, devuelve 404 como antes.
     """
-    product_model = product_crud.get_model_by_id(product_id)
+    product_model = await product_crud.get_model_by_id(product_id)
     if not product_model:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     return product_model.to_dict(include_id=True)
 
 
 @router.post("/", response_model=ProductInDB, status_code=status.HTTP_201_CREATED)
-def create_product(product: ProductCreate, current_admin = Depends(get_current_admin)):
+async def create_product(product: ProductCreate, current_admin = Depends(get_current_admin)):
 
-    new_product = product_crud.create(product.model_dump())
+    new_product = await product_crud.create(product.model_dump())
     return new_product
 
 
+@router.post("/import", response_model=ImportReport)
+def import_products(
+    file: UploadFile = File(...),
+    format: Optional[ImportFormat] = Form(None),
+    current_admin = Depends(get_current_admin),
+):
+    """Importa productos desde CSV o NDJSON con escrituras por lotes.
+
+    Devuelve un reporte con los errores por fila; las filas válidas se
+    importan aunque otras fallen.
+    """
+    try:
+        fmt = format or detect_format(file.filename)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return import_stream(import_crud, ProductCreate, file.file, fmt)
+
+
 @router.post("/with-image", response_model=ProductInDB, status_code=status.HTTP_201_CREATED)
 async def create_product_with_image(
     name: str = Form(...),
@@ -61,70 +233,81 @@ async def create_product_with_image(
         "category": category,
     }
 
-    new_product = product_crud.create(data)
-
-    if file is None:
-        return new_product
-
-    # Validar extensión simple
-    _, ext = os.path.splitext(file.filename or "")
-    ext = ext.lower() or ".jpg"
-    if ext not in {".jpg", ".jpeg", ".png", ".gif", ".webp"}:
-        raise HTTPException(status_code=400, detail="Formato de imagen no soportado")
+    # La imagen se valida antes de crear el producto
+    image = await _receive(file) if file is not None else None
+    try:
+        new_product = await product_crud.create(data)
+        if image is None:
+            return new_product
+        updated = await _attach_image(new_product["id"], image)
+    finally:
+        if image is not None:
+            image.discard()
+    if not updated:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    return updated
 
-    filename = f"{new_product['id']}{ext}"
-    dest_path = UPLOAD_DIR / filename
 
-    with dest_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+@router.put("/{product_id}", response_model=ProductInDB)
+async def update_product(product_id: str, product_update: ProductUpdate, current_admin = Depends(get_current_admin)):
 
-    image_url = f"/static/products/{filename}"
-    updated = product_crud.update(new_product["id"], {"image_url": image_url})
+    update_data = product_update.model_dump(exclude_unset=True)
+    try:
+        updated = await product_crud.update(product_id, update_data)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     return updated
 
 
-@router.put("/{product_id}", response_model=ProductInDB)
-def update_product(product_id: str, product_update: ProductUpdate, current_admin = Depends(get_current_admin)):
+@router.put("/{product_id}/stock-shards", response_model=ProductInDB)
+async def set_product_stock_shards(
+    product_id: str,
+    body: StockShardsUpdate,
+    current_admin = Depends(get_current_admin),
+):
+    """Reparte el stock de un producto muy vendido en varios contadores.
 
-    update_data = product_update.model_dump(exclude_unset=True)
-    updated = product_crud.update(product_id, update_data)
+    Cada checkout descuenta de un shard al azar en vez de escribir siempre
+    el mismo documento; ``shards=0`` vuelve al stock en el producto. Sin
+    ``stock`` se conserva el total actual.
+    """
+    try:
+        updated = await product_crud.set_stock_shards(product_id, body.shards, stock=body.stock)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     return updated
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_product(product_id: str, current_admin = Depends(get_current_admin)):
+async def delete_product(product_id: str, current_admin = Depends(get_current_admin)):
 
-    deleted = product_crud.delete(product_id)
+    product = await product_crud.get_by_id(product_id)
+    try:
+        deleted = await product_crud.delete(product_id)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not deleted:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
+    await run_in_threadpool(delete_images, _image_paths(_image_urls(product)))
     return None
 
 
 @router.post("/{product_id}/image", response_model=ProductInDB)
-def upload_product_image(product_id: str, file: UploadFile = File(...), current_admin = Depends(get_current_admin)):
+async def upload_product_image(product_id: str, file: UploadFile = File(...), current_admin = Depends(get_current_admin)):
 
-    product = product_crud.get_by_id(product_id)
+    product = await product_crud.get_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    # Validar extensión simple
-    _, ext = os.path.splitext(file.filename or "")
-    ext = ext.lower() or ".jpg"
-    if ext not in {".jpg", ".jpeg", ".png", ".gif", ".webp"}:
-        raise HTTPException(status_code=400, detail="Formato de imagen no soportado")
-
-    filename = f"{product_id}{ext}"
-    dest_path = UPLOAD_DIR / filename
-
-    with dest_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    image_url = f"/static/products/{filename}"
-    updated = product_crud.update(product_id, {"image_url": image_url})
+    image = await _receive(file)
+    try:
+        updated = await _attach_image(product_id, image, previous=product)
+    finally:
+        image.discard()
     if not updated:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return updated
\ No newline at end of file
+    return updated
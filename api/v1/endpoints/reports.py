@@ -0,0 +1,38 @@
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from core.security import get_current_admin
+from crud.async_firebase_crud import AsyncFirebaseReportCRUD
+from crud.reports import normalize_report, report_days, sum_reports
+from schemas.report import DailyReportRange
+
+router = APIRouter()
+
+report_crud = AsyncFirebaseReportCRUD()
+
+# Un año por consulta: el costo es una lectura por día pedido
+MAX_REPORT_DAYS = 366
+
+
+@router.get("/daily", response_model=DailyReportRange)
+async def get_daily_reports(
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    current_admin = Depends(get_current_admin),
+):
+    """Resúmenes diarios entre ``from`` y ``to`` (incluidos) y sus totales.
+
+    Solo se leen los resúmenes de esos días y sus shards (ver
+    ``crud.reports``), que se mantienen al escribir citas, pacientes y
+    órdenes. Los días sin actividad aparecen en cero.
+    """
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' debe ser igual o posterior a 'from'")
+    days = report_days(from_date, to_date)
+    if len(days) > MAX_REPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {MAX_REPORT_DAYS} días")
+
+    stored = await report_crud.get_days(days)
+    reports = [{"date": day, **normalize_report(stored.get(day))} for day in days]
+    return {"days": reports, "totals": sum_reports(reports)}
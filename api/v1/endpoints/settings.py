@@ -1,11 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request, status
 from schemas.settings import SettingsInDB, SettingsBase, SettingsUpdate, ClinicaConfig, NotificacionesConfig, SistemaConfig, SeguridadConfig
-from crud.firebase_crud import FirebaseSettingsCRUD
+from crud.async_firebase_crud import AsyncFirebaseSettingsCRUD, SettingsSnapshot
+from crud.firebase_crud import WriteConflictError, deep_merge
+from core.compression import EncodedBody
 
 
 router = APIRouter()
 
-settings_crud = FirebaseSettingsCRUD()
+settings_crud = AsyncFirebaseSettingsCRUD()
 
 
 def _default_settings() -> SettingsInDB:
@@ -43,30 +45,27 @@ def _default_settings() -> SettingsInDB:
     )
 
 
-@router.get("/", response_model=SettingsInDB)
-def get_settings():
-    data = settings_crud.get()
-    if not data:
-        # Si no existe configuración, devolvemos los valores por defecto
-        return _default_settings()
-    return SettingsInDB(**data)
-
-
-@router.put("/", response_model=SettingsInDB)
-def update_settings(payload: SettingsUpdate):
-    update_data = payload.model_dump(exclude_unset=True)
+def _render(snapshot: SettingsSnapshot) -> EncodedBody:
+    # Lo guardado puede ser parcial (versiones anteriores): se completa con
+    # los valores por defecto
+    merged = deep_merge(_default_settings().model_dump(), snapshot.data or {})
+    return EncodedBody(SettingsInDB(**merged).model_dump_json().encode())
 
-    # Siempre partimos de los valores por defecto completos
-    base = _default_settings().model_dump()
 
-    # Obtener la configuración actual (si existe). Puede ser parcial.
-    current = settings_crud.get() or {}
-
-    # Orden de prioridad: defaults < lo que ya hay en Firestore < lo que llega en el payload
-    merged = {**base, **current, **update_data}
+@router.get("/", response_model=SettingsInDB)
+async def get_settings(request: Request):
+    snapshot = await settings_crud.snapshot()
+    # El JSON (y su versión comprimida) vive junto a la versión en memoria
+    body = snapshot.derive("body", lambda: _render(snapshot))
+    return body.response(request)
 
-    # Guardar configuración fusionada en Firestore (merge=True ya se maneja en el CRUD)
-    saved = settings_crud.upsert(merged)
 
-    # Aseguramos que el modelo tenga todas las secciones requeridas
-    return SettingsInDB(**saved)
+@router.put("/", response_model=SettingsInDB)
+async def update_settings(request: Request, payload: SettingsUpdate):
+    # Solo las secciones y campos enviados; el resto se conserva
+    changes = payload.model_dump(exclude_unset=True)
+    try:
+        snapshot = await settings_crud.update(changes, defaults=_default_settings().model_dump())
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+    return snapshot.derive("body", lambda: _render(snapshot)).response(request)
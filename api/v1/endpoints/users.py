@@ -1,22 +1,33 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Response
+from typing import List, Literal, Optional
 from schemas.user import UserInDB, UserCreate, UserUpdate
-from crud.firebase_crud import FirebaseUserCRUD
-from core.security import get_current_admin
+from crud.async_firebase_crud import AsyncFirebaseUserCRUD
+from crud.firebase_crud import WriteConflictError
+from core.security import get_current_admin, revoke_user_tokens
+from api.v1.deps import PaginationParams, build_filters, fetch_page
 import hashlib
 
 router = APIRouter()
 
-user_crud = FirebaseUserCRUD()
+user_crud = AsyncFirebaseUserCRUD()
 
 
 @router.get("/", response_model=List[UserInDB])
-def get_all_users(current_admin = Depends(get_current_admin)):
-    """Obtiene todos los usuarios usando modelos de dominio internamente.
+async def get_all_users(
+    response: Response,
+    pagination: PaginationParams = Depends(),
+    role: Optional[str] = None,
+    email: Optional[str] = None,
+    order_by: Optional[Literal["name", "email"]] = None,
+    current_admin = Depends(get_current_admin),
+):
+    """Obtiene los usuarios paginados usando modelos de dominio internamente.
 
     La respuesta sigue siendo una lista de UserInDB.
     """
-    users = user_crud.get_all_models()
+    filters = build_filters(("role", "==", role), ("email", "==", email))
+    page = await fetch_page(user_crud.get_page, response, pagination, filters=filters, order_by=order_by)
+    users = [user_crud.to_model(data) for data in page.items]
     # Convertir de modelo de dominio a dict compatible con UserInDB
     return [
         {
@@ -31,12 +42,12 @@ def get_all_users(current_admin = Depends(get_current_admin)):
 
 
 @router.get("/{user_id}", response_model=UserInDB)
-def get_user(user_id: str, current_admin = Depends(get_current_admin)):
+async def get_user(user_id: str, current_admin = Depends(get_current_admin)):
     """Obtiene un usuario por id usando el modelo de dominio internamente.
 
     Si no existe, devuelve 404 como antes.
     """
-    user_model = user_crud.get_model_by_id(user_id)
+    user_model = await user_crud.get_model_by_id(user_id)
     if not user_model or user_model.id is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return {
@@ -48,33 +59,42 @@ def get_user(user_id: str, current_admin = Depends(get_current_admin)):
 
 
 @router.post("/", response_model=UserInDB, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, current_admin = Depends(get_current_admin)):
-    existing = user_crud.get_by_email(user.email)
+async def create_user(user: UserCreate, current_admin = Depends(get_current_admin)):
+    existing = await user_crud.get_by_email(user.email)
     if existing:
         raise HTTPException(status_code=400, detail="Ya existe un usuario con ese email")
     # Hashear contraseña antes de guardar
     password_hash = hashlib.sha256(user.password.encode()).hexdigest()
     data = user.model_dump(exclude={"password"})
     data["password_hash"] = password_hash
-    new_user = user_crud.create(data)
+    new_user = await user_crud.create(data)
     return new_user
 
 
 @router.put("/{user_id}", response_model=UserInDB)
-def update_user(user_id: str, user_update: UserUpdate, current_admin = Depends(get_current_admin)):
+async def update_user(user_id: str, user_update: UserUpdate, current_admin = Depends(get_current_admin)):
     update_data = user_update.model_dump(exclude_unset=True, exclude={"password"})
     # Si viene nueva contraseña, actualizar hash
     if user_update.password is not None:
         update_data["password_hash"] = hashlib.sha256(user_update.password.encode()).hexdigest()
-    updated = user_crud.update(user_id, update_data)
+    try:
+        updated = await user_crud.update(user_id, update_data)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not updated:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    # Los tokens ya emitidos llevan el rol/email anteriores
+    await revoke_user_tokens(user_id)
     return updated
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: str, current_admin = Depends(get_current_admin)):
-    deleted = user_crud.delete(user_id)
+async def delete_user(user_id: str, current_admin = Depends(get_current_admin)):
+    try:
+        deleted = await user_crud.delete(user_id)
+    except WriteConflictError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
     if not deleted:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    await revoke_user_tokens(user_id)
     return None
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""Mide la búsqueda de pacientes en memoria (``crud.search``).
+
+Llena un ``PatientSearchIndex`` con pacientes sintéticos y mide el tiempo
+por consulta para búsquedas exactas, por prefijo y con errores de tipeo.
+Antes de medir verifica que cada consulta encuentre al paciente esperado
+en el primer lugar, incluidas las palabras cortas con una letra de más,
+de menos, cambiada o dos letras invertidas (``roky``, ``rocy``, ``rokcy``).
+
+Uso (desde la raíz del proyecto)::
+
+    python benchmarks/bench_search.py --items 20000 --repeat 200
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crud.search import PatientSearchIndex  # noqa: E402
+
+_PETS = ["Luna", "Max", "Toby", "Coco", "Simba", "Kira", "Nala", "Bruno", "Lola", "Thor"]
+_NAMES = ["Ana", "Carlos", "María", "José", "Lucía", "Andrés", "Sofía", "Juan"]
+_SURNAMES = ["Gómez", "Rodríguez", "Martínez", "López", "García", "Pérez", "Sánchez"]
+
+# Paciente que deben encontrar las consultas de ``CASES``
+TARGET = {
+    "id": "target",
+    "mascota_nombre": "Rocky",
+    "mascota_especie": "Perro",
+    "tutor_nombre": "Valentina",
+    "tutor_apellido": "Muñoz",
+    "tutor_numero_documento": "1.020.304.050",
+    "tutor_telefono_principal": "300-123 4567",
+    "email": "valentina@example.com",
+}
+
+CASES = {
+    "exacta": ["rocky", "Rocky Muñoz", "1020304050", "3001234567"],
+    "prefijo": ["roc", "valen muñ", "300123"],
+    "tipeo": ["roky", "rocy", "rokcy", "rockyy", "valentna", "munos", "rocky munoz"],
+}
+
+
+def make_patients(n: int) -> List[Dict[str, str]]:
+    patients = [
+        {
+            "id": f"pac{i:06d}",
+            "mascota_nombre": f"{_PETS[i % len(_PETS)]} {i}",
+            "mascota_especie": "Gato" if i % 3 else "Perro",
+            "tutor_nombre": _NAMES[i % len(_NAMES)],
+            "tutor_apellido": _SURNAMES[i % len(_SURNAMES)],
+            "tutor_numero_documento": f"{10_000_000 + i}",
+            "tutor_telefono_principal": f"310 {i:07d}",
+            "email": f"tutor{i}@example.com",
+        }
+        for i in range(n)
+    ]
+    patients.append(TARGET)
+    return patients
+
+
+def check(index: PatientSearchIndex) -> None:
+    for kind, queries in CASES.items():
+        for query in queries:
+            hits = index.search(query, limit=5)
+            if not hits or hits[0]["id"] != TARGET["id"]:
+                found = [hit["id"] for hit in hits]
+                raise SystemExit(f"Búsqueda {kind} '{query}': se esperaba '{TARGET['id']}' primero, llegó {found}")
+    print("Verificación: todas las consultas encuentran al paciente esperado")
+
+
+def bench(index: PatientSearchIndex, repeat: int) -> None:
+    for kind, queries in CASES.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                index.search(query)
+        ms = (time.perf_counter() - start) / (repeat * len(queries)) * 1000
+        print(f"  {kind:<8} {ms:8.3f} ms/consulta")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    patients = make_patients(args.items)
+    index = PatientSearchIndex(lambda: patients, rebuild_seconds=0)
+    start = time.perf_counter()
+    index.search("rocky")  # primera consulta: carga el índice
+    print(f"Carga de {len(index)} pacientes: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    check(index)
+    print(f"\nBúsquedas ({args.repeat} repeticiones)")
+    bench(index, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Compara la serialización de listados grandes con y sin ``JSON_FAST_PATH``.
+
+Mide, para una lista de productos y otra de pacientes:
+
+* ``fastapi``: lo que hace FastAPI con ``response_model`` (validar,
+  convertir a tipos JSON y ``json.dumps``).
+* ``validated`` y ``trusted``: los modos de ``core.serialization``.
+
+También verifica que las tres salidas decodifiquen al mismo JSON y que
+usar ORJSONResponse como clase por defecto no cambie el esquema OpenAPI.
+
+Uso (desde la raíz del proyecto)::
+
+    python benchmarks/bench_serialization.py --items 2000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from core.serialization import ListSerializer  # noqa: E402
+from schemas.patient import PatientInDB  # noqa: E402
+from schemas.product import ProductInDB  # noqa: E402
+
+
+def make_products(n: int) -> List[dict]:
+    return [
+        {
+            "id": f"prod{i:06d}",
+            "name": f"Producto de prueba número {i}",
+            "price": float(i % 500) + 0.99,
+            "stock": i % 37,
+            "category": f"categoria-{i % 12}",
+            "image_url": f"/static/products/prod{i:06d}-0123456789abcdef.jpg",
+        }
+        for i in range(n)
+    ]
+
+
+def make_patients(n: int) -> List[dict]:
+    patients = []
+    for i in range(n):
+        data = {
+            name: f"{name} del paciente {i} con un texto bastante largo"
+            for name, field in PatientInDB.model_fields.items()
+            if field.annotation in (str, Optional[str])
+        }
+        data.update({
+            "id": f"pac{i:06d}",
+            "mascota_edad_aproximada_anios": i % 15,
+            "mascota_peso_kg": 3.5 + i % 40,
+            "tiene_seguro_medico": bool(i % 2),
+        })
+        patients.append(data)
+    return patients
+
+
+def timed(fn: Callable[[], bytes], repeat: int) -> float:
+    fn()  # calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench(label: str, model, items: List[dict], repeat: int) -> None:
+    serializer = ListSerializer(model)
+    field = create_model_field(name="response", type_=List[model], mode="serialization")
+
+    async def _fastapi() -> bytes:
+        content = await serialize_response(field=field, response_content=items)
+        return JSONResponse(content).body
+
+    loop = asyncio.new_event_loop()
+    candidates = {
+        "fastapi": lambda: loop.run_until_complete(_fastapi()),
+        "validated": lambda: serializer.dump_validated(items),
+        "trusted": lambda: serializer.dump_trusted(items),
+    }
+
+    expected = json.loads(candidates["fastapi"]())
+    for name, fn in candidates.items():
+        if json.loads(fn()) != expected:
+            raise SystemExit(f"{label}: la salida de '{name}' no coincide con response_model")
+
+    baseline = None
+    print(f"\n{label} ({len(items)} items)")
+    for name, fn in candidates.items():
+        ms = timed(fn, repeat)
+        baseline = baseline or ms
+        print(f"  {name:<10} {ms:8.2f} ms   x{baseline / ms:5.1f}")
+    loop.close()
+
+
+def check_openapi() -> None:
+    def build(response_class) -> dict:
+        app = FastAPI(default_response_class=response_class)
+
+        @app.get("/products/", response_model=List[ProductInDB])
+        async def products():
+            return []
+
+        @app.get("/patients/", response_model=List[PatientInDB])
+        async def patients():
+            return []
+
+        return app.openapi()
+
+    if build(JSONResponse) != build(ORJSONResponse):
+        raise SystemExit("El esquema OpenAPI cambia con ORJSONResponse")
+    print("\nOpenAPI: sin cambios con ORJSONResponse como clase por defecto")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    bench("Productos", ProductInDB, make_products(args.items), args.repeat)
+    bench("Pacientes", PatientInDB, make_patients(args.items), args.repeat)
+    check_openapi()
+
+
+if __name__ == "__main__":
+    main()
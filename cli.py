@@ -0,0 +1,168 @@
+"""Comandos de mantenimiento: ``python cli.py <comando> ...``."""
+
+import argparse
+import json
+import sys
+from datetime import date
+
+
+def _cmd_import(args: argparse.Namespace) -> int:
+    from crud.bulk_import import detect_format, import_stream
+    from crud.firebase_crud import FirebasePatientCRUD, FirebaseProductCRUD
+    from schemas.patient import PatientCreate
+    from schemas.product import ProductCreate
+
+    targets = {
+        "products": (FirebaseProductCRUD, ProductCreate),
+        "patients": (FirebasePatientCRUD, PatientCreate),
+    }
+    crud_class, schema = targets[args.collection]
+    fmt = args.format or detect_format(args.path)
+    with open(args.path, "rb") as stream:
+        report = import_stream(crud_class(), schema, stream, fmt, max_in_flight=args.concurrency)
+    print(json.dumps(report.model_dump(), ensure_ascii=False, indent=2))
+    return 0 if report.failed == 0 else 1
+
+
+def _cmd_rebuild_slots(args: argparse.Namespace) -> int:
+    from crud.firebase_crud import FirebaseAppointmentCRUD
+
+    created = FirebaseAppointmentCRUD().rebuild_slots()
+    print(f"Horarios creados: {created}")
+    return 0
+
+
+def _cmd_backfill_orders(args: argparse.Namespace) -> int:
+    from crud.firebase_crud import FirebaseOrderCRUD
+
+    updated = FirebaseOrderCRUD().backfill_summary_fields()
+    print(f"Órdenes actualizadas: {updated}")
+    return 0
+
+
+def _cmd_reminders(args: argparse.Namespace) -> int:
+    import dataclasses
+    import time
+
+    from crud.firebase_crud import FirebaseAppointmentCRUD
+
+    if args.backfill:
+        updated = FirebaseAppointmentCRUD().backfill_schedule_fields()
+        print(f"Citas actualizadas: {updated}")
+        return 0
+
+    from core.reminders import run_reminders
+
+    while True:
+        started = time.monotonic()
+        print(json.dumps(dataclasses.asdict(run_reminders())), flush=True)
+        if not args.every:
+            return 0
+        time.sleep(max(0.0, args.every - (time.monotonic() - started)))
+
+
+def _cmd_reports(args: argparse.Namespace) -> int:
+    if args.enqueue:
+        from core.jobs import schedule_report_recompute
+
+        schedule_report_recompute(args.start, args.end)
+        print("Recálculo encolado en el outbox")
+        return 0
+
+    from crud.firebase_crud import FirebaseReportCRUD
+
+    days = FirebaseReportCRUD().recompute(args.start, args.end)
+    print(f"Días recalculados: {days}")
+    return 0
+
+
+def _cmd_worker(args: argparse.Namespace) -> int:
+    import logging
+    import signal
+    import threading
+
+    from core.jobs import run_worker
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    stop = threading.Event()
+    # Al recibir SIGTERM/SIGINT no se reclaman trabajos nuevos y se espera
+    # a que terminen los que están en curso
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    run_worker(processes=args.processes, stop=stop, drain=args.drain)
+    return 0
+
+
+def _cmd_outbox(args: argparse.Namespace) -> int:
+    from core.outbox import outbox
+
+    if args.action == "retry":
+        print(f"Trabajos reencolados: {outbox.retry_dead(args.kind)}")
+    elif args.action == "dead":
+        print(json.dumps(outbox.dead(), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(outbox.stats(), indent=2))
+    return 0
+
+
+def _iso_date(value: str) -> str:
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida: {value}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Mi Tienda API - tareas de mantenimiento")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Importación masiva desde CSV o NDJSON")
+    import_parser.add_argument("collection", choices=["products", "patients"])
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"])
+    import_parser.add_argument("--concurrency", type=int, default=4, help="Lotes en vuelo a la vez")
+    import_parser.set_defaults(func=_cmd_import)
+
+    slots_parser = subparsers.add_parser("rebuild-slots", help="Crea los horarios de citas existentes")
+    slots_parser.set_defaults(func=_cmd_rebuild_slots)
+
+    orders_parser = subparsers.add_parser(
+        "backfill-orders", help="Agrega los campos del resumen a las órdenes anteriores al historial"
+    )
+    orders_parser.set_defaults(func=_cmd_backfill_orders)
+
+    reminders_parser = subparsers.add_parser("reminders", help="Envía los recordatorios de citas próximas")
+    reminders_parser.add_argument("--every", type=float, help="Repite cada N segundos en vez de una sola vez")
+    reminders_parser.add_argument(
+        "--backfill", action="store_true", help="Agrega fechaHora a las citas creadas antes de los recordatorios"
+    )
+    reminders_parser.set_defaults(func=_cmd_reminders)
+
+    reports_parser = subparsers.add_parser(
+        "reports", help="Recalcula los resúmenes diarios (daily_reports) desde los datos"
+    )
+    reports_parser.add_argument("--from", dest="start", type=_iso_date, help="Primer día (YYYY-MM-DD)")
+    reports_parser.add_argument("--to", dest="end", type=_iso_date, help="Último día (YYYY-MM-DD)")
+    reports_parser.add_argument("--enqueue", action="store_true", help="Lo ejecuta el worker en vez de este proceso")
+    reports_parser.set_defaults(func=_cmd_reports)
+
+    worker_parser = subparsers.add_parser("worker", help="Ejecuta los trabajos del outbox")
+    worker_parser.add_argument("--processes", type=int, help="Trabajos en paralelo (WORKER_PROCESSES)")
+    worker_parser.add_argument("--drain", action="store_true", help="Termina cuando no quedan trabajos listos")
+    worker_parser.set_defaults(func=_cmd_worker)
+
+    outbox_parser = subparsers.add_parser("outbox", help="Estado del outbox y trabajos descartados")
+    outbox_parser.add_argument("action", choices=["stats", "dead", "retry"])
+    outbox_parser.add_argument("--kind", help="Con retry: solo los trabajos de este tipo")
+    outbox_parser.set_defaults(func=_cmd_outbox)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
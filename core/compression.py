@@ -0,0 +1,233 @@
+"""Compresión de respuestas (gzip y, si está instalado, brotli).
+
+``CompressionMiddleware`` comprime las respuestas de tipos de texto/JSON
+que superan ``COMPRESSION_MIN_SIZE``, incluidas las que se envían en
+streaming (exportaciones). Las respuestas que ya traen
+``Content-Encoding`` pasan sin tocarse.
+
+Para respuestas que se cachean (catálogo, configuración) ``EncodedBody``
+guarda el JSON y sus versiones comprimidas en la misma entrada de caché,
+así se comprimen una vez por entrada y no en cada petición.
+"""
+
+import gzip
+import threading
+import zlib
+from typing import Dict, Mapping, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# A partir de este tamaño la compresión se hace fuera del event loop
+_THREADPOOL_SIZE = 256 * 1024
+
+
+def accepts(header: str, token: str) -> bool:
+    """Indica si ``token`` aparece en una cabecera Accept* con q > 0."""
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != token:
+            continue
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Elige ``br`` o ``gzip`` según lo que acepta el cliente."""
+    if brotli is not None and accepts(accept_encoding, "br"):
+        return "br"
+    if accepts(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_LEVEL, mtime=0)
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+def _add_vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary")
+    if not vary:
+        headers["vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["vary"] = f"{vary}, Accept-Encoding"
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(settings.COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Se vacía el compresor en cada bloque para que el cliente reciba
+        # los datos a medida que se generan
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressingResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_StreamCompressor] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Se retiene hasta ver el primer bloque del cuerpo
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or not _is_compressible(headers.get("content-type", ""))
+                or message["status"] in (204, 304)
+            )
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            if not more_body:
+                # Respuesta completa: se comprime de una vez si vale la pena
+                if len(body) >= self.minimum_size:
+                    if len(body) >= _THREADPOOL_SIZE:
+                        body = await run_in_threadpool(compress, body, self.encoding)
+                    else:
+                        body = compress(body, self.encoding)
+                    headers["content-encoding"] = self.encoding
+                    headers["content-length"] = str(len(body))
+                    _add_vary(headers)
+                await self.send(self.start_message)
+                self.start_message = None
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            # Streaming: no se conoce el tamaño final
+            self.compressor = _StreamCompressor(self.encoding)
+            headers["content-encoding"] = self.encoding
+            _add_vary(headers)
+            del headers["content-length"]
+            await self.send(self.start_message)
+            self.start_message = None
+
+        data = self.compressor.chunk(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+class EncodedBody:
+    """Cuerpo JSON ya serializado y sus versiones comprimidas.
+
+    Se guarda como valor en una ``VersionedTTLCache``; cada codificación
+    se calcula la primera vez que un cliente la pide y vive lo mismo que
+    la entrada de caché.
+    """
+
+    def __init__(
+        self,
+        content: bytes,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: str = "application/json",
+    ):
+        self.content = content
+        self.headers = dict(headers or {})
+        self.media_type = media_type
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: str) -> bytes:
+        body = self._encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    body = self._encoded[encoding] = compress(self.content, encoding)
+        return body
+
+    def response(self, request: Request) -> Response:
+        headers = dict(self.headers)
+        headers["vary"] = "Accept-Encoding"
+        content = self.content
+        if len(content) >= settings.COMPRESSION_MIN_SIZE:
+            encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+            if encoding is not None:
+                content = self.encoded(encoding)
+                headers["content-encoding"] = encoding
+        return Response(content=content, media_type=self.media_type, headers=headers)
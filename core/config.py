@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Literal, Optional
 from dotenv import load_dotenv
 
 # Cargar variables de entorno desde el archivo .env usando python-dotenv
@@ -19,6 +19,94 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: Optional[str] = None
     SMTP_FROM: Optional[str] = None
     SMTP_TLS: bool = True
+    # Sesiones SMTP persistentes (core/mailer.py)
+    SMTP_POOL_SIZE: int = 2
+    SMTP_BATCH_SIZE: int = 20
+    SMTP_MAX_ATTEMPTS: int = 4
+    SMTP_TIMEOUT_SECONDS: float = 10.0
+    SMTP_IDLE_SECONDS: float = 60.0
+    SMTP_BACKOFF_SECONDS: float = 1.0
+    SMTP_BACKOFF_MAX_SECONDS: float = 60.0
+
+    # Tokens de acceso firmados (HMAC-SHA256). SECRET_KEY es obligatoria;
+    # solo en desarrollo, con ALLOW_EPHEMERAL_SECRET_KEY, se genera una
+    # aleatoria por proceso y los tokens no sobreviven reinicios.
+    SECRET_KEY: Optional[str] = None
+    ALLOW_EPHEMERAL_SECRET_KEY: bool = False
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 480
+    USER_CACHE_TTL_SECONDS: float = 60.0
+    USER_CACHE_MAX_ENTRIES: int = 1024
+    # Revocaciones de tokens (cambio de rol, borrado) compartidas entre
+    # procesos: con el listener llegan al momento; sin él se vuelven a leer
+    # al pasar el TTL
+    TOKEN_REVOCATIONS_LISTENER: bool = True
+    TOKEN_REVOCATIONS_CACHE_TTL_SECONDS: float = 5.0
+
+    # Serialización de los listados grandes: "off" (response_model de
+    # FastAPI), "validated" (TypeAdapter precompilado) o "trusted" (sin
+    # revalidar, con orjson). Ver core/serialization.py
+    JSON_FAST_PATH: Literal["off", "validated", "trusted"] = "off"
+
+    # Compresión de respuestas (brotli solo si el paquete está instalado)
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+
+    # Caché en memoria del catálogo de productos
+    CATALOG_CACHE_TTL_SECONDS: float = 30.0
+    CATALOG_CACHE_MAX_ENTRIES: int = 512
+    # Índice del catálogo en memoria (GET /products/search): límites de los
+    # tramos de precio de los facets y cada cuánto se reconstruye para ver
+    # los cambios de otros procesos (0 = nunca)
+    CATALOG_PRICE_BUCKETS: List[float] = [10, 25, 50, 100, 250]
+    CATALOG_INDEX_REBUILD_SECONDS: float = 60.0
+
+    # Configuración global (GET /settings) en memoria: con el listener de
+    # Firestore cada cambio llega al momento; sin él se vuelve a leer al
+    # pasar el TTL
+    SETTINGS_LISTENER: bool = True
+    SETTINGS_CACHE_TTL_SECONDS: float = 30.0
+
+    # Índice de búsqueda de pacientes en memoria: cada cuánto se reconstruye
+    # para ver los cambios hechos desde otros procesos (0 = nunca)
+    PATIENT_SEARCH_REBUILD_SECONDS: float = 300.0
+
+    # Suma cacheada de los shards de stock de los productos calientes
+    STOCK_SHARD_CACHE_TTL_SECONDS: float = 5.0
+
+    # Imágenes de productos: tamaño máximo de subida e hilos que generan
+    # las versiones reducidas
+    MAX_IMAGE_BYTES: int = 5 * 1024 * 1024
+    IMAGE_WORKERS: int = 2
+
+    # Outbox de trabajos en segundo plano (core/outbox.py) que ejecuta
+    # "python cli.py worker". Solo se activa si el despliegue corre ese
+    # worker; con OUTBOX_ENABLED=False los correos y las versiones de
+    # imágenes se procesan dentro del proceso del API
+    OUTBOX_ENABLED: bool = False
+    OUTBOX_PATH: str = "outbox.sqlite3"
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # El worker renueva el lease de sus trabajos en curso; solo vence si el
+    # worker muere
+    OUTBOX_LEASE_SECONDS: float = 300.0
+    OUTBOX_BACKOFF_SECONDS: float = 5.0
+    OUTBOX_BACKOFF_MAX_SECONDS: float = 600.0
+    OUTBOX_POLL_SECONDS: float = 1.0
+    WORKER_PROCESSES: int = 2
+
+    # Métricas en GET /metrics (core/metrics.py): latencia por ruta y por
+    # operación de los CRUD de Firestore
+    METRICS_ENABLED: bool = True
+
+    # Resúmenes diarios (crud/reports.py): cada escritura suma en uno de
+    # REPORT_SHARDS documentos del día elegido al azar
+    REPORT_SHARDS: int = 8
+
+    # Recordatorios de citas ("python cli.py reminders"): se recuerdan las
+    # citas de las próximas REMINDER_LEAD_HOURS horas; cada ejecución se
+    # corta al agotar su presupuesto y sigue en la siguiente
+    REMINDER_LEAD_HOURS: float = 24.0
+    REMINDER_TICK_BUDGET_SECONDS: float = 50.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,198 @@
+"""Recepción de imágenes subidas y generación de versiones reducidas.
+
+La subida se copia por bloques a un archivo temporal sin bloquear el event
+loop, validando el tamaño máximo y el tipo real del archivo (sus primeros
+bytes, no la extensión) y calculando su hash. El nombre publicado incluye
+ese hash, así que una URL siempre apunta al mismo contenido y puede
+cachearse como inmutable (ver ``core.static_files``). Las versiones
+``thumb`` y ``medium``, y las copias WebP, se generan después en un pool
+de hilos, fuera del ciclo de la petición.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+# Lado máximo en píxeles de cada versión reducida
+VARIANT_SIZES: Dict[str, int] = {"thumb": 200, "medium": 800}
+
+# Caracteres del sha256 que van en el nombre del archivo
+HASH_LENGTH = 16
+
+# Sufijo de la copia WebP que se sirve a los clientes que la aceptan
+WEBP_SUFFIX = ".webp"
+
+# (firma, desplazamiento, extensión)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", 0, ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", 0, ".png"),
+    (b"GIF87a", 0, ".gif"),
+    (b"GIF89a", 0, ".gif"),
+    (b"WEBP", 8, ".webp"),
+)
+
+_variant_pool = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image-variants"
+)
+
+
+class InvalidImageError(ValueError):
+    """El archivo subido no es una imagen de un formato soportado."""
+
+
+class ImageTooLargeError(InvalidImageError):
+    """El archivo subido supera ``MAX_IMAGE_BYTES``."""
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Devuelve la extensión según los primeros bytes o None si no se reconoce."""
+    for signature, offset, ext in _SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            if ext == ".webp" and not head.startswith(b"RIFF"):
+                continue
+            return ext
+    return None
+
+
+@dataclass
+class ReceivedImage:
+    """Imagen ya validada, todavía en un archivo temporal."""
+
+    path: Path
+    ext: str
+    size: int
+    digest: str
+
+    def move_to(self, directory: Path, stem: str) -> Path:
+        """Publica la imagen como ``{stem}-{hash}{ext}``."""
+        dest = directory / f"{stem}-{self.digest[:HASH_LENGTH]}{self.ext}"
+        os.replace(self.path, dest)
+        return dest
+
+    def discard(self) -> None:
+        """Borra el temporal si no llegó a publicarse."""
+        self.path.unlink(missing_ok=True)
+
+
+def _write_chunk(out, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+async def receive_image(upload: UploadFile, directory: Path) -> ReceivedImage:
+    """Copia la subida por bloques a ``directory`` validando tipo y tamaño.
+
+    Las lecturas de ``UploadFile``, el hash y las escrituras a disco corren
+    en el threadpool, así que el event loop sigue atendiendo otras peticiones.
+    """
+    max_bytes = settings.MAX_IMAGE_BYTES
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix=".upload")
+    tmp_path = Path(tmp_name)
+    hasher = hashlib.sha256()
+    size = 0
+    ext: Optional[str] = None
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = sniff_image_type(chunk)
+                    if ext is None:
+                        raise InvalidImageError("El archivo no es una imagen JPEG, PNG, GIF o WebP")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLargeError(f"La imagen supera el máximo de {max_bytes} bytes")
+                await run_in_threadpool(_write_chunk, out, hasher, chunk)
+        if ext is None:
+            raise InvalidImageError("El archivo está vacío")
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return ReceivedImage(path=tmp_path, ext=ext, size=size, digest=hasher.hexdigest())
+
+
+def _save(img: Image.Image, dest: Path, fmt: str) -> None:
+    tmp = dest.with_name(dest.name + ".tmp")
+    img.save(tmp, format=fmt, optimize=True, quality=85)
+    os.replace(tmp, dest)
+
+
+def webp_path(path: Path) -> Path:
+    return path.with_name(path.name + WEBP_SUFFIX)
+
+
+def _rgb(img: Image.Image) -> Tuple[Image.Image, bool]:
+    """Convierte a RGB, o a RGBA si la imagen tiene transparencia."""
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    return img.convert("RGBA" if has_alpha else "RGB"), has_alpha
+
+
+def build_variants(source: Path) -> Dict[str, Path]:
+    """Genera las versiones reducidas junto al original.
+
+    Se guardan en JPEG, o en PNG si la imagen tiene transparencia, y cada
+    una (igual que el original, salvo GIF y WebP) con una copia WebP al
+    lado. Los GIF animados se reducen a su primer cuadro.
+    """
+    if source.suffix in (".jpg", ".png"):
+        # La copia WebP del original necesita la resolución completa
+        with Image.open(source) as img:
+            _save(_rgb(img)[0], webp_path(source), "WEBP")
+
+    variants: Dict[str, Path] = {}
+    with Image.open(source) as img:
+        # Para JPEG, decodifica directamente a una escala cercana a la mayor
+        # versión pedida en lugar de la resolución completa
+        largest = max(VARIANT_SIZES.values())
+        img.draft("RGB", (largest, largest))
+        img, has_alpha = _rgb(img)
+        fmt, ext = ("PNG", ".png") if has_alpha else ("JPEG", ".jpg")
+
+        for name, size in VARIANT_SIZES.items():
+            variant = img.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            dest = source.with_name(f"{source.stem}_{name}{ext}")
+            _save(variant, dest, fmt)
+            _save(variant, webp_path(dest), "WEBP")
+            variants[name] = dest
+    return variants
+
+
+def delete_images(paths: Iterable[Path]) -> None:
+    """Borra imágenes publicadas junto con sus copias WebP."""
+    for path in paths:
+        path.unlink(missing_ok=True)
+        webp_path(path).unlink(missing_ok=True)
+
+
+def generate_variants(
+    source: Path, on_ready: Callable[[Dict[str, Path]], None]
+) -> Future:
+    """Encola la generación de versiones; ``on_ready`` corre en el hilo del pool."""
+    future = _variant_pool.submit(build_variants, source)
+
+    def _done(f: Future) -> None:
+        try:
+            on_ready(f.result())
+        except Exception:
+            logger.exception("No se pudieron generar las versiones de %s", source)
+
+    future.add_done_callback(_done)
+    return future
@@ -0,0 +1,258 @@
+"""Trabajos en segundo plano: registro, encolado y worker.
+
+Los efectos secundarios caros (correos, versiones de imágenes,
+recálculo de resúmenes diarios) se
+encolan en el outbox (``core.outbox``) y los ejecuta
+``python cli.py worker`` en un pool de procesos, así su costo no cae en
+los workers del API. Cada tipo de trabajo se registra con ``@job``.
+
+El outbox se activa con ``OUTBOX_ENABLED=True``, solo en despliegues que
+corren el worker. Por defecto se mantiene el camino anterior dentro del
+proceso del API: la cola de ``core.mailer`` y el pool de hilos de
+``core.images``.
+"""
+
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from core.config import settings
+from core.outbox import Job, PermanentJobError, outbox
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], None]
+
+HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Registra ``handler`` para los trabajos de tipo ``kind``."""
+    def decorator(handler: JobHandler) -> JobHandler:
+        HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+@lru_cache(maxsize=None)
+def _product_crud():
+    from crud.firebase_crud import FirebaseProductCRUD
+
+    return FirebaseProductCRUD()
+
+
+# --- Correo ---
+
+@job("email")
+def _send_email(payload: Dict[str, Any]) -> None:
+    from core.mailer import mailer
+
+    try:
+        mailer.deliver(payload["to"], payload["subject"], payload["html"])
+    except Exception as exc:
+        if mailer.is_permanent(exc):
+            raise PermanentJobError(str(exc)) from exc
+        raise
+
+
+def send_email(to: str, subject: str, html_body: str) -> bool:
+    """Encola un correo; devuelve False si SMTP no está configurado."""
+    from core.mailer import mailer
+
+    if not settings.OUTBOX_ENABLED:
+        return mailer.send(to, subject, html_body)
+    if not mailer.configured:
+        return False
+    outbox.enqueue("email", {"to": to, "subject": subject, "html": html_body})
+    return True
+
+
+def send_emails(messages: Iterable[Tuple[str, str, str]]) -> int:
+    """Encola varios correos (destinatario, asunto, html) de una vez.
+
+    Devuelve cuántos se encolaron; ninguno si SMTP no está configurado.
+    """
+    from core.mailer import mailer
+
+    if not mailer.configured:
+        return 0
+    if not settings.OUTBOX_ENABLED:
+        return sum(mailer.send(to, subject, html_body) for to, subject, html_body in messages)
+    return outbox.enqueue_many(
+        "email", ({"to": to, "subject": subject, "html": html_body} for to, subject, html_body in messages)
+    )
+
+
+# --- Versiones de imágenes de productos ---
+
+def apply_image_variants(product_id: str, image_url: str, source: Path, variants: Dict[str, Path]) -> None:
+    """Guarda en el producto las URLs de las versiones generadas.
+
+    Si mientras tanto se subió otra imagen no se pisan las versiones de la
+    nueva y estas se descartan. La caché del catálogo de otros procesos
+    (el API) ve el cambio al vencer su TTL.
+    """
+    from core.images import delete_images
+
+    crud = _product_crud()
+    crud.catalog_cache.discard(("id", product_id))
+    current = crud.get_by_id(product_id)
+    if current and current.get("image_url") == image_url:
+        base = image_url.rsplit("/", 1)[0]
+        crud.update(product_id, {"image_variants": {name: f"{base}/{path.name}" for name, path in variants.items()}})
+    else:
+        delete_images([source, *variants.values()])
+
+
+@job("image_variants")
+def _build_image_variants(payload: Dict[str, Any]) -> None:
+    from core.images import build_variants
+
+    source = Path(payload["path"])
+    if not source.exists():
+        # La imagen ya se reemplazó o se borró el producto
+        return
+    apply_image_variants(payload["product_id"], payload["image_url"], source, build_variants(source))
+
+
+def schedule_image_variants(product_id: str, source: Path, image_url: str) -> None:
+    if not settings.OUTBOX_ENABLED:
+        from core.images import generate_variants
+
+        generate_variants(source, lambda variants: apply_image_variants(product_id, image_url, source, variants))
+        return
+    outbox.enqueue(
+        "image_variants",
+        {"product_id": product_id, "path": str(source.resolve()), "image_url": image_url},
+    )
+
+
+# --- Resúmenes diarios ---
+
+@job("daily_reports")
+def _recompute_daily_reports(payload: Dict[str, Any]) -> None:
+    from crud.firebase_crud import FirebaseReportCRUD
+
+    FirebaseReportCRUD().recompute(payload.get("from"), payload.get("to"))
+
+
+def schedule_report_recompute(start: Optional[str] = None, end: Optional[str] = None) -> None:
+    outbox.enqueue("daily_reports", {"from": start, "to": end}, max_attempts=1)
+
+
+# --- Worker ---
+
+def execute(kind: str, payload: Dict[str, Any]) -> None:
+    """Corre un trabajo dentro de un proceso del pool."""
+    handler = HANDLERS.get(kind)
+    if handler is None:
+        raise PermanentJobError(f"Tipo de trabajo desconocido: {kind}")
+    try:
+        handler(payload)
+    except PermanentJobError:
+        raise
+    except Exception as exc:
+        logger.exception("Falló el trabajo %s", kind)
+        # Solo se devuelve el texto: no todas las excepciones se pueden
+        # pasar de vuelta entre procesos
+        raise RuntimeError(f"{type(exc).__name__}: {exc}") from None
+
+
+def _init_process() -> None:
+    # Ctrl+C lo maneja el proceso principal, que espera a los trabajos en curso
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _new_pool(processes: int) -> ProcessPoolExecutor:
+    # spawn: los clientes de Firestore (gRPC) no se pueden heredar con fork
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_process,
+    )
+
+
+def _finish(job_: Job, future: Future) -> None:
+    try:
+        future.result()
+    except PermanentJobError as exc:
+        outbox.fail(job_, str(exc), permanent=True)
+        logger.error("Trabajo %s (%s) descartado: %s", job_.id, job_.kind, exc)
+    except BrokenProcessPool:
+        # El proceso murió (por ejemplo sin memoria); cuenta como intento
+        outbox.fail(job_, "el proceso del worker terminó inesperadamente")
+        raise
+    except Exception as exc:
+        status = outbox.fail(job_, str(exc))
+        logger.warning("Trabajo %s (%s) falló (intento %s, queda %s): %s",
+                       job_.id, job_.kind, job_.attempts, status, exc)
+    else:
+        outbox.complete(job_)
+
+
+def run_worker(
+    processes: Optional[int] = None,
+    poll_seconds: Optional[float] = None,
+    stop: Optional[threading.Event] = None,
+    drain: bool = False,
+) -> None:
+    """Ejecuta trabajos del outbox con a lo sumo ``processes`` en paralelo.
+
+    Mientras un trabajo corre se renueva su lease cada tercio de
+    ``OUTBOX_LEASE_SECONDS``, así un trabajo largo (un recálculo de
+    resúmenes) no se reclama de nuevo a mitad de camino.
+
+    Termina cuando se activa ``stop`` (SIGTERM/SIGINT desde la CLI) tras
+    esperar los trabajos en curso, o con ``drain`` cuando no queda nada
+    listo para ejecutar.
+    """
+    processes = processes or settings.WORKER_PROCESSES
+    poll_seconds = settings.OUTBOX_POLL_SECONDS if poll_seconds is None else poll_seconds
+    renew_every = settings.OUTBOX_LEASE_SECONDS / 3
+    stop = stop or threading.Event()
+    in_flight: Dict[Future, Job] = {}
+    renewed_at = time.monotonic()
+    pool = _new_pool(processes)
+    try:
+        while True:
+            if in_flight and time.monotonic() - renewed_at >= renew_every:
+                outbox.renew(in_flight.values())
+                renewed_at = time.monotonic()
+            if not stop.is_set():
+                running = {job_.id for job_ in in_flight.values()}
+                for claimed in outbox.claim(processes - len(in_flight)):
+                    # Con el lease renovado no debería pasar; por si acaso
+                    # no se ejecuta dos veces a la vez
+                    if claimed.id not in running:
+                        in_flight[pool.submit(execute, claimed.kind, claimed.payload)] = claimed
+            if not in_flight:
+                if stop.is_set() or drain:
+                    return
+                stop.wait(poll_seconds)
+                continue
+
+            done, _ = wait(in_flight, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                try:
+                    _finish(in_flight.pop(future), future)
+                except BrokenProcessPool:
+                    broken = True
+            if broken:
+                # Los demás trabajos del pool roto también fallaron; se
+                # reintentan con un pool nuevo
+                for pending in in_flight.values():
+                    outbox.fail(pending, "el proceso del worker terminó inesperadamente")
+                in_flight.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_pool(processes)
+                time.sleep(poll_seconds)
+    finally:
+        pool.shutdown(wait=True)
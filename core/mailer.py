@@ -0,0 +1,307 @@
+"""Envío de correos con sesiones SMTP persistentes.
+
+Los endpoints solo encolan el mensaje (``mailer.send``). Un grupo pequeño
+de hilos mantiene cada uno una sesión SMTP ya autenticada (STARTTLS +
+login una vez) y vacía la cola por lotes sobre esa sesión. Si la
+conexión se cae se reconecta con backoff exponencial y se reintenta el
+mensaje; los rechazos permanentes (5xx) no se reintentan.
+
+Los contadores de ``Mailer.stats()`` reemplazan al antiguo ``except:
+return``: cada fallo queda contado y registrado en el log.
+
+El worker del outbox (``core.jobs``) usa en cambio ``deliver``: un solo
+intento sobre una sesión persistente, y los reintentos quedan a cargo del
+outbox.
+
+Host, puerto y credenciales se pueden pasar al construir el ``Mailer``,
+lo que permite probarlo contra un servidor SMTP local de prueba.
+"""
+
+import html
+import logging
+import queue
+import random
+import re
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EmailTemplate:
+    """Plantilla HTML compilada una sola vez.
+
+    Los ``{{campo}}`` se separan al construirla; ``render`` solo une las
+    partes fijas con los valores del mensaje (escapados para HTML).
+    """
+
+    _FIELD = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+    def __init__(self, subject: str, body: str):
+        self._subject = self._compile(subject)
+        self._body = self._compile(body)
+
+    @classmethod
+    def _compile(cls, text: str) -> List[object]:
+        parts: List[object] = []
+        position = 0
+        for match in cls._FIELD.finditer(text):
+            parts.append(text[position:match.start()])
+            parts.append((match.group(1),))
+            position = match.end()
+        parts.append(text[position:])
+        return parts
+
+    @staticmethod
+    def _join(parts: List[object], values: Dict[str, object], escape: bool) -> str:
+        out = []
+        for part in parts:
+            if isinstance(part, tuple):
+                value = str(values.get(part[0], "") or "")
+                out.append(html.escape(value) if escape else value)
+            else:
+                out.append(part)
+        return "".join(out)
+
+    def render(self, **values: object) -> Tuple[str, str]:
+        """Devuelve (asunto, html) con los valores del mensaje."""
+        return self._join(self._subject, values, escape=False), self._join(self._body, values, escape=True)
+
+
+@dataclass
+class OutgoingEmail:
+    to: str
+    subject: str
+    html: str
+    attempts: int = 0
+
+
+class _Session:
+    """Una conexión SMTP autenticada que se reutiliza entre mensajes."""
+
+    def __init__(self, mailer: "Mailer"):
+        self._mailer = mailer
+        self.smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def ensure(self) -> smtplib.SMTP:
+        m = self._mailer
+        if self.smtp is not None and time.monotonic() - self._last_used > m.idle_seconds:
+            # Tras un rato sin uso el servidor pudo haber cerrado la sesión
+            try:
+                if self.smtp.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self.smtp is None:
+            smtp = smtplib.SMTP(m.host, m.port, timeout=m.timeout)
+            try:
+                if m.use_tls:
+                    smtp.starttls()
+                if m.user:
+                    smtp.login(m.user, m.password or "")
+            except BaseException:
+                smtp.close()
+                raise
+            self.smtp = smtp
+            m._count("connections")
+        self._last_used = time.monotonic()
+        return self.smtp
+
+    def close(self) -> None:
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+
+class Mailer:
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        sender: Optional[str] = None,
+        use_tls: Optional[bool] = None,
+        pool_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        self.host = host or settings.SMTP_HOST
+        self.port = port or settings.SMTP_PORT
+        self.user = user if user is not None else settings.SMTP_USER
+        self.password = password if password is not None else settings.SMTP_PASSWORD
+        self.sender = sender or settings.SMTP_FROM
+        self.use_tls = settings.SMTP_TLS if use_tls is None else use_tls
+        self.pool_size = pool_size or settings.SMTP_POOL_SIZE
+        self.batch_size = batch_size or settings.SMTP_BATCH_SIZE
+        self.max_attempts = max_attempts or settings.SMTP_MAX_ATTEMPTS
+        self.timeout = settings.SMTP_TIMEOUT_SECONDS
+        self.idle_seconds = settings.SMTP_IDLE_SECONDS
+        self.backoff_seconds = settings.SMTP_BACKOFF_SECONDS
+        self.backoff_max_seconds = settings.SMTP_BACKOFF_MAX_SECONDS
+
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        # Sesión de ``deliver`` (envío directo desde el worker del outbox)
+        self._direct = _Session(self)
+        self._direct_lock = threading.Lock()
+        self._stats: Dict[str, int] = dict.fromkeys(
+            ("queued", "sent", "failed", "retried", "batches", "connections", "unconfigured"), 0
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.sender)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["pending"] = self._queue.qsize()
+        return snapshot
+
+    def start(self) -> None:
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.pool_size):
+                worker = threading.Thread(target=self._run, name=f"mailer-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Envía lo que quede en la cola y cierra las sesiones."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        with self._direct_lock:
+            self._direct.close()
+
+    def send(self, to: str, subject: str, html_body: str) -> bool:
+        """Encola un correo; devuelve False si SMTP no está configurado."""
+        if not self.configured:
+            self._count("unconfigured")
+            return False
+        self.start()
+        self._queue.put(OutgoingEmail(to=to, subject=subject, html=html_body))
+        self._count("queued")
+        return True
+
+    def deliver(self, to: str, subject: str, html_body: str) -> None:
+        """Envía un correo en el hilo actual, con un solo intento.
+
+        Lo usa el worker del outbox, que se encarga de los reintentos: los
+        errores se propagan y ``is_permanent`` indica si vale la pena
+        reintentar. La sesión SMTP se conserva entre llamadas.
+        """
+        if not self.configured:
+            raise RuntimeError("SMTP no está configurado")
+        message = OutgoingEmail(to=to, subject=subject, html=html_body, attempts=1)
+        with self._direct_lock:
+            try:
+                self._direct.ensure().sendmail(self.sender, [to], self._payload(message))
+            except (smtplib.SMTPException, OSError) as exc:
+                if self.is_permanent(exc):
+                    self._count("failed")
+                else:
+                    self._direct.close()
+                    self._count("retried")
+                raise
+        self._count("sent")
+
+    @staticmethod
+    def is_permanent(exc: BaseException) -> bool:
+        """Rechazos que no se arreglan reintentando (destinatario, remitente o 5xx)."""
+        if isinstance(exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+            return True
+        return isinstance(exc, smtplib.SMTPResponseException) and 500 <= exc.smtp_code < 600
+
+    # --- Hilos de envío ---
+
+    def _run(self) -> None:
+        session = _Session(self)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                self._count("batches")
+                for message in batch:
+                    self._deliver_one(session, message)
+                if stop:
+                    return
+        finally:
+            session.close()
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_seconds * 2 ** (attempt - 1), self.backoff_max_seconds)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _payload(self, message: OutgoingEmail) -> str:
+        mime = MIMEText(message.html, "html", "utf-8")
+        mime["Subject"] = message.subject
+        mime["From"] = self.sender
+        mime["To"] = message.to
+        return mime.as_string()
+
+    def _deliver_one(self, session: _Session, message: OutgoingEmail) -> bool:
+        payload = self._payload(message)
+
+        while True:
+            message.attempts += 1
+            try:
+                session.ensure().sendmail(self.sender, [message.to], payload)
+                self._count("sent")
+                return True
+            except (smtplib.SMTPException, OSError) as exc:
+                if self.is_permanent(exc):
+                    logger.warning("Correo a %s rechazado: %s", message.to, exc)
+                    self._count("failed")
+                    return False
+                error = exc
+
+            # Error transitorio o de conexión: se descarta la sesión y se
+            # reintenta con una nueva después de esperar
+            session.close()
+            if message.attempts >= self.max_attempts:
+                logger.error("No se pudo enviar el correo a %s tras %s intentos: %s",
+                             message.to, message.attempts, error)
+                self._count("failed")
+                return False
+            self._count("retried")
+            time.sleep(self._backoff(message.attempts))
+
+
+mailer = Mailer()
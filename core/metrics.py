@@ -0,0 +1,410 @@
+"""Métricas del proceso en formato de texto de Prometheus (GET /metrics).
+
+* ``http_request_duration_seconds{method,route,status}``: histograma por
+  plantilla de ruta (``/api/v1/products/{product_id}``, no la URL real),
+  lo registra ``MetricsMiddleware``.
+* ``crud_operation_duration_seconds{collection,operation}``: histograma
+  de cada método público de los CRUD de Firestore marcados con
+  ``@instrumented``; ``crud_operation_errors_total`` cuenta los que
+  terminan con excepción y ``crud_documents_total`` los documentos leídos o
+  escritos.
+* ``mailer_*`` y ``outbox_jobs{status}``: estado de la cola de correos y del
+  outbox al momento de exportar.
+
+Para poder dejarlas siempre activas, cada hilo acumula en sus propios
+diccionarios sin locks (el event loop en uno, cada hilo del threadpool en
+el suyo) y solo ``render`` suma los de todos los hilos. Los acumuladores de
+los hilos que ya terminaron (el threadpool retira los inactivos) se pasan a
+uno solo de hilos retirados, así la lista no crece con la vida del proceso.
+Son por proceso: con varios workers de uvicorn cada uno exporta los suyos.
+"""
+
+import functools
+import inspect
+import logging
+import sqlite3
+import threading
+import weakref
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Límites (en segundos) de los histogramas de latencia
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+_Key = Tuple[str, Labels]
+
+
+class _Shard:
+    """Acumuladores de un hilo; solo ese hilo los modifica."""
+
+    def __init__(self, owner: Optional[threading.Thread] = None):
+        # Por serie: conteo por tramo (el último es +Inf) y la suma al final
+        self.histograms: Dict[_Key, List[float]] = {}
+        self.counters: Dict[_Key, float] = {}
+        self._owner = weakref.ref(owner) if owner is not None else None
+
+    def retired(self) -> bool:
+        """Indica si el hilo dueño ya terminó (y no volverá a escribir)."""
+        if self._owner is None:
+            return False
+        thread = self._owner()
+        return thread is None or not thread.is_alive()
+
+    def add(self, histograms: Dict[_Key, List[float]], counters: Dict[_Key, float]) -> None:
+        """Suma estos acumuladores a ``histograms`` y ``counters``."""
+        # La copia con list() no suelta el GIL: es consistente aunque el
+        # hilo dueño agregue series mientras tanto
+        for key, series in list(self.histograms.items()):
+            values = list(series)
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = values
+            else:
+                for i, value in enumerate(values):
+                    total[i] += value
+        for key, value in list(self.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+
+
+class Registry:
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        # Suma de los shards de hilos que ya terminaron
+        self._retired = _Shard()
+        # Para registrar el shard de un hilo nuevo y retirar los de hilos muertos
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Labels, float]]]] = []
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        """Tipo (``counter``, ``gauge``, ``histogram``) y descripción de ``name``."""
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        histograms = self._shard().histograms
+        series = histograms.get((name, labels))
+        if series is None:
+            series = histograms[(name, labels)] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def inc(self, name: str, labels: Labels, amount: float = 1) -> None:
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def collector(self, collect: Callable[[], Iterable[Tuple[str, Labels, float]]]) -> None:
+        """Registra una función que devuelve gauges (nombre, labels, valor) al exportar."""
+        self._collectors.append(collect)
+
+    def _merged(self) -> Tuple[Dict[_Key, List[float]], Dict[_Key, float]]:
+        histograms: Dict[_Key, List[float]] = {}
+        counters: Dict[_Key, float] = {}
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.retired():
+                    shard.add(self._retired.histograms, self._retired.counters)
+                else:
+                    live.append(shard)
+            self._shards = live
+            self._retired.add(histograms, counters)
+        for shard in live:
+            shard.add(histograms, counters)
+        return histograms, counters
+
+    def _gauges(self) -> Dict[_Key, float]:
+        gauges: Dict[_Key, float] = {}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    gauges[(name, labels)] = value
+            except Exception:
+                logger.exception("Falló un collector de métricas")
+        return gauges
+
+    def render(self) -> str:
+        """Todas las series en formato de texto de Prometheus."""
+        histograms, counters = self._merged()
+        by_name: Dict[str, List[str]] = {}
+
+        for (name, labels), series in sorted(histograms.items()):
+            lines = by_name.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {_number(cumulative)}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(series[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {_number(cumulative)}")
+        for (name, labels), value in sorted(counters.items()):
+            by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), value in sorted(self._gauges().items()):
+            by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+
+        out: List[str] = []
+        for name, lines in by_name.items():
+            kind, help_text = self._help.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels, **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = Registry()
+
+registry.describe("http_request_duration_seconds", "histogram", "Duración de las peticiones HTTP por ruta.")
+registry.describe("crud_operation_duration_seconds", "histogram", "Duración de las operaciones de los CRUD de Firestore.")
+registry.describe("crud_operation_errors_total", "counter", "Operaciones de los CRUD que terminaron con excepción.")
+registry.describe("crud_documents_total", "counter", "Documentos leídos o escritos por las operaciones de los CRUD.")
+registry.describe("mailer_messages", "gauge", "Contadores de la cola de correos del proceso.")
+registry.describe("outbox_jobs", "gauge", "Trabajos del outbox por estado.")
+
+
+# --- Peticiones HTTP ---
+
+class MetricsMiddleware:
+    """Mide cada petición HTTP y la registra con la plantilla de su ruta."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            labels = (("method", scope["method"]), ("route", route_template(scope)), ("status", str(status)))
+            registry.observe("http_request_duration_seconds", labels, perf_counter() - start)
+
+
+def route_template(scope: Scope) -> str:
+    """Ruta que atendió la petición; el router la deja en el mismo ``scope``."""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "") or "<unknown>"
+    if "endpoint" in scope:
+        # Aplicación montada (archivos estáticos): su prefijo
+        return f"{scope.get('root_path', '')}/{{path}}"
+    # Sin ruta: 404 o 405; no se usa la URL para no crear una serie por cada una
+    return "<unmatched>"
+
+
+# --- Operaciones de los CRUD ---
+
+# Dentro de una operación registrada las que llama no se registran aparte
+# (por ejemplo get_all_models -> get_all)
+_in_operation: ContextVar[bool] = ContextVar("crud_operation", default=False)
+
+T = TypeVar("T")
+
+
+def counts_documents(count: Callable[[Any], int]) -> Callable[[T], T]:
+    """Indica cómo contar los documentos del resultado de un método."""
+    def decorator(func: T) -> T:
+        func.__metrics_count__ = count  # type: ignore[attr-defined]
+        return func
+    return decorator
+
+
+def document_count(result: Any) -> Optional[int]:
+    """Documentos de un resultado típico de los CRUD; None si no se sabe."""
+    if result is None or result is False:
+        return 0
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        # (documentos, ids_inexistentes)
+        return len(result[0])
+    items = getattr(result, "items", None)
+    if isinstance(items, list):
+        # crud.pagination.Page
+        return len(items)
+    return None
+
+
+def _record(self: Any, operation: str, start: float, documents: Optional[int], error: bool = False) -> None:
+    collection = getattr(getattr(self, "_collection", None), "id", None) or type(self).__name__
+    labels = (("collection", collection), ("operation", operation))
+    registry.observe("crud_operation_duration_seconds", labels, perf_counter() - start)
+    if error:
+        registry.inc("crud_operation_errors_total", labels)
+    elif documents:
+        registry.inc("crud_documents_total", labels, documents)
+
+
+def _wrap(func: Callable[..., Any], operation: str) -> Callable[..., Any]:
+    count = getattr(func, "__metrics_count__", document_count)
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def async_generator(self, *args, **kwargs):
+            # El flag no se activa: entre un yield y otro corre el código de
+            # quien itera, cuyas operaciones sí se registran
+            if _in_operation.get():
+                async for item in func(self, *args, **kwargs):
+                    yield item
+                return
+            start, items, failed = perf_counter(), 0, False
+            try:
+                async for item in func(self, *args, **kwargs):
+                    items += count(item) or 0
+                    yield item
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # También si quien itera corta antes de terminar
+                _record(self, operation, start, items, error=failed)
+        return async_generator
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator(self, *args, **kwargs):
+            if _in_operation.get():
+                yield from func(self, *args, **kwargs)
+                return
+            start, items, failed = perf_counter(), 0, False
+            try:
+                for item in func(self, *args, **kwargs):
+                    items += count(item) or 0
+                    yield item
+            except Exception:
+                failed = True
+                raise
+            finally:
+                # También si quien itera corta antes de terminar
+                _record(self, operation, start, items, error=failed)
+        return generator
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def coroutine(self, *args, **kwargs):
+            if _in_operation.get():
+                return await func(self, *args, **kwargs)
+            token = _in_operation.set(True)
+            start = perf_counter()
+            try:
+                result = await func(self, *args, **kwargs)
+            except Exception:
+                _record(self, operation, start, None, error=True)
+                raise
+            finally:
+                _in_operation.reset(token)
+            _record(self, operation, start, count(result))
+            return result
+        return coroutine
+
+    @functools.wraps(func)
+    def method(self, *args, **kwargs):
+        if _in_operation.get():
+            return func(self, *args, **kwargs)
+        token = _in_operation.set(True)
+        start = perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+        except Exception:
+            _record(self, operation, start, None, error=True)
+            raise
+        finally:
+            _in_operation.reset(token)
+        _record(self, operation, start, count(result))
+        return result
+    return method
+
+
+C = TypeVar("C", bound=Type[Any])
+
+
+def instrumented(cls: C) -> C:
+    """Registra latencia, errores y documentos de los métodos públicos de ``cls``.
+
+    Solo envuelve los definidos en la propia clase; los heredados ya vienen
+    envueltos si la base también está marcada. La colección se toma de
+    ``self._collection``.
+    """
+    if not settings.METRICS_ENABLED:
+        return cls
+    for name, attr in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(attr):
+            continue
+        setattr(cls, name, _wrap(attr, name))
+    return cls
+
+
+# --- Gauges de otros componentes ---
+
+def _mailer_gauges() -> Iterable[Tuple[str, Labels, float]]:
+    from core.mailer import mailer
+
+    for name, value in mailer.stats().items():
+        yield "mailer_messages", (("state", name),), value
+
+
+def _outbox_gauges() -> Iterable[Tuple[str, Labels, float]]:
+    if not settings.OUTBOX_ENABLED:
+        return
+    from core.outbox import outbox
+
+    try:
+        counts = outbox.stats()
+    except sqlite3.Error:
+        return
+    for status, value in counts.items():
+        yield "outbox_jobs", (("status", status),), value
+
+
+registry.collector(_mailer_gauges)
+registry.collector(_outbox_gauges)
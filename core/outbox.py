@@ -0,0 +1,203 @@
+"""Outbox durable de trabajos en segundo plano sobre SQLite.
+
+Los endpoints solo insertan una fila (``outbox.enqueue``), algo barato y
+que sobrevive a reinicios del API. El worker (``python cli.py worker``)
+reclama trabajos con un lease que renueva mientras los ejecuta: si el
+proceso muere a mitad de un trabajo, al vencer el lease otro worker lo
+retoma. Los fallos se reintentan con
+backoff exponencial hasta ``OUTBOX_MAX_ATTEMPTS``; después, o si el error
+es permanente, el trabajo queda en ``dead`` para revisarlo y reencolarlo
+a mano (``python cli.py outbox retry``).
+
+La base usa WAL para que el API pueda insertar mientras el worker lee.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.config import settings
+
+PENDING = "pending"
+RUNNING = "running"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after);
+"""
+
+
+class PermanentJobError(Exception):
+    """Error que no se arregla reintentando; el trabajo pasa directo a ``dead``."""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+
+class Outbox:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.OUTBOX_PATH
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(_SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> int:
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload), max_attempts or settings.OUTBOX_MAX_ATTEMPTS, now, now, now),
+        )
+        return cursor.lastrowid
+
+    def enqueue_many(self, kind: str, payloads: Iterable[Dict[str, Any]], max_attempts: Optional[int] = None) -> int:
+        """Encola varios trabajos del mismo tipo en una sola transacción."""
+        now = time.time()
+        attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        rows = [(kind, json.dumps(payload), attempts, now, now, now) for payload in payloads]
+        if not rows:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def claim(self, limit: int, lease_seconds: Optional[float] = None) -> List[Job]:
+        """Reclama hasta ``limit`` trabajos listos, incluidos los de leases vencidos."""
+        if limit <= 0:
+            return []
+        now = time.time()
+        lease = settings.OUTBOX_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Un trabajo que agotó sus intentos y además tumbó a su worker
+            # no se vuelve a reclamar
+            conn.execute(
+                "UPDATE jobs SET status = ?, locked_until = NULL, updated_at = ?,"
+                " last_error = COALESCE(last_error, 'lease vencido')"
+                " WHERE status = ? AND locked_until <= ? AND attempts >= max_attempts",
+                (DEAD, now, RUNNING, now),
+            )
+            rows = conn.execute(
+                "SELECT id, kind, payload, attempts, max_attempts FROM jobs"
+                " WHERE (status = ? AND run_after <= ?) OR (status = ? AND locked_until <= ?)"
+                " ORDER BY run_after, id LIMIT ?",
+                (PENDING, now, RUNNING, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, updated_at = ?"
+                " WHERE id = ?",
+                [(RUNNING, now + lease, now, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            Job(id=row[0], kind=row[1], payload=json.loads(row[2]), attempts=row[3] + 1, max_attempts=row[4])
+            for row in rows
+        ]
+
+    def renew(self, jobs: Iterable[Job], lease_seconds: Optional[float] = None) -> None:
+        """Extiende el lease de trabajos que siguen en curso."""
+        now = time.time()
+        lease = settings.OUTBOX_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self._conn().executemany(
+            "UPDATE jobs SET locked_until = ?, updated_at = ? WHERE id = ? AND status = ?",
+            [(now + lease, now, job.id, RUNNING) for job in jobs],
+        )
+
+    def complete(self, job: Job) -> None:
+        self._conn().execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+    def fail(self, job: Job, error: str, permanent: bool = False) -> str:
+        """Registra el fallo; devuelve el nuevo estado (``pending`` o ``dead``)."""
+        now = time.time()
+        status = DEAD if permanent or job.attempts >= job.max_attempts else PENDING
+        run_after = now if status == DEAD else now + self._backoff(job.attempts)
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, run_after = ?, locked_until = NULL, last_error = ?, updated_at = ?"
+            " WHERE id = ?",
+            (status, run_after, error[:2000], now, job.id),
+        )
+        return status
+
+    def retry_dead(self, kind: Optional[str] = None) -> int:
+        """Vuelve a encolar los trabajos en ``dead`` con los intentos en cero."""
+        now = time.time()
+        query = "UPDATE jobs SET status = ?, attempts = 0, run_after = ?, updated_at = ? WHERE status = ?"
+        params: List[Any] = [PENDING, now, now, DEAD]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        return self._conn().execute(query, params).rowcount
+
+    def dead(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT id, kind, attempts, last_error, updated_at FROM jobs WHERE status = ?"
+            " ORDER BY updated_at DESC LIMIT ?",
+            (DEAD, limit),
+        ).fetchall()
+        return [
+            {"id": r[0], "kind": r[1], "attempts": r[2], "last_error": r[3], "updated_at": r[4]}
+            for r in rows
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        counts = dict.fromkeys((PENDING, RUNNING, DEAD), 0)
+        counts.update(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return counts
+
+
+outbox = Outbox()
@@ -0,0 +1,143 @@
+"""Recordatorios de citas por correo.
+
+Cada ejecución (``python cli.py reminders``, desde cron o con ``--every``)
+lee solo las citas con recordatorio pendiente cuya ``fechaHora`` cae en
+las próximas ``REMINDER_LEAD_HOURS`` horas, con una consulta de rango
+paginada, en vez de recorrer todas las citas. Por cada página se leen los
+correos de los pacientes con un solo ``get_all``, se marcan las citas como
+recordadas en un batch y se encolan los correos en el outbox.
+
+La marca se escribe antes de encolar: una cita nunca se recuerda dos
+veces, aunque dos ejecuciones se crucen o una se corte a la mitad. Si se
+agota ``REMINDER_TICK_BUDGET_SECONDS`` la ejecución termina y la
+siguiente sigue con lo que quede pendiente.
+
+Se respeta ``notificaciones.recordatoriosCitas`` de la configuración.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from core.config import settings
+from core.jobs import send_emails
+from core.mailer import EmailTemplate, mailer
+from crud.firebase_crud import (
+    FECHA_HORA_FORMAT,
+    FirebaseAppointmentCRUD,
+    FirebasePatientCRUD,
+    FirebaseSettingsCRUD,
+)
+
+logger = logging.getLogger(__name__)
+
+REMINDER_EMAIL = EmailTemplate(
+    subject="Recordatorio: cita de {{pacienteNombre}} el {{fecha}}",
+    body="""
+    <html>
+      <head><meta charset="UTF-8" /></head>
+      <body style="font-family: system-ui, -apple-system, 'Segoe UI', sans-serif; color: #0f172a; font-size: 14px; line-height: 1.6;">
+        <p>Hola <strong>{{propietario}}</strong>,</p>
+        <p>
+          Te recordamos la cita de <strong>{{pacienteNombre}}</strong> el
+          <strong>{{fecha}}</strong> a las <strong>{{hora}}</strong> ({{motivo}}).
+        </p>
+        <p>
+          Si necesitas <strong>modificar</strong> o <strong>cancelar</strong> la cita, por favor contacta con nuestra clínica por nuestros canales habituales.
+        </p>
+        <p style="font-size: 12px; color: #6b7280;">
+          Este es un mensaje automático, por favor no respondas directamente a este correo.<br />
+          VetClinic Pro · Centro Veterinario
+        </p>
+      </body>
+    </html>
+    """,
+)
+
+
+@dataclass
+class ReminderRun:
+    # False si los recordatorios están desactivados o falta configurar SMTP
+    enabled: bool = True
+    pages: int = 0
+    scanned: int = 0
+    queued: int = 0
+    # Citas sin correo del tutor: se marcan igual para no volver a leerlas
+    skipped: int = 0
+    # False si se cortó por el presupuesto de tiempo
+    complete: bool = True
+    elapsed_seconds: float = 0.0
+
+
+def reminders_enabled(settings_crud: FirebaseSettingsCRUD) -> bool:
+    config = settings_crud.get() or {}
+    # Sin configuración guardada vale el valor por defecto de GET /settings
+    return bool((config.get("notificaciones") or {}).get("recordatoriosCitas", True))
+
+
+def hora_am_pm(hora: str) -> str:
+    """Formatea la hora a AM/PM si es posible (por ejemplo 10:00 AM)."""
+    try:
+        return datetime.strptime(hora, "%H:%M").strftime("%I:%M %p")
+    except (TypeError, ValueError):
+        # Si falla el parseo, se deja la hora original
+        return hora
+
+
+def run_reminders(
+    now: Optional[datetime] = None,
+    budget_seconds: Optional[float] = None,
+    page_size: Optional[int] = None,
+) -> ReminderRun:
+    """Envía los recordatorios de la ventana actual; ver el docstring del módulo."""
+    started = time.monotonic()
+    budget = settings.REMINDER_TICK_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+    run = ReminderRun()
+    # Sin SMTP no se marca nada, para no perder los recordatorios
+    if not mailer.configured or not reminders_enabled(FirebaseSettingsCRUD()):
+        run.enabled = False
+        return run
+
+    appointments = FirebaseAppointmentCRUD()
+    patients = FirebasePatientCRUD()
+    # Misma hora local (sin zona) con la que se validan las citas al crearlas
+    now = now or datetime.now()
+    start = now.strftime(FECHA_HORA_FORMAT)
+    end = (now + timedelta(hours=settings.REMINDER_LEAD_HOURS)).strftime(FECHA_HORA_FORMAT)
+
+    for page in appointments.iter_reminder_pages(start, end, page_size):
+        found, _ = patients.get_many([a["pacienteId"] for a in page if a.get("pacienteId")])
+        emails = {p["id"]: p.get("tutor_email") or p.get("email") for p in found}
+
+        messages: List[Tuple[str, str, str]] = []
+        sent_ids: List[str] = []
+        for appointment in page:
+            to = emails.get(appointment.get("pacienteId"))
+            if not to or appointment.get("estado") != "pendiente":
+                continue
+            subject, body = REMINDER_EMAIL.render(
+                pacienteNombre=appointment.get("pacienteNombre", ""),
+                propietario=appointment.get("propietario", ""),
+                fecha=appointment.get("fecha", ""),
+                hora=hora_am_pm(appointment.get("hora", "")),
+                motivo=appointment.get("motivo", ""),
+            )
+            messages.append((to, subject, body))
+            sent_ids.append(appointment["id"])
+
+        appointments.mark_reminded(page, sent_ids)
+        run.queued += send_emails(messages)
+        run.pages += 1
+        run.scanned += len(page)
+        run.skipped += len(page) - len(sent_ids)
+
+        if time.monotonic() - started > budget:
+            run.complete = False
+            logger.warning("Recordatorios: presupuesto agotado tras %s citas; sigue en la próxima ejecución",
+                           run.scanned)
+            break
+
+    run.elapsed_seconds = round(time.monotonic() - started, 3)
+    return run
@@ -1,37 +1,155 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import Any, Dict, Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from crud.firebase_crud import FirebaseUserCRUD
+from core.cache import VersionedTTLCache
+from core.config import settings
+from crud.async_firebase_crud import AsyncFirebaseTokenRevocationCRUD, AsyncFirebaseUserCRUD
 from models.user import User
 
 
+logger = logging.getLogger(__name__)
+
 security = HTTPBearer()
 
+_ALGORITHM = "HS256"
+_HEADER = {"alg": _ALGORITHM, "typ": "JWT"}
 
-def _extract_user_id_from_token(token: str) -> str:
-    prefix = "fake-token-for-"
-    if not token.startswith(prefix):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-        )
-    return token[len(prefix) :]
+if settings.SECRET_KEY:
+    _secret_key = settings.SECRET_KEY.encode()
+elif settings.ALLOW_EPHEMERAL_SECRET_KEY:
+    logger.warning("SECRET_KEY no está configurado; se usa una clave aleatoria por proceso (solo desarrollo)")
+    _secret_key = secrets.token_bytes(32)
+else:
+    # Sin clave fija cada worker firmaría con una distinta
+    raise RuntimeError(
+        "SECRET_KEY no está configurado; para desarrollo local usa ALLOW_EPHEMERAL_SECRET_KEY=true"
+    )
+
+# Usuarios leídos de Firestore para tokens revocados; evita repetir la
+# lectura en cada petición mientras el cliente no renueve su token. La
+# clave incluye la fecha de revocación: una revocación nueva (hecha en
+# cualquier proceso) no encuentra el usuario guardado por la anterior.
+_user_cache = VersionedTTLCache(
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(signing_input: bytes) -> str:
+    return _b64encode(hmac.new(_secret_key, signing_input, hashlib.sha256).digest())
+
+
+def _invalid_token(detail: str = "Token inválido") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def create_access_token(user: Dict[str, Any]) -> str:
+    """Emite un token firmado (formato JWT HS256) con el rol del usuario."""
+
+    now = int(time.time())
+    claims = {
+        "sub": user["id"],
+        "role": user.get("role", ""),
+        "name": user.get("name", ""),
+        "email": user.get("email", ""),
+        "iat": now,
+        "exp": now + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+    header = _b64encode(json.dumps(_HEADER, separators=(",", ":")).encode())
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = f"{header}.{payload}".encode()
+    return f"{header}.{payload}.{_sign(signing_input)}"
 
 
-def get_current_user(
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Verifica firma y expiración del token y devuelve sus claims."""
+
+    try:
+        header_b64, payload_b64, signature = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(payload_b64))
+    except (ValueError, TypeError):
+        raise _invalid_token()
+
+    # JSON válido pero que no es un objeto (por ejemplo "[]" o "1")
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise _invalid_token()
+
+    if header.get("alg") != _ALGORITHM:
+        raise _invalid_token()
+
+    expected = _sign(f"{header_b64}.{payload_b64}".encode())
+    if not hmac.compare_digest(expected, signature):
+        raise _invalid_token()
+
+    if not isinstance(claims.get("sub"), str) or not isinstance(claims.get("exp"), int):
+        raise _invalid_token()
+    if claims["exp"] < time.time():
+        raise _invalid_token("Token expirado")
+    return claims
+
+
+async def revoke_user_tokens(user_id: str) -> None:
+    """Deja de confiar en los claims de los tokens ya emitidos para el usuario.
+
+    Esos tokens siguen siendo válidos mientras el usuario exista, pero su
+    rol se vuelve a leer de Firestore. La revocación se guarda en Firestore
+    y la ven todos los procesos (ver ``AsyncFirebaseTokenRevocationCRUD``).
+    """
+
+    await AsyncFirebaseTokenRevocationCRUD().revoke(user_id)
+
+
+async def _load_user(user_id: str, revoked_at: float) -> Optional[User]:
+    return await _user_cache.aget_or_load(
+        (user_id, revoked_at), lambda: AsyncFirebaseUserCRUD().get_model_by_id(user_id)
+    )
+
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> User:
-    """Obtiene el usuario actual a partir del token simple de autenticación.
+    """Obtiene el usuario actual a partir del token firmado.
 
-    Por ahora se usa un token "fake-token-for-<user_id>". Más adelante
-    se puede reemplazar por JWT u otra solución.
+    Normalmente el usuario se construye con los claims del token, sin
+    consultar Firestore. Solo si el usuario fue modificado o borrado
+    después de emitir el token se vuelve a leer (con caché acotada).
     """
 
-    token = credentials.credentials
-    user_id = _extract_user_id_from_token(token)
+    claims = decode_access_token(credentials.credentials)
+    user_id = claims["sub"]
+
+    revoked_at = await AsyncFirebaseTokenRevocationCRUD().revoked_at(user_id)
+    if revoked_at is None or int(claims.get("iat", 0)) > revoked_at:
+        return User(
+            id=user_id,
+            email=claims.get("email", ""),
+            name=claims.get("name", ""),
+            role=claims.get("role", ""),
+        )
 
-    crud = FirebaseUserCRUD()
-    user_model = crud.get_model_by_id(user_id)
+    user_model = await _load_user(user_id, revoked_at)
     if user_model is None or user_model.id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -41,7 +159,7 @@ def get_current_user(
     return user_model
 
 
-def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
     """Dependencia que asegura que el usuario actual tenga rol admin."""
 
     if current_user.role != "admin":
@@ -0,0 +1,81 @@
+"""Serialización rápida de listados grandes.
+
+Con ``response_model`` FastAPI valida cada item, lo convierte a un dict
+con tipos JSON y recién entonces lo codifica con ``json.dumps``. Para los
+listados grandes (catálogo, pacientes) ``ListSerializer`` ofrece dos
+caminos más cortos, activables con ``JSON_FAST_PATH``:
+
+* ``validated``: un ``TypeAdapter`` precompilado valida y escribe el JSON
+  directamente desde pydantic-core, sin el paso intermedio por dicts. La
+  salida es la misma que con ``response_model``.
+* ``trusted``: para datos que ya pasaron por nuestros esquemas al
+  guardarse; solo se eligen los campos del modelo (con sus valores por
+  defecto) y se codifica con orjson, sin volver a validar.
+
+El ``response_model`` de cada ruta se mantiene, así que el contrato de
+OpenAPI no cambia. Ver ``benchmarks/bench_serialization.py``.
+"""
+
+from datetime import date, datetime
+from typing import Any, Iterable, List, Literal, Mapping, Optional, Type, Union
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from core.config import settings
+
+JsonFastPath = Literal["off", "validated", "trusted"]
+
+
+def _default(value: Any) -> Any:
+    # orjson no serializa subclases de datetime, como las de Firestore
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable a JSON: {type(value).__name__}")
+
+
+class ListSerializer:
+    """Serializador precompilado de ``List[model]``."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self._adapter = TypeAdapter(List[model])
+        self._fields = [
+            (name, None if field.is_required() else field.get_default(call_default_factory=True))
+            for name, field in model.model_fields.items()
+        ]
+
+    def dump_validated(self, items: Iterable[dict]) -> bytes:
+        return self._adapter.dump_json(self._adapter.validate_python(list(items)))
+
+    def dump_trusted(self, items: Iterable[dict]) -> bytes:
+        fields = self._fields
+        return orjson.dumps(
+            [{name: item.get(name, default) for name, default in fields} for item in items],
+            default=_default,
+        )
+
+    def dump(self, items: List[dict], mode: Optional[JsonFastPath] = None) -> bytes:
+        """Codifica la lista; con el modo ``off`` usa el camino validado,
+        que produce el mismo JSON que el response_model."""
+        mode = mode or settings.JSON_FAST_PATH
+        return self.dump_trusted(items) if mode == "trusted" else self.dump_validated(items)
+
+    def render(
+        self,
+        items: List[dict],
+        headers: Optional[Mapping[str, str]] = None,
+        mode: Optional[JsonFastPath] = None,
+    ) -> Union[List[dict], Response]:
+        """Devuelve la respuesta ya codificada o, con el modo ``off``, los items.
+
+        En el modo ``off`` FastAPI sigue serializando con el
+        ``response_model`` de la ruta como siempre. Al devolver una
+        ``Response`` propia FastAPI ignora las cabeceras puestas en el
+        parámetro ``response`` de la ruta, por eso se copian con ``headers``.
+        """
+        mode = mode or settings.JSON_FAST_PATH
+        if mode == "off":
+            return items
+        return Response(content=self.dump(items, mode), media_type="application/json", headers=dict(headers or {}))
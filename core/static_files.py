@@ -0,0 +1,114 @@
+"""Archivos estáticos con caché agresiva y negociación de formato.
+
+Las imágenes de productos se publican con el hash del contenido en el
+nombre (``{id}-{hash}.jpg``), así que esas URLs se sirven como inmutables
+durante un año y con un ETag fuerte derivado del nombre. El resto de los
+archivos se revalida en cada uso con el ETag de Starlette.
+
+Si existe una copia precalculada que el cliente acepta se sirve esa en su
+lugar: ``archivo.webp`` con ``Accept: image/webp`` y ``archivo.br`` o
+``archivo.gz`` según ``Accept-Encoding``.
+"""
+
+import mimetypes
+import os
+import re
+import stat
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from core.compression import accepts
+from core.images import HASH_LENGTH, WEBP_SUFFIX
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# {id}-{hash}[_{versión}].{ext}[.webp|.br|.gz]
+_HASHED_NAME = re.compile(rf"-[0-9a-f]{{{HASH_LENGTH}}}(?:_[a-z]+)?(?:\.[a-z0-9]+)+$")
+
+_WEBP_SOURCES = {".jpg", ".jpeg", ".png"}
+_COMPRESSIBLE = {".css", ".js", ".json", ".svg", ".txt", ".html", ".xml"}
+
+# (sufijo, codificación) en orden de preferencia
+_ENCODINGS = ((".br", "br"), (".gz", "gzip"))
+
+
+def _vary(path: str) -> Optional[str]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _WEBP_SOURCES:
+        return "Accept"
+    if ext in _COMPRESSIBLE:
+        return "Accept-Encoding"
+    return None
+
+
+def _alternatives(path: str, request_headers: Headers) -> List[Tuple[str, Dict[str, str]]]:
+    """Copias precalculadas de ``path`` que el cliente acepta, en orden de preferencia."""
+    vary = _vary(path)
+    if vary == "Accept":
+        if accepts(request_headers.get("accept", ""), "image/webp"):
+            return [(WEBP_SUFFIX, {"media_type": "image/webp"})]
+    elif vary == "Accept-Encoding":
+        accept_encoding = request_headers.get("accept-encoding", "")
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return [
+            (suffix, {"media_type": media_type, "encoding": encoding})
+            for suffix, encoding in _ENCODINGS
+            if accepts(accept_encoding, encoding)
+        ]
+    return []
+
+
+class CachedStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            for suffix, options in _alternatives(path, Headers(scope=scope)):
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    options.setdefault("vary", _vary(path))
+                    return self.file_response(full_path, stat_result, scope, **options)
+        return await super().get_response(path, scope)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+        media_type: Optional[str] = None,
+        encoding: Optional[str] = None,
+        vary: Optional[str] = None,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        name = os.path.basename(full_path)
+        headers: Dict[str, str] = {}
+
+        if _HASHED_NAME.search(name):
+            # El nombre cambia con el contenido: el ETag puede ser el nombre
+            # del archivo servido y no hace falta revalidar
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+            headers["etag"] = f'"{name}"'
+        else:
+            headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+
+        vary = vary or _vary(name)
+        if vary:
+            headers["vary"] = vary
+        if encoding:
+            headers["content-encoding"] = encoding
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers=headers,
+            media_type=media_type,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
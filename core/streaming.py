@@ -0,0 +1,65 @@
+from typing import AsyncIterable, AsyncIterator, Literal, Type
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+ExportFormat = Literal["ndjson", "json"]
+
+# Se acumulan las líneas hasta este tamaño antes de enviarlas, para no
+# escribir en el socket por cada documento.
+FLUSH_BYTES = 16 * 1024
+
+
+async def _buffered(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _ndjson(docs: AsyncIterable[dict], model: Type[BaseModel]) -> AsyncIterator[bytes]:
+    async for doc in docs:
+        yield model.model_validate(doc).model_dump_json().encode() + b"\n"
+
+
+async def _json_array(docs: AsyncIterable[dict], model: Type[BaseModel]) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    async for doc in docs:
+        if not first:
+            yield b","
+        first = False
+        yield model.model_validate(doc).model_dump_json().encode()
+    yield b"]"
+
+
+def stream_documents(
+    docs: AsyncIterable[dict],
+    model: Type[BaseModel],
+    fmt: ExportFormat = "ndjson",
+    filename: str = "export",
+) -> StreamingResponse:
+    """Serializa cada documento en cuanto llega y lo escribe en la respuesta.
+
+    Cada documento se valida con ``model`` (igual que el listado normal)
+    pero nunca se construye la lista completa, así que la memoria se
+    mantiene constante y el primer byte sale antes de terminar la lectura.
+    """
+    if fmt == "json":
+        body = _json_array(docs, model)
+        media_type = "application/json"
+        extension = "json"
+    else:
+        body = _ndjson(docs, model)
+        media_type = "application/x-ndjson"
+        extension = "ndjson"
+
+    return StreamingResponse(
+        _buffered(body),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
@@ -0,0 +1,788 @@
+"""Variante asíncrona de los CRUD de ``crud.firebase_crud``.
+
+Usa el ``AsyncClient`` de Firestore para que los endpoints ``async def``
+no ocupen un hilo del threadpool mientras esperan la red. Qué se escribe
+en cada alta, cambio o baja (resúmenes, horarios, stock repartido) y cómo
+se ponen al día las cachés e índices viene de los mixins ``*Writes`` de la
+versión síncrona; aquí solo se espera a Firestore.
+"""
+
+import copy
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Hashable, Iterable, List, Optional, Any, Tuple
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore import DELETE_FIELD, FieldFilter, async_transactional
+from core.config import settings
+from core.metrics import counts_documents, instrumented
+from database.firebase_client import get_async_firestore_client, get_firestore_client
+from crud.firebase_crud import (
+    AppointmentWrites,
+    CollectionWrites,
+    FirebaseUserCRUD,
+    EmptyCartError,
+    ORDER_SUMMARY_FIELDS,
+    OrderWrites,
+    PatientWrites,
+    ProductUnavailableError,
+    ProductWrites,
+    WriteConflictError,
+    apply_shard_sums,
+    cart_from_doc,
+    cart_line_write,
+    deep_merge,
+    fold_legacy_items,
+    shard_count,
+    shard_refs,
+    shard_visit_order,
+    stage_cart_migration,
+    validate_stock_shards,
+)
+from crud.pagination import (
+    DEFAULT_PAGE_SIZE,
+    Page,
+    QueryFilter,
+    apply_cursor,
+    build_page,
+    build_query,
+)
+from crud.reports import REPORT_SHARDS_COLLECTION, REPORTS_COLLECTION, sum_report_docs
+from crud.catalog_index import catalog_index
+from models.product import Product
+from models.user import User
+
+
+@instrumented
+class AsyncBaseFirestoreCRUD(CollectionWrites):
+    """Operaciones comunes asíncronas sobre una colección; ver ``BaseFirestoreCRUD``."""
+
+    def __init__(self):
+        self._db = get_async_firestore_client()
+        self._collection = self._db.collection(self.collection_name)
+
+    async def get_all(self) -> List[dict]:
+        return [{**d.to_dict(), "id": d.id} async for d in self._collection.stream()]
+
+    async def get_by_id(self, doc_id: str) -> Optional[dict]:
+        doc = await self._collection.document(doc_id).get()
+        if not doc.exists:
+            return None
+        return {**doc.to_dict(), "id": doc.id}
+
+    async def create(self, data: Dict[str, Any]) -> dict:
+        data = self._prepare(data)
+        doc_ref = self._collection.document()
+        batch = self._db.batch()
+        self._stage_create(batch, doc_ref, data)
+        try:
+            await batch.commit()
+        except AlreadyExists as exc:
+            raise self._already_exists(exc)
+        created = {**data, "id": doc_ref.id}
+        self._written(doc_ref.id, created)
+        return created
+
+    async def get_many(self, ids: List[str]) -> Tuple[List[dict], List[str]]:
+        """Lee varios documentos en una sola llamada ``get_all``.
+
+        Devuelve (documentos, ids_inexistentes) en el orden de ``ids``.
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        if not unique_ids:
+            return [], []
+        refs = [self._collection.document(doc_id) for doc_id in unique_ids]
+        found = {
+            snap.id: {**snap.to_dict(), "id": snap.id}
+            async for snap in self._db.get_all(refs)
+            if snap.exists
+        }
+        items = [found[doc_id] for doc_id in unique_ids if doc_id in found]
+        missing = [doc_id for doc_id in unique_ids if doc_id not in found]
+        return items, missing
+
+    async def update(self, doc_id: str, data: Dict[str, Any]) -> Optional[dict]:
+        """Lectura + escritura con precondición ``last_update_time``.
+
+        Ver ``BaseFirestoreCRUD.update``.
+        """
+        doc_ref = self._collection.document(doc_id)
+        for _ in range(self._UPDATE_ATTEMPTS):
+            snapshot = await doc_ref.get()
+            if not snapshot.exists:
+                return None
+            if not data:
+                return {**(snapshot.to_dict() or {}), "id": doc_id}
+            batch = self._db.batch()
+            merged = self._stage_update(batch, doc_ref, snapshot, data)
+            try:
+                await batch.commit()
+            except NotFound:
+                return None
+            except FailedPrecondition:
+                continue
+            except AlreadyExists as exc:
+                raise self._already_exists(exc)
+            updated = {**merged, "id": doc_id}
+            self._written(doc_id, updated)
+            return updated
+        raise self._write_conflict(doc_ref)
+
+    async def delete(self, doc_id: str) -> bool:
+        """Ver ``BaseFirestoreCRUD.delete``."""
+        doc_ref = self._collection.document(doc_id)
+        if not self._reads_before_delete():
+            try:
+                await doc_ref.delete(option=self._db.write_option(exists=True))
+            except NotFound:
+                return False
+            self._removed(doc_id)
+            return True
+
+        for _ in range(self._UPDATE_ATTEMPTS):
+            snapshot = await doc_ref.get()
+            if not snapshot.exists:
+                return False
+            batch = self._db.batch()
+            self._stage_delete(batch, doc_ref, snapshot)
+            try:
+                await batch.commit()
+            except NotFound:
+                return False
+            except FailedPrecondition:
+                continue
+            self._removed(doc_id)
+            return True
+        raise self._write_conflict(doc_ref)
+
+    async def get_page(
+        self,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        filters: Optional[List[QueryFilter]] = None,
+    ) -> Page:
+        """Ver ``BaseFirestoreCRUD.get_page``."""
+        query, order_field = build_query(self._collection, filters, order_by, descending)
+        query = apply_cursor(query, cursor, order_field)
+
+        if limit is None:
+            return Page(items=[{**d.to_dict(), "id": d.id} async for d in query.stream()])
+
+        docs = [d async for d in query.limit(limit + 1).stream()]
+        return build_page(docs, limit, order_field)
+
+    async def iter_all(self, filters: Optional[List[QueryFilter]] = None) -> AsyncIterator[dict]:
+        """Recorre la colección documento a documento sin materializarla."""
+        query, _ = build_query(self._collection, filters)
+        async for d in query.stream():
+            yield {**d.to_dict(), "id": d.id}
+
+
+@instrumented
+class AsyncFirebaseProductCRUD(ProductWrites, AsyncBaseFirestoreCRUD):
+    """Productos; comparte con ``FirebaseProductCRUD`` las cachés del proceso."""
+
+    async def _with_sharded_stock(self, items: List[dict]) -> List[dict]:
+        """Reemplaza ``stock`` por la suma de los shards en los productos repartidos."""
+        refs, owners = self._shard_reads(items)
+        if refs:
+            snapshots = [snap async for snap in self._db.get_all(refs)]
+            apply_shard_sums(items, owners, snapshots, self.stock_cache)
+        return items
+
+    async def get_all(self) -> List[dict]:
+        return await self._with_sharded_stock(await super().get_all())
+
+    async def get_page(
+        self,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        filters: Optional[List[QueryFilter]] = None,
+    ) -> Page:
+        page = await super().get_page(limit, cursor, order_by, descending, filters)
+        await self._with_sharded_stock(page.items)
+        return page
+
+    async def get_catalog_page(
+        self,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        filters: Optional[List[QueryFilter]] = None,
+    ) -> Page:
+        """Versión cacheada de ``get_page`` con los productos ya normalizados."""
+        async def load() -> Page:
+            return self._catalog_page(await self.get_page(limit, cursor, order_by, descending, filters))
+
+        key = self._catalog_key(limit, cursor, order_by, descending, filters)
+        return await self.catalog_cache.aget_or_load(key, load)
+
+    async def get_by_id(self, product_id: str) -> Optional[dict]:
+        async def load() -> Optional[dict]:
+            data = await super(AsyncFirebaseProductCRUD, self).get_by_id(product_id)
+            if data is None:
+                return None
+            return (await self._with_sharded_stock([data]))[0]
+
+        data = await self.catalog_cache.aget_or_load(("id", product_id), load)
+        return dict(data) if data is not None else None
+
+    async def get_many(self, ids: List[str]) -> Tuple[List[dict], List[str]]:
+        """Solo pide a Firestore los productos que no estén en caché."""
+        unique_ids, cached, pending = self._split_cached(ids)
+        if pending:
+            generation = self.catalog_cache.generation
+            fetched, missing = await super().get_many(pending)
+            await self._with_sharded_stock(fetched)
+            self._cache_fetched(cached, generation, fetched, missing)
+        return self._in_order(unique_ids, cached)
+
+    async def update(self, product_id: str, data: Dict[str, Any]) -> Optional[dict]:
+        """Ver ``FirebaseProductCRUD.update``."""
+        updated = await super().update(product_id, data)
+        if updated is None or not self._sharded_update(product_id, data, updated):
+            return updated
+        updated = (await self._with_sharded_stock([updated]))[0]
+        catalog_index.upsert(product_id, updated)
+        return updated
+
+    async def set_stock_shards(
+        self, product_id: str, shards: int, stock: Optional[int] = None
+    ) -> Optional[dict]:
+        """Ver ``FirebaseProductCRUD.set_stock_shards``."""
+        validate_stock_shards(shards)
+        product_ref = self._collection.document(product_id)
+
+        @async_transactional
+        async def _run(transaction) -> Optional[dict]:
+            snapshot = await product_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            data = snapshot.to_dict() or {}
+            old_refs = shard_refs(product_ref, int(data.get("stock_shards") or 0))
+            if stock is not None:
+                total = int(stock)
+            elif old_refs:
+                total = sum([
+                    shard_count(s) async for s in self._db.get_all(old_refs, transaction=transaction)
+                ])
+            else:
+                total = int(data.get("stock", 0))
+            return self._stage_stock_shards(transaction, product_ref, data, shards, total)
+
+        updated = await _run(self._db.transaction())
+        if updated is not None:
+            self._stock_shards_written(product_id, updated)
+        return updated
+
+    async def get_model_by_id(self, product_id: str) -> Optional[Product]:
+        data = await self.get_by_id(product_id)
+        if data is None:
+            return None
+        return Product.from_dict(data)
+
+
+@instrumented
+class AsyncFirebaseUserCRUD(AsyncBaseFirestoreCRUD):
+    collection_name = "users"
+
+    to_model = staticmethod(FirebaseUserCRUD.to_model)
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        query = self._collection.where(filter=FieldFilter("email", "==", email)).limit(1)
+        async for d in query.stream():
+            return {**d.to_dict(), "id": d.id}
+        return None
+
+    async def get_model_by_id(self, user_id: str) -> Optional[User]:
+        data = await self.get_by_id(user_id)
+        if data is None:
+            return None
+        return self.to_model(data)
+
+
+@instrumented
+class AsyncFirebasePatientCRUD(PatientWrites, AsyncBaseFirestoreCRUD):
+    """Pacientes; las escrituras actualizan el índice de búsqueda (crud.search)."""
+
+
+@instrumented
+class AsyncFirebaseAppointmentCRUD(AppointmentWrites, AsyncBaseFirestoreCRUD):
+    """Citas con reserva de horario; ver ``AppointmentWrites``."""
+
+
+@instrumented
+class AsyncFirebaseAppointmentRequestCRUD(AsyncBaseFirestoreCRUD):
+    collection_name = "appointment_requests"
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Una versión de la configuración global cargada en memoria.
+
+    No se modifica nunca: cada recarga, escritura o aviso del listener
+    publica una versión nueva reemplazando la referencia, así que una
+    petición siempre ve una configuración completa. ``derive`` guarda
+    valores calculados a partir de la versión (el JSON de GET /settings),
+    que se descartan junto con ella.
+    """
+
+    # Documento guardado; None si todavía no existe
+    data: Optional[Dict[str, Any]]
+    update_time: Any
+    loaded_at: float
+    derived: Dict[Hashable, Any] = field(default_factory=dict, compare=False)
+
+    def derive(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        if key not in self.derived:
+            self.derived[key] = factory()
+        return self.derived[key]
+
+
+@instrumented
+class AsyncFirebaseSettingsCRUD:
+    """Configuración global (``settings/global-config``) servida desde memoria.
+
+    Las lecturas usan la versión publicada sin ir a Firestore. Con el
+    listener activo (``start_listener``, al arrancar el API) cada cambio,
+    también los hechos desde otro proceso, publica una versión nueva; sin
+    listener la versión se vuelve a leer al pasar
+    ``SETTINGS_CACHE_TTL_SECONDS``.
+
+    ``update`` fusiona los cambios sobre la versión en memoria y escribe una
+    sola vez con la precondición ``last_update_time``; si otro escritor se
+    adelantó, se recarga y se reintenta.
+    """
+
+    COLLECTION = "settings"
+    DOC_ID = "global-config"
+
+    _UPDATE_ATTEMPTS = 5
+
+    # Compartidos por todas las instancias del proceso
+    _current: Optional[SettingsSnapshot] = None
+    _publish_lock = threading.Lock()
+    _watch = None
+
+    def __init__(self):
+        self._db = get_async_firestore_client()
+        self._collection = self._db.collection(self.COLLECTION)
+        self._doc_id = self.DOC_ID
+
+    @classmethod
+    def _publish(cls, data: Optional[Dict[str, Any]], update_time: Any) -> SettingsSnapshot:
+        # El listener corre en su propio hilo: se compara y reemplaza bajo lock
+        with cls._publish_lock:
+            current = cls._current
+            if current is not None and current.update_time is not None and update_time is not None:
+                if update_time < current.update_time:
+                    # Aviso atrasado respecto de una escritura local
+                    return current
+                if update_time == current.update_time:
+                    # Misma versión: se conserva lo ya calculado a partir de ella
+                    cls._current = replace(current, loaded_at=time.monotonic())
+                    return cls._current
+            cls._current = SettingsSnapshot(data=data, update_time=update_time, loaded_at=time.monotonic())
+            return cls._current
+
+    @classmethod
+    def _is_fresh(cls, snapshot: SettingsSnapshot) -> bool:
+        if cls._watch is not None and cls._watch.is_active:
+            return True
+        return time.monotonic() - snapshot.loaded_at < settings.SETTINGS_CACHE_TTL_SECONDS
+
+    async def snapshot(self, refresh: bool = False) -> SettingsSnapshot:
+        current = self._current
+        if current is not None and not refresh and self._is_fresh(current):
+            return current
+        doc = await self._collection.document(self._doc_id).get()
+        if not doc.exists:
+            return self._publish(None, None)
+        return self._publish(doc.to_dict(), doc.update_time)
+
+    async def get(self) -> Optional[dict]:
+        data = (await self.snapshot()).data
+        return copy.deepcopy(data) if data is not None else None
+
+    async def update(self, changes: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> SettingsSnapshot:
+        """Aplica un cambio parcial y devuelve la versión publicada.
+
+        Se escribe la configuración completa: ``defaults`` < lo guardado <
+        ``changes``, fusionados sección por sección (ver ``deep_merge``).
+        """
+        doc_ref = self._collection.document(self._doc_id)
+        refresh = False
+        for _ in range(self._UPDATE_ATTEMPTS):
+            current = await self.snapshot(refresh=refresh)
+            merged = deep_merge(deep_merge(defaults or {}, current.data or {}), changes)
+            try:
+                if current.data is None:
+                    result = await doc_ref.create(merged)
+                else:
+                    option = self._db.write_option(last_update_time=current.update_time)
+                    result = await doc_ref.update(merged, option=option)
+            except (AlreadyExists, FailedPrecondition, NotFound):
+                # La versión en memoria quedó vieja (otro proceso escribió)
+                refresh = True
+                continue
+            return self._publish(merged, result.update_time)
+        raise WriteConflictError(doc_ref.path)
+
+    @classmethod
+    def start_listener(cls) -> None:
+        """Mantiene la versión al día con un listener de Firestore.
+
+        ``on_snapshot`` solo existe en el cliente síncrono; sus avisos
+        llegan en un hilo propio del cliente.
+        """
+        if cls._watch is not None or not settings.SETTINGS_LISTENER:
+            return
+
+        def on_snapshot(docs, changes, read_time) -> None:
+            doc = docs[0] if docs else None
+            if doc is not None and doc.exists:
+                cls._publish(doc.to_dict(), doc.update_time)
+            else:
+                cls._publish(None, None)
+
+        doc_ref = get_firestore_client().collection(cls.COLLECTION).document(cls.DOC_ID)
+        cls._watch = doc_ref.on_snapshot(on_snapshot)
+
+    @classmethod
+    def stop_listener(cls) -> None:
+        watch, cls._watch = cls._watch, None
+        if watch is not None:
+            watch.unsubscribe()
+
+
+@instrumented
+class AsyncFirebaseTokenRevocationCRUD:
+    """Usuarios cuyos tokens emitidos antes de cierta fecha ya no son fiables.
+
+    Cada revocación (cambio de rol, borrado...) es un documento
+    ``token_revocations/{user_id}`` con ``revoked_at`` (epoch), así la ve
+    cualquier proceso. Las consultas usan la lista en memoria: con el
+    listener activo (``start_listener``, al arrancar el API) llegan al
+    momento las revocaciones de todos los workers; sin él la colección se
+    vuelve a leer al pasar ``TOKEN_REVOCATIONS_CACHE_TTL_SECONDS``.
+
+    Una entrada solo importa mientras pueda existir un token vigente emitido
+    antes de ella; las vencidas se borran junto con la siguiente revocación.
+    """
+
+    COLLECTION = "token_revocations"
+
+    # Máximo de entradas vencidas que se borran en cada revocación
+    _PRUNE_BATCH = 200
+
+    # Compartidos por todas las instancias del proceso
+    _revoked: Dict[str, float] = {}
+    _loaded_at: Optional[float] = None
+    _publish_lock = threading.Lock()
+    _watch = None
+
+    def __init__(self):
+        self._db = get_async_firestore_client()
+        self._collection = self._db.collection(self.COLLECTION)
+
+    @staticmethod
+    def _horizon() -> float:
+        return time.time() - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    @classmethod
+    def _publish(cls, revoked: Dict[str, float], loaded: bool = True) -> None:
+        # Una revocación nunca retrocede: se conserva la más reciente aunque
+        # la lectura que llega haya empezado antes de una escritura local
+        horizon = cls._horizon()
+        with cls._publish_lock:
+            merged = dict(cls._revoked)
+            for user_id, revoked_at in revoked.items():
+                merged[user_id] = max(revoked_at, merged.get(user_id, revoked_at))
+            cls._revoked = {user_id: at for user_id, at in merged.items() if at >= horizon}
+            if loaded:
+                cls._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _from_docs(docs: Iterable[Any]) -> Dict[str, float]:
+        revoked = {}
+        for doc in docs:
+            revoked_at = (doc.to_dict() or {}).get("revoked_at")
+            if isinstance(revoked_at, (int, float)):
+                revoked[doc.id] = float(revoked_at)
+        return revoked
+
+    @classmethod
+    def _is_fresh(cls) -> bool:
+        if cls._loaded_at is None:
+            return False
+        if cls._watch is not None and cls._watch.is_active:
+            return True
+        return time.monotonic() - cls._loaded_at < settings.TOKEN_REVOCATIONS_CACHE_TTL_SECONDS
+
+    async def revoked_at(self, user_id: str) -> Optional[float]:
+        """Desde cuándo no se confía en los tokens de ``user_id`` (o None)."""
+        if not self._is_fresh():
+            docs = [doc async for doc in self._collection.stream()]
+            self._publish(self._from_docs(docs))
+        return self._revoked.get(user_id)
+
+    async def revoke(self, user_id: str) -> None:
+        """Deja de confiar en los tokens de ``user_id`` emitidos hasta ahora."""
+        now = time.time()
+        expired = (
+            self._collection.where(filter=FieldFilter("revoked_at", "<", self._horizon()))
+            .limit(self._PRUNE_BATCH)
+            .select([])
+        )
+        batch = self._db.batch()
+        async for doc in expired.stream():
+            if doc.id != user_id:
+                batch.delete(doc.reference)
+        batch.set(self._collection.document(user_id), {"revoked_at": now})
+        await batch.commit()
+        self._publish({user_id: now}, loaded=False)
+
+    @classmethod
+    def start_listener(cls) -> None:
+        """Mantiene la lista al día con un listener de Firestore sobre la colección."""
+        if cls._watch is not None or not settings.TOKEN_REVOCATIONS_LISTENER:
+            return
+
+        def on_snapshot(docs, changes, read_time) -> None:
+            cls._publish(cls._from_docs(docs))
+
+        collection = get_firestore_client().collection(cls.COLLECTION)
+        cls._watch = collection.on_snapshot(on_snapshot)
+
+    @classmethod
+    def stop_listener(cls) -> None:
+        watch, cls._watch = cls._watch, None
+        if watch is not None:
+            watch.unsubscribe()
+
+
+@instrumented
+class AsyncFirebaseCartCRUD:
+    """Carrito con líneas por producto; ver ``cart_line_write``."""
+
+    def __init__(self):
+        self._db = get_async_firestore_client()
+        self._collection = self._db.collection("carts")
+
+    async def get_cart(self, user_id: str) -> Optional[dict]:
+        return await self._load(user_id)
+
+    async def _load(self, user_id: str, removed: Iterable[str] = ()) -> dict:
+        """Ver ``FirebaseCartCRUD._load``."""
+        doc_ref = self._collection.document(user_id)
+        doc = await doc_ref.get()
+        if not doc.exists:
+            return {"user_id": user_id, "items": []}
+        data = doc.to_dict() or {}
+        if "items" in data:
+            data = await self._migrate(doc_ref, removed)
+        return cart_from_doc(user_id, data)
+
+    async def _migrate(self, doc_ref, removed: Iterable[str] = ()) -> dict:
+        @async_transactional
+        async def _run(transaction) -> dict:
+            snapshot = await doc_ref.get(transaction=transaction)
+            return stage_cart_migration(transaction, doc_ref, snapshot, removed)
+
+        return await _run(self._db.transaction())
+
+    async def add_or_update_item(self, user_id: str, item: Dict[str, Any]) -> dict:
+        await self._collection.document(user_id).set(cart_line_write(item), merge=True)
+        return await self.get_cart(user_id)
+
+    async def remove_item(self, user_id: str, product_id: str) -> dict:
+        await self._collection.document(user_id).set({"lines": {product_id: DELETE_FIELD}}, merge=True)
+        # En un carrito antiguo el producto también puede estar en ``items``
+        return await self._load(user_id, removed=[product_id])
+
+    async def clear_cart(self, user_id: str) -> dict:
+        await self._collection.document(user_id).set({"lines": {}})
+        return {"user_id": user_id, "items": []}
+
+
+@instrumented
+class AsyncFirebaseOrderCRUD(OrderWrites, AsyncBaseFirestoreCRUD):
+    def __init__(self):
+        super().__init__()
+        self._carts = self._db.collection("carts")
+        self._products = self._db.collection("products")
+
+    async def get_user_page(
+        self,
+        user_id: str,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+    ) -> Page:
+        """Historial de ``user_id`` de la orden más nueva a la más vieja.
+
+        Solo se leen los campos de ``ORDER_SUMMARY_FIELDS``. La consulta usa
+        los índices compuestos (user_id, created_at) y (user_id, status,
+        created_at) de firestore.indexes.json.
+        """
+        filters: List[QueryFilter] = [("user_id", "==", user_id)]
+        if statuses:
+            filters.append(("status", "==", statuses[0]) if len(statuses) == 1 else ("status", "in", statuses))
+        query, order_field = build_query(self._collection, filters, "created_at", descending=True)
+        query = apply_cursor(query.select(ORDER_SUMMARY_FIELDS), cursor, order_field)
+        docs = [d async for d in query.limit(limit + 1).stream()]
+        return build_page(docs, limit, order_field)
+
+    async def create_from_cart(self, user_id: str, order_fields: Dict[str, Any]) -> dict:
+        """Convierte el carrito en una orden dentro de una única transacción.
+
+        Lee el carrito y, en una sola llamada, todos sus productos; recalcula
+        los precios con los valores actuales, verifica y descuenta el stock,
+        crea la orden y vacía el carrito. Si otro checkout toca los mismos
+        productos, Firestore reintenta la transacción, así que no se vende
+        más stock del que existe. En los productos con el stock repartido en
+        shards solo se escribe el shard del que se descuenta.
+        """
+        cart_ref = self._carts.document(user_id)
+        order_ref = self._collection.document()
+        sharded: List[str] = []
+
+        @async_transactional
+        async def _run(transaction) -> dict:
+            # Firestore puede reintentar la función: se descarta lo del intento anterior
+            sharded.clear()
+            cart_snapshot = await cart_ref.get(transaction=transaction)
+            lines = fold_legacy_items(cart_snapshot.to_dict() or {}) if cart_snapshot.exists else {}
+            lines = {pid: line for pid, line in lines.items() if int(line.get("quantity", 0)) > 0}
+            if not lines:
+                raise EmptyCartError("El carrito está vacío")
+
+            refs = [self._products.document(pid) for pid in lines]
+            snapshots = {
+                snap.id: snap
+                async for snap in self._db.get_all(refs, transaction=transaction)
+                if snap.exists
+            }
+
+            missing = [pid for pid in lines if pid not in snapshots]
+            if missing:
+                raise ProductUnavailableError("Algunos productos ya no están disponibles", missing)
+
+            items: List[dict] = []
+            stock_updates: List[Tuple[Any, Dict[str, Any]]] = []
+            short: List[str] = []
+            for pid, line in lines.items():
+                product = snapshots[pid].to_dict() or {}
+                quantity = int(line.get("quantity", 1))
+                shards = int(product.get("stock_shards") or 0)
+                if shards:
+                    # Producto caliente: no se escribe el documento del producto
+                    reserved = await self._reserve_from_shards(
+                        transaction, snapshots[pid].reference, shards, quantity
+                    )
+                    if reserved is None:
+                        short.append(pid)
+                        continue
+                    stock_updates.extend(reserved)
+                    sharded.append(pid)
+                else:
+                    stock = int(product.get("stock", 0))
+                    if stock < quantity:
+                        short.append(pid)
+                        continue
+                    stock_updates.append((snapshots[pid].reference, {"stock": stock - quantity}))
+                items.append({
+                    "product_id": pid,
+                    "name": product.get("name", line.get("name")),
+                    "price": float(product.get("price", 0)),
+                    "quantity": quantity,
+                    "image_url": product.get("image_url", line.get("image_url")),
+                })
+            if short:
+                raise ProductUnavailableError("Stock insuficiente para algunos productos", short)
+
+            order_data = self._prepare({
+                **order_fields,
+                "user_id": user_id,
+                "items": items,
+                "total": sum(item["price"] * item["quantity"] for item in items),
+                "created_at": datetime.now(timezone.utc),
+            })
+            for ref, fields in stock_updates:
+                transaction.update(ref, fields)
+            self._stage_create(transaction, order_ref, order_data)
+            transaction.set(cart_ref, {"lines": {}})
+            return {**order_data, "id": order_ref.id}
+
+        order = await _run(self._db.transaction())
+        for pid in sharded:
+            ProductWrites.stock_cache.discard(pid)
+        # Solo cambió el stock de los productos vendidos: las páginas del
+        # catálogo no se invalidan y se renuevan al vencer su TTL
+        for item in order["items"]:
+            ProductWrites.catalog_cache.discard(("id", item["product_id"]))
+            catalog_index.adjust_stock(item["product_id"], -item["quantity"])
+        return order
+
+    @staticmethod
+    async def _reserve_from_shards(
+        transaction, product_ref, shards: int, quantity: int
+    ) -> Optional[List[Tuple[Any, Dict[str, Any]]]]:
+        """Descuenta ``quantity`` de los shards empezando por uno al azar.
+
+        Normalmente alcanza con leer un shard; solo si ese no tiene stock
+        suficiente se siguen leyendo los demás. Devuelve las escrituras a
+        hacer o None si la suma de los shards no alcanza.
+        """
+        refs = shard_refs(product_ref, shards)
+        updates: List[Tuple[Any, Dict[str, Any]]] = []
+        remaining = quantity
+        for index in shard_visit_order(shards):
+            count = shard_count(await refs[index].get(transaction=transaction))
+            if count <= 0:
+                continue
+            taken = min(count, remaining)
+            updates.append((refs[index], {"count": count - taken}))
+            remaining -= taken
+            if remaining == 0:
+                return updates
+        return None
+
+    async def get_all_by_user(self, user_id: str) -> List[dict]:
+        query = self._collection.where(filter=FieldFilter("user_id", "==", user_id))
+        return [{**d.to_dict(), "id": d.id} async for d in query.stream()]
+
+
+@instrumented
+class AsyncFirebaseReportCRUD:
+    """Lectura de los resúmenes diarios; ver ``crud.reports``."""
+
+    def __init__(self):
+        self._db = get_async_firestore_client()
+        self._collection = self._db.collection(REPORTS_COLLECTION)
+        self._shards = self._db.collection(REPORT_SHARDS_COLLECTION)
+
+    @counts_documents(len)
+    async def get_days(self, days: List[str]) -> Dict[str, dict]:
+        """Suma los resúmenes de ``days`` y sus shards.
+
+        Los resúmenes se leen en una sola llamada ``get_all`` y los shards
+        con una consulta por rango de ``date``. Los días sin actividad no
+        tienen documentos y no aparecen.
+        """
+        if not days:
+            return {}
+        refs = [self._collection.document(day) for day in days]
+        docs = [snap.to_dict() or {} async for snap in self._db.get_all(refs) if snap.exists]
+        query = (
+            self._shards.where(filter=FieldFilter("date", ">=", min(days)))
+            .where(filter=FieldFilter("date", "<=", max(days)))
+        )
+        docs.extend([snap.to_dict() or {} async for snap in query.stream()])
+        return sum_report_docs(docs, days)
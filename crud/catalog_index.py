@@ -0,0 +1,277 @@
+"""Índice columnar del catálogo en memoria (GET /products/search).
+
+Cada producto ocupa una fila. Los filtros se resuelven con bitmaps (un
+``int`` de Python por categoría, por tramo de precio, por palabra del
+nombre y para "con stock"), así que combinarlos es un ``&`` y contar un
+facet es contar bits. El rango de precios usa una lista ordenada por
+precio con ``bisect``, y la misma lista (o la ordenada por nombre) da el
+orden de los resultados.
+
+Cada respuesta trae los facets de la búsqueda: cuántos productos hay por
+categoría, por tramo de precio (``CATALOG_PRICE_BUCKETS``) y con stock.
+Cada facet se cuenta con los demás filtros aplicados pero sin el propio,
+así la interfaz puede mostrar cuántos resultados daría cambiarlo.
+
+Lo mantienen al día las escrituras de los CRUD de productos y las ventas
+(``adjust_stock``); para ver las de otros procesos se reconstruye en segundo
+plano cada ``CATALOG_INDEX_REBUILD_SECONDS``. Ver ``crud.search.LiveIndex``.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.config import settings
+from crud.search import LiveIndex, fold, tokenize
+from models.product import Product
+
+try:
+    popcount = int.bit_count  # Python 3.10+
+except AttributeError:  # pragma: no cover
+    def popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+# Mayor que cualquier id: (precio, _LAST) queda después de todas las filas con ese precio
+_LAST = "\U0010ffff"
+
+# Palabras del nombre que se prueban por prefijo para cada palabra buscada
+_MAX_EXPANSIONS = 200
+
+
+def bitmap_of(rows: Iterable[int], size: int) -> int:
+    """Bitmap con los bits de ``rows`` (en un buffer, no bit a bit sobre el int)."""
+    buffer = bytearray((size + 7) // 8)
+    for row in rows:
+        buffer[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class _BitView:
+    """Consulta de bits en O(1) sobre una copia en bytes del bitmap."""
+
+    def __init__(self, bitmap: int, size: int):
+        self._bytes = bitmap.to_bytes((size + 7) // 8 or 1, "little")
+
+    def __contains__(self, row: int) -> bool:
+        return bool(self._bytes[row >> 3] >> (row & 7) & 1)
+
+    def rows(self) -> Iterable[int]:
+        for offset, byte in enumerate(self._bytes):
+            while byte:
+                low = byte & -byte
+                yield offset * 8 + low.bit_length() - 1
+                byte ^= low
+
+
+@dataclass
+class CatalogQuery:
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: bool = False
+    q: Optional[str] = None
+    sort: str = "name"
+    offset: int = 0
+    limit: int = 20
+
+
+@dataclass
+class CatalogResult:
+    items: List[dict]
+    total: int
+    facets: Dict[str, Any] = field(default_factory=dict)
+
+
+class _Catalog:
+    """Columnas y bitmaps; quien lo usa se encarga del lock."""
+
+    def __init__(self, price_edges: Optional[List[float]] = None):
+        self.price_edges = sorted(settings.CATALOG_PRICE_BUCKETS if price_edges is None else price_edges)
+        # Producto normalizado (ProductInDB) por fila; None si la fila está libre
+        self.products: List[Optional[dict]] = []
+        self.row_of: Dict[str, int] = {}
+        self._free: List[int] = []
+        self.alive = 0
+        self.in_stock = 0
+        self.categories: Dict[str, int] = {}
+        self.buckets = [0] * (len(self.price_edges) + 1)
+        self.tokens: Dict[str, int] = {}
+        self.vocabulary: List[str] = []
+        # (precio, id, fila) y (nombre normalizado, id, fila), ordenadas
+        self.by_price: List[Tuple[float, str, int]] = []
+        self.by_name: List[Tuple[str, str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def size(self) -> int:
+        return len(self.products)
+
+    def _bucket(self, price: float) -> int:
+        return bisect_right(self.price_edges, price)
+
+    def _clear(self, bitmaps: Dict[str, int], key: str, mask: int) -> bool:
+        """Apaga un bit en ``bitmaps[key]``; devuelve True si el bitmap quedó vacío."""
+        value = bitmaps[key] & mask
+        if value:
+            bitmaps[key] = value
+            return False
+        del bitmaps[key]
+        return True
+
+    def upsert(self, product_id: str, data: Dict[str, Any]) -> None:
+        self.remove(product_id)
+        product = Product.from_dict({**data, "id": product_id}).to_dict(include_id=True)
+        row = self._free.pop() if self._free else len(self.products)
+        if row == len(self.products):
+            self.products.append(None)
+        self.products[row] = product
+        self.row_of[product_id] = row
+
+        bit = 1 << row
+        self.alive |= bit
+        if product["stock"] > 0:
+            self.in_stock |= bit
+        self.categories[product["category"]] = self.categories.get(product["category"], 0) | bit
+        self.buckets[self._bucket(product["price"])] |= bit
+        for token in set(tokenize(product["name"])):
+            if token not in self.tokens:
+                insort(self.vocabulary, token)
+            self.tokens[token] = self.tokens.get(token, 0) | bit
+        insort(self.by_price, (product["price"], product_id, row))
+        insort(self.by_name, (fold(product["name"]), product_id, row))
+
+    def remove(self, product_id: str) -> None:
+        row = self.row_of.pop(product_id, None)
+        if row is None:
+            return
+        product = self.products[row]
+        self.products[row] = None
+        self._free.append(row)
+
+        mask = ~(1 << row)
+        self.alive &= mask
+        self.in_stock &= mask
+        self._clear(self.categories, product["category"], mask)
+        self.buckets[self._bucket(product["price"])] &= mask
+        for token in set(tokenize(product["name"])):
+            if self._clear(self.tokens, token, mask):
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+        del self.by_price[bisect_left(self.by_price, (product["price"], product_id, row))]
+        del self.by_name[bisect_left(self.by_name, (fold(product["name"]), product_id, row))]
+
+    def adjust_stock(self, product_id: str, delta: int) -> None:
+        row = self.row_of.get(product_id)
+        if row is None:
+            return
+        # Se reemplaza el dict: las respuestas ya armadas no cambian
+        product = {**self.products[row], "stock": self.products[row]["stock"] + delta}
+        self.products[row] = product
+        if product["stock"] > 0:
+            self.in_stock |= 1 << row
+        else:
+            self.in_stock &= ~(1 << row)
+
+    # --- Consultas ---
+
+    def _price_mask(self, min_price: Optional[float], max_price: Optional[float]) -> int:
+        if min_price is None and max_price is None:
+            return self.alive
+        start = 0 if min_price is None else bisect_left(self.by_price, (min_price,))
+        end = len(self.by_price) if max_price is None else bisect_right(self.by_price, (max_price, _LAST))
+        return bitmap_of((row for _, _, row in self.by_price[start:end]), self.size)
+
+    def _text_mask(self, q: Optional[str]) -> int:
+        mask = self.alive
+        for word in dict.fromkeys(tokenize(q)) if q else ():
+            matched = 0
+            start = bisect_left(self.vocabulary, word)
+            for token in self.vocabulary[start:start + _MAX_EXPANSIONS]:
+                if not token.startswith(word):
+                    break
+                matched |= self.tokens[token]
+            mask &= matched
+            if not mask:
+                break
+        return mask
+
+    def _price_facets(self, base: int) -> List[Dict[str, Any]]:
+        edges: List[Optional[float]] = [None, *self.price_edges, None]
+        return [
+            {"min": edges[i], "max": edges[i + 1], "count": popcount(bitmap & base)}
+            for i, bitmap in enumerate(self.buckets)
+        ]
+
+    def _ordered_rows(self, result: int, total: int, sort: str) -> Iterable[int]:
+        view = _BitView(result, self.size)
+        if total * 8 < len(self.row_of):
+            # Pocos resultados: se ordenan solo esas filas
+            key = (lambda r: (self.products[r]["price"], self.products[r]["id"])) if sort != "name" else (
+                lambda r: (fold(self.products[r]["name"]), self.products[r]["id"]))
+            return sorted(view.rows(), key=key, reverse=sort == "price_desc")
+        ordered = self.by_name if sort == "name" else self.by_price
+        if sort == "price_desc":
+            ordered = reversed(ordered)
+        return (row for _, _, row in ordered if row in view)
+
+    def query(self, query: CatalogQuery) -> CatalogResult:
+        category = self.categories.get(query.category, 0) if query.category else self.alive
+        price = self._price_mask(query.min_price, query.max_price)
+        stock = self.in_stock if query.in_stock else self.alive
+        text = self._text_mask(query.q)
+
+        result = category & price & stock & text
+        total = popcount(result)
+        # Cada facet con los demás filtros pero sin el propio
+        without_category = price & stock & text
+        facets = {
+            "categories": {
+                name: count
+                for name, bitmap in sorted(self.categories.items())
+                if (count := popcount(bitmap & without_category))
+            },
+            "price": self._price_facets(category & stock & text),
+            "in_stock": popcount(self.in_stock & category & price & text),
+        }
+
+        items: List[dict] = []
+        if total > query.offset:
+            for position, row in enumerate(self._ordered_rows(result, total, query.sort)):
+                if position < query.offset:
+                    continue
+                items.append(self.products[row])
+                if len(items) >= query.limit:
+                    break
+        return CatalogResult(items=items, total=total, facets=facets)
+
+
+class CatalogIndex(LiveIndex):
+    thread_name = "catalog-index-rebuild"
+
+    def __init__(self, load, rebuild_seconds: Optional[float] = None):
+        super().__init__(
+            _Catalog,
+            load,
+            settings.CATALOG_INDEX_REBUILD_SECONDS if rebuild_seconds is None else rebuild_seconds,
+        )
+
+    def query(self, query: CatalogQuery) -> CatalogResult:
+        self._ensure_loaded()
+        with self._lock:
+            return self._index.query(query)
+
+    def adjust_stock(self, product_id: str, delta: int) -> None:
+        """Suma ``delta`` al stock indexado (las ventas descuentan lo vendido)."""
+        self._apply(lambda index: index.adjust_stock(product_id, delta))
+
+
+def _load_products() -> Iterable[Dict[str, Any]]:
+    from crud.firebase_crud import FirebaseProductCRUD
+
+    # get_all ya trae el stock sumado de los productos repartidos en shards
+    return FirebaseProductCRUD().get_all()
+
+
+catalog_index = CatalogIndex(_load_products)
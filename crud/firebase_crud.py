@@ -1,43 +1,662 @@
-from typing import List, Dict, Optional, Any
+import random
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Dict, Optional, Any, Tuple
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore import DELETE_FIELD, FieldFilter, Increment, SERVER_TIMESTAMP, transactional
+from core.cache import VersionedTTLCache
+from core.config import settings
+from core.metrics import instrumented
 from database.firebase_client import get_firestore_client
+from crud.pagination import (
+    DEFAULT_PAGE_SIZE,
+    Page,
+    QueryFilter,
+    apply_cursor,
+    build_page,
+    build_query,
+)
+from crud.reports import (
+    REPORT_SHARDS_COLLECTION,
+    REPORTS_COLLECTION,
+    ROLLUP_FIELDS,
+    Rollup,
+    add_report_writes,
+    add_values,
+    appointment_rollup,
+    merge_deltas,
+    order_rollup,
+    patient_rollup,
+    rollup_delta,
+)
+from crud.catalog_index import catalog_index
+from crud.search import RESULT_FIELDS, patient_index
 from models.product import Product
 from models.user import User
 
-class FirebaseProductCRUD:
+
+class WriteConflictError(Exception):
+    """Otro escritor modificó el documento en cada uno de los reintentos."""
+
+    def __init__(self, path: str):
+        super().__init__("El registro cambió mientras se guardaba; vuelve a intentarlo")
+        self.path = path
+
+
+class CollectionWrites:
+    """Qué se escribe en cada alta, cambio o baja de una colección.
+
+    Lo comparten los CRUD síncronos de este módulo y los asíncronos de
+    ``crud.async_firebase_crud``, que solo se diferencian en cómo esperan a
+    Firestore. Los métodos ``_stage_*`` agregan a un batch (o transacción)
+    el documento y lo que lo acompaña en la misma escritura atómica
+    (resúmenes diarios, horarios, ...); ``_written`` y ``_removed`` ponen al
+    día las cachés e índices del proceso una vez confirmada la escritura.
+    """
+
+    collection_name: str = ""
+
+    # Reintentos de update cuando otro escritor modifica el documento entre
+    # la lectura y la escritura condicionada
+    _UPDATE_ATTEMPTS = 5
+
+    # Máximo de operaciones que admite un WriteBatch de Firestore
+    BATCH_SIZE = 500
+
+    # Aporte de cada documento a los resúmenes diarios (ver crud.reports);
+    # con él create, update, delete y bulk_create mantienen los resúmenes
+    rollup: Optional[Rollup] = None
+
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Documento a guardar en un alta, con sus campos derivados."""
+        return data
+
+    def _changes(self, current: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Campos a escribir en un update (``data`` más los derivados)."""
+        return data
+
+    def _stage_create(self, writer, doc_ref, data: Dict[str, Any]) -> None:
+        writer.set(doc_ref, data)
+        self._stage_related(writer, doc_ref, None, data)
+
+    def _stage_update(self, writer, doc_ref, snapshot, data: Dict[str, Any]) -> dict:
+        """Escribe el cambio condicionado a ``snapshot`` y devuelve la versión fusionada."""
+        current = snapshot.to_dict() or {}
+        writes = self._changes(current, data)
+        merged = {**current, **writes}
+        writer.update(doc_ref, writes, option=self._db.write_option(last_update_time=snapshot.update_time))
+        self._stage_related(writer, doc_ref, current, merged)
+        return merged
+
+    def _stage_delete(self, writer, doc_ref, snapshot) -> None:
+        writer.delete(doc_ref, option=self._db.write_option(last_update_time=snapshot.update_time))
+        self._stage_related(writer, doc_ref, snapshot.to_dict() or {}, None)
+
+    def _stage_related(self, writer, doc_ref, old: Optional[dict], new: Optional[dict]) -> None:
+        """Escrituras que acompañan el paso de ``old`` a ``new`` (None: no existe)."""
+        if self.rollup is not None:
+            add_report_writes(writer, self._db, rollup_delta(self.rollup, old, new))
+
+    def _reads_before_delete(self) -> bool:
+        """Si ``delete`` necesita el documento para ``_stage_related``."""
+        return self.rollup is not None
+
+    def _already_exists(self, error: AlreadyExists) -> Exception:
+        """Error a propagar cuando un ``create`` del batch encuentra el documento."""
+        return error
+
+    def _write_conflict(self, doc_ref) -> Exception:
+        return WriteConflictError(doc_ref.path)
+
+    def _written(self, doc_id: str, data: Dict[str, Any]) -> None:
+        """Se llama con la versión completa del documento tras un alta o cambio."""
+
+    def _removed(self, doc_id: str) -> None:
+        """Se llama tras borrar el documento."""
+
+
+@instrumented
+class BaseFirestoreCRUD(CollectionWrites):
+    """Operaciones comunes a los CRUD que trabajan sobre una colección."""
+
     def __init__(self):
         self._db = get_firestore_client()
-        self._collection = self._db.collection("products")
+        self._collection = self._db.collection(self.collection_name)
+
+    def _build_query(
+        self,
+        filters: Optional[List[QueryFilter]] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+    ):
+        """Construye la consulta con filtros y orden estable (campo + id)."""
+        return build_query(self._collection, filters, order_by, descending)
 
     def get_all(self) -> List[dict]:
         docs = self._collection.stream()
         return [{**d.to_dict(), "id": d.id} for d in docs]
 
-    def get_by_id(self, product_id: str) -> Optional[dict]:
-        doc = self._collection.document(product_id).get()
+    def get_by_id(self, doc_id: str) -> Optional[dict]:
+        doc = self._collection.document(doc_id).get()
         if not doc.exists:
             return None
         return {**doc.to_dict(), "id": doc.id}
 
     def create(self, data: Dict[str, Any]) -> dict:
+        data = self._prepare(data)
         doc_ref = self._collection.document()  # id automático
-        doc_ref.set(data)
-        return {**data, "id": doc_ref.id}
+        batch = self._db.batch()
+        self._stage_create(batch, doc_ref, data)
+        try:
+            batch.commit()
+        except AlreadyExists as exc:
+            raise self._already_exists(exc)
+        created = {**data, "id": doc_ref.id}
+        self._written(doc_ref.id, created)
+        return created
+
+    def get_many(self, ids: List[str]) -> Tuple[List[dict], List[str]]:
+        """Lee varios documentos en una sola llamada ``get_all``.
+
+        Devuelve (documentos, ids_inexistentes). Los documentos siguen el
+        orden de ``ids`` (sin duplicados), no el orden en que responde
+        Firestore.
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        if not unique_ids:
+            return [], []
+        refs = [self._collection.document(doc_id) for doc_id in unique_ids]
+        found = {
+            snap.id: {**snap.to_dict(), "id": snap.id}
+            for snap in self._db.get_all(refs)
+            if snap.exists
+        }
+        items = [found[doc_id] for doc_id in unique_ids if doc_id in found]
+        missing = [doc_id for doc_id in unique_ids if doc_id not in found]
+        return items, missing
+
+    def bulk_create(
+        self,
+        rows: Iterable[Tuple[int, Dict[str, Any]]],
+        max_in_flight: int = 4,
+    ) -> Tuple[int, List[Tuple[int, str]]]:
+        """Crea documentos en lotes de ``BATCH_SIZE`` con commits concurrentes.
+
+        ``rows`` son pares (número de fila, datos) y se consumen de forma
+        perezosa: nunca hay más de ``max_in_flight`` lotes en memoria.
+        Devuelve (documentos creados, [(fila, error)]) de los lotes fallidos.
+        """
+        created = 0
+        failures: List[Tuple[int, str]] = []
+        pending: Dict[Future, List[int]] = {}
+
+        def collect(done) -> None:
+            nonlocal created
+            for future in done:
+                row_numbers = pending.pop(future)
+                try:
+                    future.result()
+                    created += len(row_numbers)
+                except Exception as exc:
+                    failures.extend((row, f"Error al escribir el lote: {exc}") for row in row_numbers)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            batch = self._db.batch()
+            batch_rows: List[int] = []
+            # Los resúmenes diarios se suman una vez por lote y día
+            batch_deltas: Dict[str, Dict[str, Any]] = {}
+            for row_number, data in rows:
+                data = self._prepare(data)
+                batch.set(self._collection.document(), data)
+                batch_rows.append(row_number)
+                if self.rollup is not None:
+                    merge_deltas(batch_deltas, rollup_delta(self.rollup, None, data))
+                if len(batch_rows) + len(batch_deltas) < self.BATCH_SIZE:
+                    continue
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                add_report_writes(batch, self._db, batch_deltas)
+                pending[executor.submit(batch.commit)] = batch_rows
+                batch = self._db.batch()
+                batch_rows = []
+                batch_deltas = {}
+            if batch_rows:
+                add_report_writes(batch, self._db, batch_deltas)
+                pending[executor.submit(batch.commit)] = batch_rows
+            collect(wait(pending).done)
+
+        return created, failures
+
+    def update(self, doc_id: str, data: Dict[str, Any]) -> Optional[dict]:
+        """Actualiza el documento y devuelve su versión fusionada.
+
+        Se lee el documento una vez y se escribe con la precondición
+        ``last_update_time``: la propia escritura garantiza que el documento
+        existe y que no cambió desde la lectura, así que el resultado se
+        fusiona localmente sin una segunda lectura.
+        """
+        doc_ref = self._collection.document(doc_id)
+        for _ in range(self._UPDATE_ATTEMPTS):
+            snapshot = doc_ref.get()
+            if not snapshot.exists:
+                return None
+            if not data:
+                return {**(snapshot.to_dict() or {}), "id": doc_id}
+            batch = self._db.batch()
+            merged = self._stage_update(batch, doc_ref, snapshot, data)
+            try:
+                batch.commit()
+            except NotFound:
+                return None
+            except FailedPrecondition:
+                continue
+            except AlreadyExists as exc:
+                raise self._already_exists(exc)
+            updated = {**merged, "id": doc_id}
+            self._written(doc_id, updated)
+            return updated
+        raise self._write_conflict(doc_ref)
+
+    def delete(self, doc_id: str) -> bool:
+        """Borra el documento en una sola llamada (precondición ``exists``).
+
+        Si la baja tiene escrituras asociadas (resúmenes, horarios, ...) se
+        lee antes y se borra con la precondición ``last_update_time``.
+        """
+        doc_ref = self._collection.document(doc_id)
+        if not self._reads_before_delete():
+            try:
+                doc_ref.delete(option=self._db.write_option(exists=True))
+            except NotFound:
+                return False
+            self._removed(doc_id)
+            return True
+
+        for _ in range(self._UPDATE_ATTEMPTS):
+            snapshot = doc_ref.get()
+            if not snapshot.exists:
+                return False
+            batch = self._db.batch()
+            self._stage_delete(batch, doc_ref, snapshot)
+            try:
+                batch.commit()
+            except NotFound:
+                return False
+            except FailedPrecondition:
+                continue
+            self._removed(doc_id)
+            return True
+        raise self._write_conflict(doc_ref)
+
+    def get_page(
+        self,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        filters: Optional[List[QueryFilter]] = None,
+    ) -> Page:
+        """Obtiene una página de documentos filtrados en Firestore.
+
+        Se pide un documento de más para saber si existe una página
+        siguiente sin hacer otra consulta. Con ``limit=None`` se devuelven
+        todos los documentos que cumplan los filtros. Los documentos que no
+        tengan el campo de orden no aparecen en el resultado (limitación de
+        Firestore).
+        """
+        query, order_field = self._build_query(filters, order_by, descending)
+        query = apply_cursor(query, cursor, order_field)
+
+        if limit is None:
+            return Page(items=[{**d.to_dict(), "id": d.id} for d in query.stream()])
+
+        docs = list(query.limit(limit + 1).stream())
+        return build_page(docs, limit, order_field)
+
+    def iter_all(self, filters: Optional[List[QueryFilter]] = None) -> Iterator[dict]:
+        """Recorre la colección documento a documento sin materializarla.
+
+        Pensado para exportaciones: el llamador consume el generador de
+        ``stream()`` y la memoria usada no depende del tamaño de la colección.
+        """
+        query, _ = self._build_query(filters)
+        for d in query.stream():
+            yield {**d.to_dict(), "id": d.id}
+
+
+_NOT_CACHED = object()
+
+
+# --- Stock repartido en shards ---
+#
+# Un producto con ``stock_shards: N`` guarda su stock en la subcolección
+# ``products/{id}/stock_shards/{0..N-1}`` (campo ``count``). Cada venta
+# descuenta de un shard elegido al azar, así los checkouts concurrentes no
+# compiten por el mismo documento. El campo ``stock`` del producto queda
+# solo como referencia del último reparto; las lecturas lo reemplazan por
+# la suma de los shards.
+
+STOCK_SHARDS_COLLECTION = "stock_shards"
+MAX_STOCK_SHARDS = 100
+
+
+def shard_refs(product_ref, shards: int) -> list:
+    collection = product_ref.collection(STOCK_SHARDS_COLLECTION)
+    return [collection.document(str(i)) for i in range(shards)]
+
+
+def split_stock(total: int, shards: int) -> List[int]:
+    """Reparte ``total`` en ``shards`` contadores lo más parejos posible."""
+    if shards <= 0:
+        return []
+    base, extra = divmod(max(int(total), 0), shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def shard_count(snapshot) -> int:
+    if not snapshot.exists:
+        return 0
+    return int((snapshot.to_dict() or {}).get("count", 0))
+
+
+def shard_visit_order(shards: int) -> List[int]:
+    """Índices de shard empezando por uno al azar."""
+    start = random.randrange(shards)
+    return [(start + i) % shards for i in range(shards)]
 
-    def update(self, product_id: str, data: Dict[str, Any]) -> Optional[dict]:
-        doc_ref = self._collection.document(product_id)
-        if not doc_ref.get().exists:
-            return None
-        doc_ref.update(data)
-        updated = doc_ref.get().to_dict()
-        return {**updated, "id": product_id}
 
-    def delete(self, product_id: str) -> bool:
-        doc_ref = self._collection.document(product_id)
-        if not doc_ref.get().exists:
+def validate_stock_shards(shards: int) -> None:
+    if not 0 <= shards <= MAX_STOCK_SHARDS:
+        raise ValueError(f"La cantidad de shards debe estar entre 0 y {MAX_STOCK_SHARDS}")
+
+
+def pending_shard_sums(items: List[dict], stock_cache: VersionedTTLCache) -> Dict[str, int]:
+    """Completa ``stock`` con las sumas cacheadas y devuelve {id: shards} de las que faltan."""
+    pending: Dict[str, int] = {}
+    for item in items:
+        shards = int(item.get("stock_shards") or 0)
+        if not shards:
+            continue
+        total = stock_cache.get(item["id"])
+        if total is None:
+            pending[item["id"]] = shards
+        else:
+            item["stock"] = total
+    return pending
+
+
+def apply_shard_sums(
+    items: List[dict],
+    owners: Dict[str, str],
+    snapshots: Iterable[Any],
+    stock_cache: VersionedTTLCache,
+) -> None:
+    """Suma los shards leídos (``owners``: ruta del shard -> id del producto)."""
+    totals = dict.fromkeys(set(owners.values()), 0)
+    for snapshot in snapshots:
+        totals[owners[snapshot.reference.path]] += shard_count(snapshot)
+    for product_id, total in totals.items():
+        stock_cache.set(product_id, total)
+    for item in items:
+        if item.get("id") in totals:
+            item["stock"] = totals[item["id"]]
+
+
+class ProductWrites(CollectionWrites):
+    """Productos: caché del catálogo, stock repartido e índice de facetas."""
+
+    collection_name = "products"
+
+    # Compartida por todas las instancias del proceso (products, cart, ...),
+    # síncronas y asíncronas. Las escrituras hechas desde este proceso la
+    # invalidan al instante; el TTL acota cuánto tardan en verse las de
+    # otros workers.
+    catalog_cache = VersionedTTLCache(
+        ttl_seconds=settings.CATALOG_CACHE_TTL_SECONDS,
+        max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    )
+
+    # Suma de los shards de cada producto repartido. El TTL es corto porque
+    # ese stock cambia con cada venta; así una invalidación del catálogo no
+    # obliga a releer los shards de todos los productos calientes.
+    stock_cache = VersionedTTLCache(
+        ttl_seconds=settings.STOCK_SHARD_CACHE_TTL_SECONDS,
+        max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+    )
+
+    def _written(self, product_id: str, data: Dict[str, Any]) -> None:
+        self.catalog_cache.invalidate()
+        catalog_index.upsert(product_id, data)
+
+    def _removed(self, product_id: str) -> None:
+        self.stock_cache.discard(product_id)
+        self.catalog_cache.invalidate()
+        catalog_index.remove(product_id)
+
+    def _stage_update(self, writer, doc_ref, snapshot, data: Dict[str, Any]) -> dict:
+        merged = super()._stage_update(writer, doc_ref, snapshot, data)
+        shards = int(merged.get("stock_shards") or 0)
+        if shards and data.get("stock") is not None:
+            # El stock nuevo se reparte en la misma escritura que el cambio
+            for ref, count in zip(shard_refs(doc_ref, shards), split_stock(data["stock"], shards)):
+                writer.set(ref, {"count": count})
+        return merged
+
+    def _stage_related(self, writer, doc_ref, old: Optional[dict], new: Optional[dict]) -> None:
+        super()._stage_related(writer, doc_ref, old, new)
+        if new is None and old:
+            for ref in shard_refs(doc_ref, int(old.get("stock_shards") or 0)):
+                writer.delete(ref)
+
+    def _reads_before_delete(self) -> bool:
+        # Para borrar los shards junto con el producto
+        return True
+
+    def _sharded_update(self, product_id: str, data: Dict[str, Any], updated: Dict[str, Any]) -> bool:
+        """Indica si ``updated`` aún necesita la suma de sus shards como ``stock``."""
+        if not updated.get("stock_shards"):
+            return False
+        if data.get("stock") is not None:
+            # Se acaba de repartir: la suma es el valor escrito
+            self.stock_cache.set(product_id, updated["stock"])
             return False
-        doc_ref.delete()
         return True
 
+    def _shard_reads(self, items: List[dict]) -> Tuple[list, Dict[str, str]]:
+        """Shards a leer para completar ``stock`` (refs y ruta del shard -> id del producto)."""
+        refs, owners = [], {}
+        for product_id, shards in pending_shard_sums(items, self.stock_cache).items():
+            for ref in shard_refs(self._collection.document(product_id), shards):
+                refs.append(ref)
+                owners[ref.path] = product_id
+        return refs, owners
+
+    @staticmethod
+    def _catalog_key(limit, cursor, order_by, descending, filters) -> tuple:
+        return ("page", limit, cursor, order_by, descending, tuple(filters or ()))
+
+    @staticmethod
+    def _catalog_page(page: Page) -> Page:
+        """Pasa los items una sola vez por el modelo de dominio Product."""
+        items = [Product.from_dict(data).to_dict(include_id=True) for data in page.items]
+        return Page(items=items, next_cursor=page.next_cursor)
+
+    def _split_cached(self, ids: List[str]) -> Tuple[List[str], Dict[str, Optional[dict]], List[str]]:
+        """Devuelve (ids sin duplicados, {id: producto} de la caché, ids a leer)."""
+        unique_ids = list(dict.fromkeys(ids))
+        cached: Dict[str, Optional[dict]] = {}
+        pending: List[str] = []
+        for product_id in unique_ids:
+            value = self.catalog_cache.get(("id", product_id), _NOT_CACHED)
+            if value is _NOT_CACHED:
+                pending.append(product_id)
+            else:
+                cached[product_id] = value
+        return unique_ids, cached, pending
+
+    def _cache_fetched(
+        self,
+        cached: Dict[str, Optional[dict]],
+        generation: int,
+        fetched: List[dict],
+        missing: List[str],
+    ) -> None:
+        for data in fetched:
+            cached[data["id"]] = data
+            self.catalog_cache.set(("id", data["id"]), data, generation=generation)
+        for product_id in missing:
+            cached[product_id] = None
+            self.catalog_cache.set(("id", product_id), None, generation=generation)
+
+    @staticmethod
+    def _in_order(unique_ids: List[str], cached: Dict[str, Optional[dict]]) -> Tuple[List[dict], List[str]]:
+        items = [dict(cached[i]) for i in unique_ids if cached.get(i) is not None]
+        missing_ids = [i for i in unique_ids if cached.get(i) is None]
+        return items, missing_ids
+
+    def _stage_stock_shards(
+        self, transaction, product_ref, data: Dict[str, Any], shards: int, total: int
+    ) -> dict:
+        """Reparte ``total`` en ``shards`` contadores y devuelve el producto resultante."""
+        old_refs = shard_refs(product_ref, int(data.get("stock_shards") or 0))
+        for ref in old_refs[shards:]:
+            transaction.delete(ref)
+        for ref, count in zip(shard_refs(product_ref, shards), split_stock(total, shards)):
+            transaction.set(ref, {"count": count})
+        transaction.update(product_ref, {
+            "stock": total,
+            "stock_shards": shards or DELETE_FIELD,
+        })
+        updated = {k: v for k, v in data.items() if k != "stock_shards"}
+        if shards:
+            updated["stock_shards"] = shards
+        return {**updated, "stock": total, "id": product_ref.id}
+
+    def _stock_shards_written(self, product_id: str, updated: Dict[str, Any]) -> None:
+        if updated.get("stock_shards"):
+            self.stock_cache.set(product_id, updated["stock"])
+        else:
+            self.stock_cache.discard(product_id)
+        self._written(product_id, updated)
+
+
+@instrumented
+class FirebaseProductCRUD(ProductWrites, BaseFirestoreCRUD):
+    def _with_sharded_stock(self, items: List[dict]) -> List[dict]:
+        """Reemplaza ``stock`` por la suma de los shards en los productos repartidos."""
+        refs, owners = self._shard_reads(items)
+        if refs:
+            apply_shard_sums(items, owners, self._db.get_all(refs), self.stock_cache)
+        return items
+
+    def get_all(self) -> List[dict]:
+        return self._with_sharded_stock(super().get_all())
+
+    def get_page(
+        self,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        filters: Optional[List[QueryFilter]] = None,
+    ) -> Page:
+        page = super().get_page(limit, cursor, order_by, descending, filters)
+        self._with_sharded_stock(page.items)
+        return page
+
+    def get_catalog_page(
+        self,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        filters: Optional[List[QueryFilter]] = None,
+    ) -> Page:
+        """Versión cacheada de ``get_page`` con los productos ya normalizados.
+
+        Los items pasan una sola vez por el modelo de dominio Product al
+        cargarse, de modo que un acierto de caché no cuesta conversiones.
+        """
+        def load() -> Page:
+            return self._catalog_page(self.get_page(limit, cursor, order_by, descending, filters))
+
+        key = self._catalog_key(limit, cursor, order_by, descending, filters)
+        return self.catalog_cache.get_or_load(key, load)
+
+    def get_by_id(self, product_id: str) -> Optional[dict]:
+        def load() -> Optional[dict]:
+            data = super(FirebaseProductCRUD, self).get_by_id(product_id)
+            if data is None:
+                return None
+            return self._with_sharded_stock([data])[0]
+
+        data = self.catalog_cache.get_or_load(("id", product_id), load)
+        return dict(data) if data is not None else None
+
+    def get_many(self, ids: List[str]) -> Tuple[List[dict], List[str]]:
+        """Igual que en la base, pero solo pide a Firestore los que no estén en caché."""
+        unique_ids, cached, pending = self._split_cached(ids)
+        if pending:
+            generation = self.catalog_cache.generation
+            fetched, missing = super().get_many(pending)
+            self._with_sharded_stock(fetched)
+            self._cache_fetched(cached, generation, fetched, missing)
+        return self._in_order(unique_ids, cached)
+
+    def bulk_create(
+        self,
+        rows: Iterable[Tuple[int, Dict[str, Any]]],
+        max_in_flight: int = 4,
+    ) -> Tuple[int, List[Tuple[int, str]]]:
+        try:
+            return super().bulk_create(rows, max_in_flight)
+        finally:
+            self.catalog_cache.invalidate()
+            catalog_index.invalidate()
+
+    def update(self, product_id: str, data: Dict[str, Any]) -> Optional[dict]:
+        """Actualiza el producto; si tiene el stock repartido, lo vuelve a repartir."""
+        updated = super().update(product_id, data)
+        if updated is None or not self._sharded_update(product_id, data, updated):
+            return updated
+        # El documento guarda el stock del último reparto; se indexa la suma de los shards
+        updated = self._with_sharded_stock([updated])[0]
+        catalog_index.upsert(product_id, updated)
+        return updated
+
+    def set_stock_shards(
+        self, product_id: str, shards: int, stock: Optional[int] = None
+    ) -> Optional[dict]:
+        """Reparte el stock del producto en ``shards`` contadores (0 lo desactiva).
+
+        Si no se indica ``stock`` se conserva el total actual (la suma de los
+        shards o el campo ``stock``). Todo ocurre en una transacción, así que
+        no se pierden las ventas hechas durante el cambio.
+        """
+        validate_stock_shards(shards)
+        product_ref = self._collection.document(product_id)
+
+        @transactional
+        def _run(transaction) -> Optional[dict]:
+            snapshot = product_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            data = snapshot.to_dict() or {}
+            old_refs = shard_refs(product_ref, int(data.get("stock_shards") or 0))
+            if stock is not None:
+                total = int(stock)
+            elif old_refs:
+                total = sum(shard_count(s) for s in self._db.get_all(old_refs, transaction=transaction))
+            else:
+                total = int(data.get("stock", 0))
+            return self._stage_stock_shards(transaction, product_ref, data, shards, total)
+
+        updated = _run(self._db.transaction())
+        if updated is not None:
+            self._stock_shards_written(product_id, updated)
+        return updated
+
     # --- Helpers de modelos de dominio ---
 
     def get_all_models(self) -> List[Product]:
@@ -65,20 +684,9 @@ class FirebaseProductCRUD:
         return Product.from_dict(updated_data)
 
 
-class FirebaseUserCRUD:
-    def __init__(self):
-        self._db = get_firestore_client()
-        self._collection = self._db.collection("users")
-
-    def get_all(self) -> List[dict]:
-        docs = self._collection.stream()
-        return [{**d.to_dict(), "id": d.id} for d in docs]
-
-    def get_by_id(self, user_id: str) -> Optional[dict]:
-        doc = self._collection.document(user_id).get()
-        if not doc.exists:
-            return None
-        return {**doc.to_dict(), "id": doc.id}
+@instrumented
+class FirebaseUserCRUD(BaseFirestoreCRUD):
+    collection_name = "users"
 
     def get_by_email(self, email: str) -> Optional[dict]:
         docs = self._collection.where("email", "==", email).limit(1).stream()
@@ -86,48 +694,25 @@ class FirebaseUserCRUD:
             return {**d.to_dict(), "id": d.id}
         return None
 
-    def create(self, data: Dict[str, Any]) -> dict:
-        doc_ref = self._collection.document()
-        doc_ref.set(data)
-        return {**data, "id": doc_ref.id}
-
-    def update(self, user_id: str, data: Dict[str, Any]) -> Optional[dict]:
-        doc_ref = self._collection.document(user_id)
-        if not doc_ref.get().exists:
-            return None
-        doc_ref.update(data)
-        updated = doc_ref.get().to_dict()
-        return {**updated, "id": user_id}
-
-    def delete(self, user_id: str) -> bool:
-        doc_ref = self._collection.document(user_id)
-        if not doc_ref.get().exists:
-            return False
-        doc_ref.delete()
-        return True
-
     # --- Helpers de modelos de dominio ---
 
+    @staticmethod
+    def to_model(data: Dict[str, Any]) -> User:
+        """Convierte un documento de usuario en el modelo de dominio User."""
+        # Mapear password_hash almacenado a hashed_password del dominio
+        mapped = {**data, "hashed_password": data.get("password_hash")}
+        return User.from_dict(mapped)
+
     def get_all_models(self) -> List[User]:
         """Obtiene todos los usuarios como modelos de dominio User."""
-        data_list = self.get_all()
-        users: List[User] = []
-        for data in data_list:
-            # Mapear password_hash almacenado a hashed_password del dominio
-            mapped = {
-                **data,
-                "hashed_password": data.get("password_hash"),
-            }
-            users.append(User.from_dict(mapped))
-        return users
+        return [self.to_model(data) for data in self.get_all()]
 
     def get_model_by_id(self, user_id: str) -> Optional[User]:
         """Obtiene un usuario como User o None si no existe."""
         data = self.get_by_id(user_id)
         if data is None:
             return None
-        mapped = {**data, "hashed_password": data.get("password_hash")}
-        return User.from_dict(mapped)
+        return self.to_model(data)
 
     def create_model(self, user: User) -> User:
         """Crea un usuario a partir de un modelo de dominio y devuelve el modelo creado.
@@ -154,114 +739,254 @@ class FirebaseUserCRUD:
         return User.from_dict(mapped)
 
 
-class FirebasePatientCRUD:
-    def __init__(self):
-        self._db = get_firestore_client()
-        self._collection = self._db.collection("patients")
+class PatientWrites(CollectionWrites):
+    """Las escrituras de pacientes mantienen al día el índice de búsqueda (crud.search)."""
 
-    def get_all(self) -> List[dict]:
-        docs = self._collection.stream()
-        return [{**d.to_dict(), "id": d.id} for d in docs]
+    collection_name = "patients"
+    rollup = staticmethod(patient_rollup)
 
-    def get_by_id(self, patient_id: str) -> Optional[dict]:
-        doc = self._collection.document(patient_id).get()
-        if not doc.exists:
-            return None
-        return {**doc.to_dict(), "id": doc.id}
+    def _written(self, patient_id: str, data: Dict[str, Any]) -> None:
+        patient_index.upsert(patient_id, data)
 
-    def create(self, data: Dict[str, Any]) -> dict:
-        doc_ref = self._collection.document()
-        doc_ref.set(data)
-        return {**data, "id": doc_ref.id}
+    def _removed(self, patient_id: str) -> None:
+        patient_index.remove(patient_id)
 
-    def update(self, patient_id: str, data: Dict[str, Any]) -> Optional[dict]:
-        doc_ref = self._collection.document(patient_id)
-        if not doc_ref.get().exists:
-            return None
-        doc_ref.update(data)
-        updated = doc_ref.get().to_dict()
-        return {**updated, "id": patient_id}
 
-    def delete(self, patient_id: str) -> bool:
-        doc_ref = self._collection.document(patient_id)
-        if not doc_ref.get().exists:
-            return False
-        doc_ref.delete()
-        return True
+@instrumented
+class FirebasePatientCRUD(PatientWrites, BaseFirestoreCRUD):
+    def bulk_create(
+        self,
+        rows: Iterable[Tuple[int, Dict[str, Any]]],
+        max_in_flight: int = 4,
+    ) -> Tuple[int, List[Tuple[int, str]]]:
+        created, failures = super().bulk_create(rows, max_in_flight)
+        if created:
+            # Tras una importación se reconstruye el índice completo
+            patient_index.invalidate()
+        return created, failures
 
+    def iter_search_fields(self) -> Iterator[dict]:
+        """Recorre los pacientes leyendo solo los campos del índice de búsqueda."""
+        for d in self._collection.select(RESULT_FIELDS).stream():
+            yield {**d.to_dict(), "id": d.id}
 
-class FirebaseAppointmentCRUD:
-    def __init__(self):
-        self._db = get_firestore_client()
-        self._collection = self._db.collection("appointments")
 
-    def get_all(self) -> List[dict]:
-        docs = self._collection.stream()
-        return [{**d.to_dict(), "id": d.id} for d in docs]
+class SlotUnavailableError(Exception):
+    """La fecha y hora solicitadas ya están reservadas por otra cita."""
 
-    def get_by_id(self, appointment_id: str) -> Optional[dict]:
-        doc = self._collection.document(appointment_id).get()
-        if not doc.exists:
-            return None
-        return {**doc.to_dict(), "id": doc.id}
 
-    def create(self, data: Dict[str, Any]) -> dict:
-        doc_ref = self._collection.document()
-        doc_ref.set(data)
-        return {**data, "id": doc_ref.id}
+def holds_slot(data: Dict[str, Any]) -> bool:
+    """Indica si la cita ocupa su horario (toda cita no cancelada)."""
+    return bool(data.get("fecha") and data.get("hora")) and data.get("estado") != "cancelada"
 
-    def update(self, appointment_id: str, data: Dict[str, Any]) -> Optional[dict]:
-        doc_ref = self._collection.document(appointment_id)
-        if not doc_ref.get().exists:
-            return None
-        doc_ref.update(data)
-        updated = doc_ref.get().to_dict()
-        return {**updated, "id": appointment_id}
 
-    def delete(self, appointment_id: str) -> bool:
-        doc_ref = self._collection.document(appointment_id)
-        if not doc_ref.get().exists:
-            return False
-        doc_ref.delete()
-        return True
+SLOTS_COLLECTION = "slots"
 
 
-class FirebaseAppointmentRequestCRUD:
-    def __init__(self):
-        self._db = get_firestore_client()
-        self._collection = self._db.collection("appointment_requests")
+def slot_id(data: Dict[str, Any]) -> str:
+    return f"{data['fecha']}_{data['hora']}"
 
-    def get_all(self) -> List[dict]:
-        docs = self._collection.stream()
-        return [{**d.to_dict(), "id": d.id} for d in docs]
 
-    def get_by_id(self, request_id: str) -> Optional[dict]:
-        doc = self._collection.document(request_id).get()
-        if not doc.exists:
-            return None
-        return {**doc.to_dict(), "id": doc.id}
+def slot_data(appointment_id: str, data: Dict[str, Any]) -> dict:
+    return {"appointment_id": appointment_id, "fecha": data["fecha"], "hora": data["hora"]}
 
-    def create(self, data: Dict[str, Any]) -> dict:
-        doc_ref = self._collection.document()
-        doc_ref.set(data)
-        return {**data, "id": doc_ref.id}
 
-    def update(self, request_id: str, data: Dict[str, Any]) -> Optional[dict]:
-        doc_ref = self._collection.document(request_id)
-        if not doc_ref.get().exists:
-            return None
-        doc_ref.update(data)
-        updated = doc_ref.get().to_dict()
-        return {**updated, "id": request_id}
+FECHA_HORA_FORMAT = "%Y-%m-%dT%H:%M"
 
-    def delete(self, request_id: str) -> bool:
-        doc_ref = self._collection.document(request_id)
-        if not doc_ref.get().exists:
-            return False
-        doc_ref.delete()
+# Campos que leen los recordatorios (proyección con select)
+REMINDER_FIELDS = ["pacienteId", "pacienteNombre", "propietario", "fecha", "hora", "motivo", "estado", "fechaHora"]
+
+
+def fecha_hora(data: Dict[str, Any]) -> Optional[str]:
+    """Fecha y hora de la cita normalizadas como ``YYYY-MM-DDTHH:MM``.
+
+    Como texto ordenan igual que como fecha, así que sirven para consultas
+    por rango. Devuelve None si la cita no tiene una fecha u hora válidas.
+    """
+    try:
+        return datetime.fromisoformat(f"{data['fecha']}T{data['hora']}").strftime(FECHA_HORA_FORMAT)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def schedule_fields(data: Dict[str, Any]) -> dict:
+    """Campos derivados que se guardan con la cita.
+
+    ``recordatorioPendiente`` indica si falta enviar el recordatorio de la
+    fecha actual; ``recordatorioPara`` guarda la fecha ya recordada, así que
+    al reprogramar la cita vuelve a quedar pendiente.
+    """
+    key = fecha_hora(data)
+    return {
+        "fechaHora": key,
+        "recordatorioPendiente": (
+            key is not None and data.get("estado") == "pendiente" and data.get("recordatorioPara") != key
+        ),
+    }
+
+
+def touches_schedule(data: Dict[str, Any]) -> bool:
+    return any(field in data for field in ("fecha", "hora", "estado"))
+
+
+class AppointmentWrites(CollectionWrites):
+    """Citas con reserva de horario.
+
+    Cada cita activa (no cancelada) tiene un documento ``slots/{fecha}_{hora}``
+    que se crea y se libera en la misma escritura atómica que la cita. Así
+    detectar una doble reserva es una lectura por clave y Firestore rechaza
+    la segunda de dos reservas concurrentes del mismo horario: ``create``
+    falla si el horario ya existe, y con él todo el batch.
+    """
+
+    collection_name = "appointments"
+    rollup = staticmethod(appointment_rollup)
+
+    def _slot_ref(self, data: Dict[str, Any]):
+        return self._db.collection(SLOTS_COLLECTION).document(slot_id(data))
+
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {**data, **schedule_fields(data)}
+
+    def _changes(self, current: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        if not touches_schedule(data):
+            return data
+        return {**data, **schedule_fields({**current, **data})}
+
+    def _stage_related(self, writer, doc_ref, old: Optional[dict], new: Optional[dict]) -> None:
+        super()._stage_related(writer, doc_ref, old, new)
+        old_slot = self._slot_ref(old) if old and holds_slot(old) else None
+        new_slot = self._slot_ref(new) if new and holds_slot(new) else None
+        old_path = old_slot.path if old_slot else None
+        new_path = new_slot.path if new_slot else None
+        if old_path == new_path:
+            return
+        if old_slot is not None:
+            writer.delete(old_slot)
+        if new_slot is not None:
+            writer.create(new_slot, slot_data(doc_ref.id, new))
+
+    def _reads_before_delete(self) -> bool:
         return True
 
+    def _already_exists(self, error: AlreadyExists) -> Exception:
+        return SlotUnavailableError("Ya existe una cita programada en esa fecha y hora")
+
+
+@instrumented
+class FirebaseAppointmentCRUD(AppointmentWrites, BaseFirestoreCRUD):
+    """CRUD de citas; la reserva de horario está en ``AppointmentWrites``."""
+
+    def rebuild_slots(self) -> int:
+        """Crea los horarios de las citas activas que aún no tienen uno.
 
+        Se usa una sola vez para las citas creadas antes de existir la
+        colección ``slots``. Devuelve cuántos horarios se crearon.
+        """
+        created = 0
+        for doc in self._collection.stream():
+            data = doc.to_dict() or {}
+            if not holds_slot(data):
+                continue
+            try:
+                self._slot_ref(data).create(slot_data(doc.id, data))
+                created += 1
+            except AlreadyExists:
+                continue
+        return created
+
+    def backfill_schedule_fields(self) -> int:
+        """Agrega ``fechaHora`` y el marcador de recordatorio a las citas antiguas.
+
+        Se usa una sola vez para las citas creadas antes de existir esos
+        campos. Devuelve cuántas citas se actualizaron.
+        """
+        updated = 0
+        batch = self._db.batch()
+        pending = 0
+        for doc in self._collection.stream():
+            data = doc.to_dict() or {}
+            if "fechaHora" in data:
+                continue
+            batch.update(doc.reference, schedule_fields(data))
+            pending += 1
+            if pending == self.BATCH_SIZE:
+                batch.commit()
+                updated += pending
+                batch = self._db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+            updated += pending
+        return updated
+
+    def iter_reminder_pages(
+        self, start: str, end: str, page_size: Optional[int] = None
+    ) -> Iterator[List[dict]]:
+        """Citas con recordatorio pendiente y ``start <= fechaHora < end``, por páginas.
+
+        La consulta de rango usa el índice compuesto
+        (recordatorioPendiente, fechaHora) de ``firestore.indexes.json`` y
+        solo trae los campos de ``REMINDER_FIELDS``.
+        """
+        page_size = page_size or self.BATCH_SIZE
+        query = (
+            self._collection.where(filter=FieldFilter("recordatorioPendiente", "==", True))
+            .where(filter=FieldFilter("fechaHora", ">=", start))
+            .where(filter=FieldFilter("fechaHora", "<", end))
+            .order_by("fechaHora")
+            .select(REMINDER_FIELDS)
+            .limit(page_size)
+        )
+        last = None
+        while True:
+            snapshots = (query if last is None else query.start_after(last)).get()
+            if not snapshots:
+                return
+            yield [{**snap.to_dict(), "id": snap.id} for snap in snapshots]
+            if len(snapshots) < page_size:
+                return
+            last = snapshots[-1]
+
+    def mark_reminded(self, appointments: List[dict], sent_ids: Iterable[str]) -> None:
+        """Marca la página de citas como recordada en un solo batch.
+
+        Se marcan todas, también las que no se enviaron (sin correo del
+        tutor), para que la próxima ejecución no las vuelva a leer.
+        """
+        sent = set(sent_ids)
+        batch = self._db.batch()
+        for appointment in appointments:
+            fields = {"recordatorioPendiente": False, "recordatorioPara": appointment.get("fechaHora")}
+            if appointment["id"] in sent:
+                fields["recordatorioEnviado"] = SERVER_TIMESTAMP
+            batch.update(self._collection.document(appointment["id"]), fields)
+        batch.commit()
+
+
+@instrumented
+class FirebaseAppointmentRequestCRUD(BaseFirestoreCRUD):
+    collection_name = "appointment_requests"
+
+
+def deep_merge(base: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia de ``base`` con ``changes`` aplicado sección por sección.
+
+    Los mapas se fusionan de forma recursiva y los valores ``None`` se
+    ignoran, así un PUT parcial solo cambia los campos que envía.
+    """
+    merged = dict(base)
+    for key, value in changes.items():
+        if value is None:
+            continue
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@instrumented
 class FirebaseSettingsCRUD:
     def __init__(self):
         self._db = get_firestore_client()
@@ -282,69 +1007,232 @@ class FirebaseSettingsCRUD:
         return saved
 
 
+# --- Carrito ---
+#
+# Cada carrito guarda sus items en el mapa ``lines`` indexado por product_id.
+# Agregar o quitar un producto es una escritura a ciegas sobre su entrada
+# (Increment / DELETE_FIELD), así que no depende del tamaño del carrito y
+# dos clics simultáneos no se pisan. Los carritos antiguos con el array
+# ``items`` se migran al leerlos.
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def cart_line_write(item: Dict[str, Any]) -> dict:
+    """Escritura (para ``set(merge=True)``) que suma el item a su línea."""
+    product_id = item.get("product_id")
+    if not product_id:
+        raise ValueError("product_id es requerido para el item del carrito")
+    line = {k: v for k, v in item.items() if k != "quantity"}
+    line["quantity"] = Increment(int(item.get("quantity", 1)))
+    line["updated_at"] = SERVER_TIMESTAMP
+    return {"lines": {product_id: line}}
+
+
+def fold_legacy_items(data: Dict[str, Any], removed: Iterable[str] = ()) -> Dict[str, dict]:
+    """Combina el array ``items`` antiguo con el mapa ``lines``.
+
+    Los productos de ``removed`` se descartan del array (el usuario los
+    quitó del carrito antes de que se migrara).
+    """
+    skip = set(removed)
+    lines: Dict[str, dict] = {k: dict(v) for k, v in (data.get("lines") or {}).items()}
+    for item in data.get("items") or []:
+        product_id = item.get("product_id")
+        if not product_id or product_id in skip:
+            continue
+        existing = lines.get(product_id)
+        if existing is None:
+            lines[product_id] = {**item, "quantity": item.get("quantity", 1)}
+        else:
+            existing["quantity"] = existing.get("quantity", 0) + item.get("quantity", 1)
+    return lines
+
+
+def stage_cart_migration(transaction, doc_ref, snapshot, removed: Iterable[str] = ()) -> dict:
+    """Pasa el array ``items`` de un carrito antiguo al mapa ``lines``."""
+    data = snapshot.to_dict() or {}
+    if "items" not in data:
+        return data
+    lines = fold_legacy_items(data, removed)
+    transaction.update(doc_ref, {"lines": lines, "items": DELETE_FIELD})
+    return {"lines": lines}
+
+
+def cart_from_doc(user_id: str, data: Optional[Dict[str, Any]]) -> dict:
+    """Convierte el documento al formato de respuesta ``{user_id, items}``."""
+    lines = [line for line in fold_legacy_items(data or {}).values() if int(line.get("quantity", 0)) > 0]
+    ordered = sorted(lines, key=lambda line: line.get("updated_at") or _EPOCH)
+    items = [{k: v for k, v in line.items() if k != "updated_at"} for line in ordered]
+    return {"user_id": user_id, "items": items}
+
+
+class CheckoutError(Exception):
+    """No se pudo completar la compra del carrito."""
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class ProductUnavailableError(CheckoutError):
+    """Algún producto del carrito ya no existe o no tiene stock suficiente."""
+
+    def __init__(self, message: str, product_ids: List[str]):
+        super().__init__(message)
+        self.product_ids = product_ids
+
+
+@instrumented
 class FirebaseCartCRUD:
     def __init__(self):
         self._db = get_firestore_client()
         self._collection = self._db.collection("carts")
 
     def get_cart(self, user_id: str) -> Optional[dict]:
-        doc = self._collection.document(user_id).get()
+        return self._load(user_id)
+
+    def _load(self, user_id: str, removed: Iterable[str] = ()) -> dict:
+        """Lee el carrito; uno antiguo se migra sin los productos de ``removed``."""
+        doc_ref = self._collection.document(user_id)
+        doc = doc_ref.get()
         if not doc.exists:
             return {"user_id": user_id, "items": []}
         data = doc.to_dict() or {}
-        data.setdefault("user_id", user_id)
-        data.setdefault("items", [])
-        return data
+        if "items" in data:
+            data = self._migrate(doc_ref, removed)
+        return cart_from_doc(user_id, data)
+
+    def _migrate(self, doc_ref, removed: Iterable[str] = ()) -> dict:
+        @transactional
+        def _run(transaction) -> dict:
+            return stage_cart_migration(transaction, doc_ref, doc_ref.get(transaction=transaction), removed)
+
+        return _run(self._db.transaction())
 
     def add_or_update_item(self, user_id: str, item: Dict[str, Any]) -> dict:
-        cart: Dict[str, Any] = self.get_cart(user_id)
-        items: List[Dict[str, Any]] = cart.get("items", [])
-        product_id = item.get("product_id")
-        if not product_id:
-            raise ValueError("product_id es requerido para el item del carrito")
-
-        updated = False
-        for existing in items:
-            if existing.get("product_id") == product_id:
-                quantity = existing.get("quantity", 1) + item.get("quantity", 1)
-                existing.update({**item, "quantity": quantity})
-                updated = True
-                break
-        if not updated:
-            if "quantity" not in item:
-                item["quantity"] = 1
-            items.append(item)
-        self._collection.document(user_id).set({"items": items}, merge=True)
-        return {"user_id": user_id, "items": items}
+        self._collection.document(user_id).set(cart_line_write(item), merge=True)
+        return self.get_cart(user_id)
 
     def remove_item(self, user_id: str, product_id: str) -> dict:
-        cart = self.get_cart(user_id)
-        items = cart.get("items", [])
-        items = [i for i in items if i.get("product_id") != product_id]
-        self._collection.document(user_id).set({"items": items}, merge=True)
-        return {"user_id": user_id, "items": items}
+        self._collection.document(user_id).set({"lines": {product_id: DELETE_FIELD}}, merge=True)
+        # En un carrito antiguo el producto también puede estar en ``items``
+        return self._load(user_id, removed=[product_id])
 
     def clear_cart(self, user_id: str) -> dict:
-        self._collection.document(user_id).set({"items": []}, merge=True)
+        self._collection.document(user_id).set({"lines": {}})
         return {"user_id": user_id, "items": []}
 
 
-class FirebaseOrderCRUD:
-    def __init__(self):
-        self._db = get_firestore_client()
-        self._collection = self._db.collection("orders")
+# Campos del resumen de una orden; el historial los lee con una proyección
+# (select) sin traer la lista de items
+ORDER_SUMMARY_FIELDS = [
+    "user_id", "created_at", "status", "total", "payment_method", "item_count", "first_item_image",
+]
 
-    def create(self, data: Dict[str, Any]) -> dict:
-        doc_ref = self._collection.document()
-        doc_ref.set(data)
-        return {**data, "id": doc_ref.id}
 
-    def get_by_id(self, order_id: str) -> Optional[dict]:
-        doc = self._collection.document(order_id).get()
-        if not doc.exists:
-            return None
-        return {**doc.to_dict(), "id": doc.id}
+def order_summary_fields(items: List[Dict[str, Any]]) -> dict:
+    """Datos del resumen que se derivan de los items y se guardan con la orden."""
+    return {
+        "item_count": sum(int(item.get("quantity", 0)) for item in items),
+        "first_item_image": next((item["image_url"] for item in items if item.get("image_url")), None),
+    }
+
+
+class OrderWrites(CollectionWrites):
+    collection_name = "orders"
+    rollup = staticmethod(order_rollup)
+
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {**data, **order_summary_fields(data.get("items") or [])}
 
+
+@instrumented
+class FirebaseOrderCRUD(OrderWrites, BaseFirestoreCRUD):
     def get_all_by_user(self, user_id: str) -> List[dict]:
         docs = self._collection.where("user_id", "==", user_id).stream()
-        return [{**d.to_dict(), "id": d.id} for d in docs]
\ No newline at end of file
+        return [{**d.to_dict(), "id": d.id} for d in docs]
+
+    def backfill_summary_fields(self) -> int:
+        """Agrega ``item_count`` y ``first_item_image`` a las órdenes antiguas.
+
+        Se usa una sola vez para las órdenes creadas antes de existir esos
+        campos. Devuelve cuántas órdenes se actualizaron.
+        """
+        updated = 0
+        batch = self._db.batch()
+        pending = 0
+        for doc in self._collection.stream():
+            data = doc.to_dict() or {}
+            if "item_count" in data:
+                continue
+            batch.update(doc.reference, order_summary_fields(data.get("items") or []))
+            pending += 1
+            if pending == self.BATCH_SIZE:
+                batch.commit()
+                updated += pending
+                batch = self._db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+            updated += pending
+        return updated
+
+
+@instrumented
+class FirebaseReportCRUD:
+    """Resúmenes diarios; ver ``crud.reports``."""
+
+    _SOURCES = (
+        ("appointments", appointment_rollup),
+        ("patients", patient_rollup),
+        ("orders", order_rollup),
+    )
+
+    def __init__(self):
+        self._db = get_firestore_client()
+        self._collection = self._db.collection(REPORTS_COLLECTION)
+
+    def recompute(self, start: Optional[str] = None, end: Optional[str] = None) -> int:
+        """Reconstruye los resúmenes de los días entre ``start`` y ``end`` (incluidos).
+
+        Recorre las tres colecciones leyendo solo los campos de
+        ``ROLLUP_FIELDS`` y reemplaza los resúmenes del rango; los shards
+        de esos días y los días sin datos se borran. Sin límites se
+        reconstruye todo el historial. Las
+        escrituras que ocurran mientras corre pueden perderse, así que
+        conviene ejecutarlo con poco tráfico. Devuelve cuántos días se
+        escribieron.
+        """
+        def in_range(day: str) -> bool:
+            return (start is None or day >= start) and (end is None or day <= end)
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        for collection, rollup in self._SOURCES:
+            query = self._db.collection(collection).select(ROLLUP_FIELDS[collection])
+            for snapshot in query.stream():
+                contribution = rollup(snapshot.to_dict() or {})
+                if contribution and in_range(contribution[0]):
+                    add_values(totals.setdefault(contribution[0], {}), contribution[1])
+
+        stale = [
+            snapshot.reference
+            for snapshot in self._collection.select([]).stream()
+            if in_range(snapshot.id) and snapshot.id not in totals
+        ]
+        stale.extend(
+            snapshot.reference
+            for snapshot in self._db.collection(REPORT_SHARDS_COLLECTION).select(["date"]).stream()
+            if in_range((snapshot.to_dict() or {}).get("date") or "")
+        )
+        writes: List[Tuple[Any, Optional[dict]]] = [(ref, None) for ref in stale]
+        writes.extend((self._collection.document(day), {"date": day, **values}) for day, values in totals.items())
+        for offset in range(0, len(writes), BaseFirestoreCRUD.BATCH_SIZE):
+            batch = self._db.batch()
+            for ref, data in writes[offset:offset + BaseFirestoreCRUD.BATCH_SIZE]:
+                if data is None:
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            batch.commit()
+        return len(totals)
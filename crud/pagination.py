@@ -0,0 +1,155 @@
+"""Paginación por cursor para las consultas sobre Firestore.
+
+El cursor que recibe el cliente es un token opaco (base64 url-safe) que
+contiene el campo de ordenamiento, el valor de ese campo en el último
+documento devuelto y el id de ese documento. Con eso se construye un
+``start_after`` sin tener que volver a leer el documento.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from google.cloud.firestore import FieldFilter, Query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Campo especial de Firestore que representa el id del documento
+DOCUMENT_ID_FIELD = "__name__"
+
+EQUALITY_OPERATORS = {"==", "!=", "in", "not-in", "array_contains", "array_contains_any"}
+RANGE_OPERATORS = {"<", "<=", ">", ">="}
+
+# (campo, operador, valor), igual que los argumentos de Query.where
+QueryFilter = Tuple[str, str, Any]
+
+
+class InvalidCursorError(ValueError):
+    """El cursor recibido está corrupto o no corresponde a la consulta."""
+
+
+@dataclass
+class Page:
+    """Una página de resultados y el cursor para pedir la siguiente."""
+
+    items: List[dict] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(order_by: str, value: Any, doc_id: str) -> str:
+    """Genera el token opaco a partir del último documento de la página."""
+    payload = {"o": order_by, "v": _encode_value(value), "id": doc_id}
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, order_by: str) -> Tuple[Any, str]:
+    """Devuelve (valor, id) del cursor validando que use el mismo orden."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor_order = payload["o"]
+        value = _decode_value(payload.get("v"))
+        doc_id = payload["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Cursor de paginación inválido")
+
+    if cursor_order != order_by or not isinstance(doc_id, str):
+        raise InvalidCursorError("El cursor no corresponde al orden solicitado")
+    return value, doc_id
+
+
+def resolve_order_by(order_by: Optional[str], filters: List[QueryFilter]) -> str:
+    """Determina el campo de orden de la consulta.
+
+    Firestore exige que el primer ``order_by`` sea el campo con filtro de
+    rango, así que si no se indica uno explícito se usa ese campo y, en
+    su defecto, el id del documento.
+    """
+    range_fields = {f for f, op, _ in filters if op in RANGE_OPERATORS}
+    if order_by:
+        if range_fields and range_fields != {order_by}:
+            raise ValueError("Los filtros de rango deben aplicarse sobre el campo de orden")
+        return order_by
+    if len(range_fields) > 1:
+        raise ValueError("Solo se admite un campo con filtro de rango")
+    if range_fields:
+        return next(iter(range_fields))
+    return DOCUMENT_ID_FIELD
+
+
+def validate_filters(filters: List[QueryFilter]) -> None:
+    for field_name, op, _ in filters:
+        if op not in EQUALITY_OPERATORS and op not in RANGE_OPERATORS:
+            raise ValueError(f"Operador de filtro no soportado: {op} ({field_name})")
+
+
+def start_after_values(order_by: str, value: Any, doc_id: str) -> Dict[str, Any]:
+    """Construye el dict para ``Query.start_after`` (orden + desempate por id)."""
+    if order_by == DOCUMENT_ID_FIELD:
+        return {DOCUMENT_ID_FIELD: doc_id}
+    return {order_by: value, DOCUMENT_ID_FIELD: doc_id}
+
+
+def build_query(
+    collection: Any,
+    filters: Optional[List[QueryFilter]] = None,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+) -> Tuple[Any, str]:
+    """Construye la consulta con filtros y orden estable (campo + id).
+
+    Sirve igual para colecciones síncronas y asíncronas, porque la API para
+    construir consultas es la misma; devuelve (consulta, campo de orden).
+    """
+    filters = filters or []
+    validate_filters(filters)
+    order_field = resolve_order_by(order_by, filters)
+    direction = Query.DESCENDING if descending else Query.ASCENDING
+
+    query = collection
+    for field_name, op, value in filters:
+        query = query.where(filter=FieldFilter(field_name, op, value))
+    query = query.order_by(order_field, direction=direction)
+    if order_field != DOCUMENT_ID_FIELD:
+        query = query.order_by(DOCUMENT_ID_FIELD, direction=direction)
+    return query, order_field
+
+
+def apply_cursor(query: Any, cursor: Optional[str], order_field: str) -> Any:
+    if not cursor:
+        return query
+    value, doc_id = decode_cursor(cursor, order_field)
+    return query.start_after(start_after_values(order_field, value, doc_id))
+
+
+def build_page(docs: Sequence[Any], limit: int, order_field: str) -> Page:
+    """Arma la página a partir de ``limit + 1`` snapshots leídos."""
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    items = [{**d.to_dict(), "id": d.id} for d in docs]
+
+    next_cursor = None
+    if has_more and docs:
+        last = docs[-1]
+        value = last.id if order_field == DOCUMENT_ID_FIELD else last.get(order_field)
+        next_cursor = encode_cursor(order_field, value, last.id)
+    return Page(items=items, next_cursor=next_cursor)
@@ -0,0 +1,183 @@
+"""Resúmenes diarios mantenidos por deltas.
+
+Cada alta, cambio o baja de citas, pacientes y órdenes suma o resta su
+aporte al resumen de su día con ``Increment``, en la misma escritura
+atómica (batch o transacción) que el dato. El incremento va a uno de
+``REPORT_SHARDS`` documentos del día elegido al azar
+(``daily_report_shards/{YYYY-MM-DD}_{n}``), así los checkouts y citas de
+un mismo día no compiten por un único documento. El resumen de un día es
+la suma de ``daily_reports/{YYYY-MM-DD}`` (lo que dejó el último
+``FirebaseReportCRUD.recompute``, ``python cli.py reports``) y sus shards;
+un reporte lee esos documentos sin importar cuántos datos haya.
+
+Aporte de cada documento a su día:
+
+* citas: ``appointments.{estado}`` en el día de la cita (``fecha``).
+* pacientes: ``new_patients`` en el día de alta (``fecha``).
+* órdenes: ``orders.count``/``orders.revenue`` y su desglose en
+  ``orders.by_payment_method.{método}``, en el día local de ``created_at``.
+"""
+
+import random
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from google.cloud.firestore import Increment
+
+from core.config import settings
+
+REPORTS_COLLECTION = "daily_reports"
+REPORT_SHARDS_COLLECTION = "daily_report_shards"
+
+Contribution = Optional[Tuple[str, Dict[str, Any]]]
+Rollup = Callable[[Dict[str, Any]], Contribution]
+
+# Campos que lee ``recompute`` de cada colección (proyección con select)
+ROLLUP_FIELDS = {
+    "appointments": ["fecha", "estado"],
+    "patients": ["fecha"],
+    "orders": ["created_at", "total", "payment_method"],
+}
+
+
+def report_day(value: Any) -> Optional[str]:
+    """Día ``YYYY-MM-DD`` de una fecha guardada como texto ISO o datetime."""
+    if isinstance(value, datetime):
+        # Las fechas de Firestore vienen en UTC; el día es el local
+        return (value.astimezone() if value.tzinfo is not None else value).date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10]).isoformat()
+        except ValueError:
+            return None
+    return None
+
+
+def appointment_rollup(data: Dict[str, Any]) -> Contribution:
+    day = report_day(data.get("fecha"))
+    estado = data.get("estado")
+    if not day or not estado:
+        return None
+    return day, {"appointments": {estado: 1}}
+
+
+def patient_rollup(data: Dict[str, Any]) -> Contribution:
+    day = report_day(data.get("fecha"))
+    return (day, {"new_patients": 1}) if day else None
+
+
+def order_rollup(data: Dict[str, Any]) -> Contribution:
+    day = report_day(data.get("created_at"))
+    if not day:
+        return None
+    total = float(data.get("total") or 0)
+    method = data.get("payment_method") or "desconocido"
+    return day, {
+        "orders": {
+            "count": 1,
+            "revenue": total,
+            "by_payment_method": {method: {"count": 1, "revenue": total}},
+        }
+    }
+
+
+def add_values(target: Dict[str, Any], values: Dict[str, Any], sign: int = 1) -> None:
+    """Suma (o resta con ``sign=-1``) un mapa anidado de números sobre ``target``."""
+    for key, value in values.items():
+        if isinstance(value, dict):
+            add_values(target.setdefault(key, {}), value, sign)
+        else:
+            target[key] = target.get(key, 0) + sign * value
+
+
+def _prune(values: Dict[str, Any]) -> bool:
+    """Quita las entradas en cero; devuelve True si no queda nada."""
+    for key in list(values):
+        value = values[key]
+        if (isinstance(value, dict) and _prune(value)) or value == 0:
+            del values[key]
+    return not values
+
+
+def rollup_delta(
+    rollup: Rollup, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]
+) -> Dict[str, Dict[str, Any]]:
+    """Cambio por día de pasar de ``old`` a ``new`` (None = no existe)."""
+    deltas: Dict[str, Dict[str, Any]] = {}
+    for data, sign in ((old, -1), (new, 1)):
+        contribution = rollup(data) if data else None
+        if contribution:
+            day, values = contribution
+            add_values(deltas.setdefault(day, {}), values, sign)
+    return {day: values for day, values in deltas.items() if not _prune(values)}
+
+
+def merge_deltas(target: Dict[str, Dict[str, Any]], deltas: Dict[str, Dict[str, Any]]) -> None:
+    for day, values in deltas.items():
+        add_values(target.setdefault(day, {}), values)
+
+
+def _increments(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: _increments(value) if isinstance(value, dict) else Increment(value)
+        for key, value in values.items()
+    }
+
+
+def add_report_writes(writer: Any, db: Any, deltas: Dict[str, Dict[str, Any]]) -> None:
+    """Agrega al batch o transacción ``writer`` los incrementos de cada día."""
+    collection = db.collection(REPORT_SHARDS_COLLECTION)
+    for day, values in deltas.items():
+        shard = random.randrange(max(settings.REPORT_SHARDS, 1))
+        writer.set(collection.document(f"{day}_{shard}"), {"date": day, **_increments(values)}, merge=True)
+
+
+def sum_report_docs(docs: Iterable[Dict[str, Any]], days: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Suma por día (``date``) los resúmenes y shards leídos de ``days``."""
+    wanted = set(days)
+    totals: Dict[str, Dict[str, Any]] = {}
+    for data in docs:
+        day = data.get("date")
+        if day in wanted:
+            add_values(totals.setdefault(day, {}), {k: v for k, v in data.items() if k != "date"})
+    return totals
+
+
+def report_days(start: date, end: date) -> List[str]:
+    return [date.fromordinal(n).isoformat() for n in range(start.toordinal(), end.toordinal() + 1)]
+
+
+def empty_report() -> Dict[str, Any]:
+    return {"appointments": {}, "new_patients": 0, "orders": {"count": 0, "revenue": 0.0, "by_payment_method": {}}}
+
+
+def _clean(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Redondea los montos y quita las entradas que los deltas dejaron en cero."""
+    # Los Increment de punto flotante acumulan error de redondeo
+    orders = report["orders"]
+    orders["revenue"] = round(orders["revenue"], 2)
+    for totals in orders["by_payment_method"].values():
+        totals["revenue"] = round(totals.get("revenue", 0), 2)
+    orders["by_payment_method"] = {
+        method: totals for method, totals in orders["by_payment_method"].items()
+        if totals.get("count") or totals["revenue"]
+    }
+    report["appointments"] = {estado: count for estado, count in report["appointments"].items() if count}
+    return report
+
+
+def normalize_report(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resumen con todas las claves, aunque el día no tenga datos."""
+    report = empty_report()
+    if data:
+        add_values(report, {k: v for k, v in data.items() if k != "date"})
+    return _clean(report)
+
+
+def sum_reports(reports: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    totals = empty_report()
+    for report in reports:
+        add_values(totals, {k: v for k, v in report.items() if k != "date"})
+    return _clean(totals)
@@ -0,0 +1,348 @@
+"""Índice de búsqueda de pacientes en memoria (GET /patients/search).
+
+Cada paciente se indexa por el nombre de la mascota, el nombre y apellido
+del tutor, su documento, su teléfono principal y su correo. Los textos se
+normalizan (minúsculas, sin tildes) y se parten en tokens; el documento y
+el teléfono se guardan como un solo token solo con letras y dígitos, así
+``300-123 4567`` y ``3001234567`` coinciden.
+
+Una búsqueda compara cada palabra de la consulta con el vocabulario:
+coincidencia exacta, por prefijo (lista ordenada + ``bisect``) o aproximada
+por trigramas para tolerar errores de tipeo. Las palabras cortas tienen
+pocos trigramas y una sola letra equivocada cambia la mayoría (``roky``
+y ``rocky`` comparten 2 de 7), así que entre los candidatos de los
+trigramas también se acepta una palabra a una edición (letra de más, de
+menos, cambiada o dos vecinas invertidas). Un paciente aparece si
+coincide con todas las palabras, y el puntaje pondera el tipo de
+coincidencia y el campo.
+
+El índice se carga la primera vez que se usa con una sola lectura de la
+colección (solo los campos indexados) y después lo mantienen al día las
+escrituras de los CRUD de pacientes. Para ver los cambios hechos desde otros
+procesos se reconstruye en segundo plano cada
+``PATIENT_SEARCH_REBUILD_SECONDS``, mientras se sigue respondiendo con el
+anterior.
+"""
+
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.config import settings
+
+# Campo -> peso en el puntaje
+SEARCH_FIELDS: Dict[str, float] = {
+    "mascota_nombre": 3.0,
+    "tutor_numero_documento": 3.0,
+    "tutor_telefono_principal": 3.0,
+    "tutor_nombre": 2.0,
+    "tutor_apellido": 2.0,
+    "email": 1.0,
+    # Campos legacy: nombre de la mascota y nombre completo del tutor
+    "nombre": 3.0,
+    "propietario": 2.0,
+}
+
+# Campos que se indexan como un único token (sin espacios ni guiones)
+_COMPACT_FIELDS = {"tutor_numero_documento", "tutor_telefono_principal"}
+
+# Campos que se guardan para mostrar en los resultados
+RESULT_FIELDS = [*SEARCH_FIELDS, "mascota_especie"]
+
+# Puntaje de cada tipo de coincidencia de una palabra
+_EXACT = 1.0
+_PREFIX = 0.8
+_FUZZY = 0.6
+
+# Palabras del vocabulario que se prueban por prefijo o por trigramas
+_MAX_EXPANSIONS = 200
+_MIN_FUZZY_LENGTH = 4
+_MIN_SIMILARITY = 0.3
+# Hasta esta longitud una palabra a una edición coincide aunque comparta
+# pocos trigramas, con al menos este parecido
+_MAX_EDIT_LENGTH = 6
+_EDIT_SIMILARITY = 0.5
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_PHONE_LIKE = re.compile(r"[\d\s\-.+()]+")
+
+
+def fold(text: Any) -> str:
+    """Texto en minúsculas y sin tildes (``Muñeca`` -> ``muneca``)."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(text: Any) -> List[str]:
+    return _TOKEN.findall(fold(text)) if text else []
+
+
+def compact(text: Any) -> str:
+    return "".join(tokenize(text))
+
+
+def query_tokens(query: str) -> List[str]:
+    """Palabras de la consulta; un número con separadores es una sola palabra."""
+    if _PHONE_LIKE.fullmatch(query.strip()):
+        token = compact(query)
+        return [token] if token else []
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Indica si ``a`` y ``b`` difieren en a lo sumo una edición.
+
+    Una edición es una letra de más o de menos, una letra cambiada o dos
+    letras vecinas invertidas (``rokcy`` / ``rocky``).
+    """
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]
+
+
+def document_tokens(data: Dict[str, Any]) -> Dict[str, float]:
+    """Token -> peso del campo más importante en el que aparece."""
+    weights: Dict[str, float] = {}
+    for field, weight in SEARCH_FIELDS.items():
+        value = data.get(field)
+        if not value:
+            continue
+        tokens = [compact(value)] if field in _COMPACT_FIELDS else tokenize(value)
+        for token in tokens:
+            if token and weights.get(token, 0) < weight:
+                weights[token] = weight
+    return weights
+
+
+class _Index:
+    """Estructuras del índice; quien lo usa se encarga del lock."""
+
+    def __init__(self):
+        self.docs: Dict[str, Tuple[Dict[str, float], Dict[str, Any]]] = {}
+        self.postings: Dict[str, Dict[str, float]] = {}
+        # Vocabulario ordenado para buscar por prefijo
+        self.vocabulary: List[str] = []
+        self.grams: Dict[str, Set[str]] = {}
+
+    def upsert(self, doc_id: str, data: Dict[str, Any]) -> None:
+        self.remove(doc_id)
+        weights = document_tokens(data)
+        self.docs[doc_id] = (weights, {field: data.get(field) for field in RESULT_FIELDS})
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                insort(self.vocabulary, token)
+                for gram in trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            posting[doc_id] = weight
+
+    def remove(self, doc_id: str) -> None:
+        entry = self.docs.pop(doc_id, None)
+        if entry is None:
+            return
+        for token in entry[0]:
+            posting = self.postings[token]
+            del posting[doc_id]
+            if posting:
+                continue
+            # Palabra que ya no usa ningún paciente
+            del self.postings[token]
+            del self.vocabulary[bisect_left(self.vocabulary, token)]
+            for gram in trigrams(token):
+                tokens = self.grams[gram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.grams[gram]
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _matches(self, word: str) -> Dict[str, float]:
+        """Palabras del vocabulario que coinciden con ``word`` y su puntaje."""
+        matches: Dict[str, float] = {}
+        start = bisect_left(self.vocabulary, word)
+        for token in self.vocabulary[start:start + _MAX_EXPANSIONS]:
+            if not token.startswith(word):
+                break
+            matches[token] = _EXACT if token == word else _PREFIX
+
+        # Los números (documento, teléfono) solo coinciden por prefijo
+        if len(word) >= _MIN_FUZZY_LENGTH and not word.isdigit():
+            word_grams = trigrams(word)
+            shared = Counter(token for gram in word_grams for token in self.grams.get(gram, ()))
+            for token, common in shared.most_common(_MAX_EXPANSIONS):
+                if token in matches:
+                    continue
+                similarity = common / (len(word_grams) + len(trigrams(token)) - common)
+                if len(word) <= _MAX_EDIT_LENGTH and within_one_edit(word, token):
+                    similarity = max(similarity, _EDIT_SIMILARITY)
+                if similarity >= _MIN_SIMILARITY:
+                    matches[token] = _FUZZY * similarity
+        return matches
+
+    def search(self, words: List[str], limit: int) -> List[Tuple[float, str]]:
+        scores: Optional[Dict[str, float]] = None
+        for word in words:
+            best: Dict[str, float] = {}
+            for token, quality in self._matches(word).items():
+                for doc_id, weight in self.postings[token].items():
+                    score = quality * weight
+                    if score > best.get(doc_id, 0):
+                        best[doc_id] = score
+            if scores is None:
+                scores = best
+            else:
+                # Tiene que coincidir con todas las palabras
+                scores = {doc_id: scores[doc_id] + score for doc_id, score in best.items() if doc_id in scores}
+            if not scores:
+                return []
+        ranked = heapq.nsmallest(limit, (scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        return [(round(score, 3), doc_id) for doc_id, score in ranked]
+
+
+class LiveIndex:
+    """Índice en memoria que se carga una vez y se mantiene con las escrituras.
+
+    ``factory`` crea la estructura vacía (con ``upsert``/``remove``) y
+    ``load`` devuelve los documentos para llenarla. Las lecturas usan
+    ``_ensure_loaded`` y ``_lock``. Una reconstrucción arma una estructura
+    nueva sin bloquear las búsquedas; las escrituras que llegan mientras
+    tanto se aplican sobre las dos y la nueva se publica al terminar.
+    """
+
+    thread_name = "index-rebuild"
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        load: Callable[[], Iterable[Dict[str, Any]]],
+        rebuild_seconds: float,
+    ):
+        self._factory = factory
+        self._load = load
+        self.rebuild_seconds = rebuild_seconds
+        self._index: Any = None
+        self._built_at = 0.0
+        self._stale = False
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        # Una sola carga a la vez
+        self._build_lock = threading.Lock()
+        self._pending: Optional[List[Callable[[Any], None]]] = None
+
+    def _build(self, only_if_missing: bool = False) -> None:
+        with self._build_lock:
+            if only_if_missing and self._index is not None:
+                return
+            with self._lock:
+                self._pending = []
+            index = self._factory()
+            try:
+                for data in self._load():
+                    index.upsert(data["id"], data)
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for change in self._pending:
+                    change(index)
+                self._pending = None
+                self._index = index
+                self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self) -> None:
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._stale = False
+
+        def run() -> None:
+            try:
+                self._build()
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name=self.thread_name, daemon=True).start()
+
+    def _ensure_loaded(self) -> None:
+        if self._index is None:
+            # La primera lectura espera la carga; las siguientes nunca
+            self._build(only_if_missing=True)
+        elif self._stale or (self.rebuild_seconds and time.monotonic() - self._built_at > self.rebuild_seconds):
+            self._rebuild_in_background()
+
+    def _apply(self, change: Callable[[Any], None]) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(change)
+            if self._index is not None:
+                change(self._index)
+            # Si todavía no se cargó, la carga leerá el dato actual
+
+    def upsert(self, doc_id: str, data: Dict[str, Any]) -> None:
+        """Indexa la versión completa del documento ``doc_id``."""
+        self._apply(lambda index: index.upsert(doc_id, data))
+
+    def remove(self, doc_id: str) -> None:
+        self._apply(lambda index: index.remove(doc_id))
+
+    def invalidate(self) -> None:
+        """Fuerza una reconstrucción (por ejemplo tras una importación masiva)."""
+        self._stale = True
+
+    def __len__(self) -> int:
+        index = self._index
+        return len(index) if index is not None else 0
+
+
+class PatientSearchIndex(LiveIndex):
+    thread_name = "patient-search-rebuild"
+
+    def __init__(self, load: Callable[[], Iterable[Dict[str, Any]]], rebuild_seconds: Optional[float] = None):
+        super().__init__(
+            _Index,
+            load,
+            settings.PATIENT_SEARCH_REBUILD_SECONDS if rebuild_seconds is None else rebuild_seconds,
+        )
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Pacientes que coinciden con ``query``, del más al menos relevante."""
+        words = query_tokens(query)
+        if not words:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            index = self._index
+            hits = index.search(words, limit)
+            return [{**index.docs[doc_id][1], "id": doc_id, "score": score} for score, doc_id in hits]
+
+
+def _load_patients() -> Iterable[Dict[str, Any]]:
+    from crud.firebase_crud import FirebasePatientCRUD
+
+    return FirebasePatientCRUD().iter_search_fields()
+
+
+patient_index = PatientSearchIndex(_load_patients)
@@ -1,16 +1,13 @@
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 from core.config import settings
 
-# Singleton de Firestore
+# Singletons de Firestore (cliente síncrono y asíncrono)
 _firestore_client = None
+_async_firestore_client = None
 
 
-def get_firestore_client():
-    global _firestore_client
-    if _firestore_client is not None:
-        return _firestore_client
-
+def _ensure_app() -> None:
     if not firebase_admin._apps:
         if not settings.FIREBASE_CREDENTIALS_PATH:
             raise RuntimeError("FIREBASE_CREDENTIALS_PATH no está configurado")
@@ -19,5 +16,27 @@ def get_firestore_client():
         firebase_admin.initialize_app(cred, {
         })
 
+
+def get_firestore_client():
+    global _firestore_client
+    if _firestore_client is not None:
+        return _firestore_client
+
+    _ensure_app()
     _firestore_client = firestore.client()
-    return _firestore_client
\ No newline at end of file
+    return _firestore_client
+
+
+def get_async_firestore_client():
+    """Cliente AsyncClient para los endpoints ``async def``.
+
+    El canal gRPC se abre en la primera llamada, dentro del event loop que
+    la ejecuta, así que es seguro crearlo al importar los routers.
+    """
+    global _async_firestore_client
+    if _async_firestore_client is not None:
+        return _async_firestore_client
+
+    _ensure_app()
+    _async_firestore_client = firestore_async.client()
+    return _async_firestore_client
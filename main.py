@@ -1,8 +1,13 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from api.v1.api import api_router
+from core.compression import CompressionMiddleware
 from core.config import settings
+from core.mailer import mailer
+from core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry
+from core.static_files import CachedStaticFiles
+from crud.async_firebase_crud import AsyncFirebaseSettingsCRUD, AsyncFirebaseTokenRevocationCRUD
 
 app = FastAPI(
     title="Mi Tienda API - Desacoplamiento Monolito",
@@ -10,7 +15,10 @@ app = FastAPI(
     version="1.0.0",
     openapi_url="/openapi.json",
     docs_url="/docs",      # Swagger UI
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # Con la serialización rápida activa el resto de las respuestas también
+    # se codifican con orjson
+    default_response_class=JSONResponse if settings.JSON_FAST_PATH == "off" else ORJSONResponse,
 )
 
 # CORS para frontend en localhost (React/Vite)
@@ -23,13 +31,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Missing-Ids"],
 )
 
+# gzip/brotli para las respuestas de texto que superan COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Latencia por ruta; va por fuera de los demás para medir la petición completa
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
-# Archivos estáticos (imágenes de productos, etc.)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Archivos estáticos (imágenes de productos, etc.); las imágenes con hash en
+# el nombre se cachean como inmutables
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+
+# Al apagar se envían los correos pendientes y se cierran las sesiones SMTP
+app.add_event_handler("shutdown", mailer.close)
+
+# La configuración global se mantiene al día con un listener de Firestore
+app.add_event_handler("startup", AsyncFirebaseSettingsCRUD.start_listener)
+app.add_event_handler("shutdown", AsyncFirebaseSettingsCRUD.stop_listener)
+
+# Las revocaciones de tokens hechas en cualquier worker llegan a todos
+app.add_event_handler("startup", AsyncFirebaseTokenRevocationCRUD.start_listener)
+app.add_event_handler("shutdown", AsyncFirebaseTokenRevocationCRUD.stop_listener)
+
 
 @app.get("/")
 def root():
-    return {"message": "API de Mi Tienda - Backend desacoplado con FastAPI"}
\ No newline at end of file
+    return {"message": "API de Mi Tienda - Backend desacoplado con FastAPI"}
+
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Métricas del proceso en formato de Prometheus (ver core/metrics.py)."""
+        return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
@@ -10,7 +10,8 @@ class Product:
     Modelo de dominio para productos.
 
     Representa un producto en la lógica de negocio y se mantiene
-    independiente de FastAPI/Pydantic.
+    independiente de FastAPI/Pydantic. ``stock`` es siempre el total
+    disponible, aunque en Firestore esté repartido en shards.
     """
 
     id: Optional[str]
@@ -19,6 +20,7 @@ class Product:
     stock: int
     category: str
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Product":
@@ -30,6 +32,7 @@ class Product:
             stock=int(data.get("stock", 0)),
             category=data.get("category", ""),
             image_url=data.get("image_url"),
+            image_variants=data.get("image_variants"),
         )
 
     def to_dict(self, include_id: bool = False) -> Dict[str, Any]:
@@ -44,6 +47,7 @@ class Product:
             "stock": self.stock,
             "category": self.category,
             "image_url": self.image_url,
+            "image_variants": self.image_variants,
         }
 
         if include_id and self.id is not None:
@@ -1,5 +1,26 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from datetime import date, time
+from pydantic import AfterValidator, BaseModel
+from typing import Annotated, Optional, Literal
+
+
+def normalize_fecha(value: str) -> str:
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError("Fecha inválida; usa el formato AAAA-MM-DD")
+
+
+def normalize_hora(value: str) -> str:
+    try:
+        return time.fromisoformat(value).strftime("%H:%M")
+    except ValueError:
+        raise ValueError("Hora inválida; usa el formato HH:MM")
+
+
+# Se guardan normalizadas: forman el id del horario (slots/{fecha}_{hora}),
+# así "10:00" y "10:00:00" no reservan dos veces la misma hora
+Fecha = Annotated[str, AfterValidator(normalize_fecha)]
+Hora = Annotated[str, AfterValidator(normalize_hora)]
 
 
 class AppointmentBase(BaseModel):
@@ -14,15 +35,16 @@ class AppointmentBase(BaseModel):
 
 
 class AppointmentCreate(AppointmentBase):
-    pass
+    fecha: Fecha
+    hora: Hora
 
 
 class AppointmentUpdate(BaseModel):
     pacienteId: Optional[str] = None
     pacienteNombre: Optional[str] = None
     propietario: Optional[str] = None
-    fecha: Optional[str] = None
-    hora: Optional[str] = None
+    fecha: Optional[Fecha] = None
+    hora: Optional[Hora] = None
     motivo: Optional[str] = None
     estado: Optional[Literal['pendiente', 'completada', 'cancelada', 'en-proceso']] = None
     fechaCreacion: Optional[str] = None
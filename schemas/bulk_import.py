@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class ImportRowError(BaseModel):
+    row: int  # número de fila en el archivo (1 = primera fila de datos)
+    errors: List[str]
+
+
+class ImportReport(BaseModel):
+    total_rows: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+    # Fila desde la que el archivo no se pudo leer (codificación o CSV
+    # inválidos); las anteriores quedan importadas y el resto no
+    stopped_at_row: Optional[int] = None
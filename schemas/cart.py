@@ -1,5 +1,5 @@
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal
 
 
@@ -7,7 +7,7 @@ class CartItem(BaseModel):
     product_id: str
     name: str
     price: float
-    quantity: int
+    quantity: int = Field(..., ge=1)
     image_url: Optional[str] = None
 
 
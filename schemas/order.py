@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+from schemas.cart import CartItem, PaymentDetails
+
+
+class OrderSummary(BaseModel):
+    """Orden en el historial: sin la lista de items."""
+
+    id: str
+    user_id: str
+    created_at: Optional[datetime] = None
+    status: Optional[str] = None
+    total: float
+    payment_method: Optional[str] = None
+    # Se guardan al crear la orden; None en las órdenes anteriores a estos
+    # campos hasta correr ``python cli.py backfill-orders``
+    item_count: Optional[int] = None
+    first_item_image: Optional[str] = None
+
+
+class Order(OrderSummary):
+    items: List[CartItem] = []
+    payment_details: Optional[PaymentDetails] = None
@@ -87,3 +87,19 @@ class PatientInDB(PatientBase):
 
     class Config:
         from_attributes = True
+
+
+class PatientSearchResult(BaseModel):
+    """Paciente encontrado por GET /patients/search (solo los datos para elegirlo)."""
+
+    id: str
+    score: float
+    nombre: Optional[str] = None
+    propietario: Optional[str] = None
+    email: Optional[str] = None
+    tutor_nombre: Optional[str] = None
+    tutor_apellido: Optional[str] = None
+    tutor_numero_documento: Optional[str] = None
+    tutor_telefono_principal: Optional[str] = None
+    mascota_nombre: Optional[str] = None
+    mascota_especie: Optional[str] = None
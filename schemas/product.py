@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
 
 class ProductBase(BaseModel):
     name: str
@@ -17,8 +17,40 @@ class ProductUpdate(ProductBase):
     stock: Optional[int] = None
     category: Optional[str] = None
 
+    @field_validator("stock")
+    @classmethod
+    def stock_not_null(cls, value: Optional[int]) -> int:
+        # Omitir el campo no lo cambia; null lo borraría del producto
+        if value is None:
+            raise ValueError("stock no puede ser null")
+        return value
+
+class StockShardsUpdate(BaseModel):
+    # 0 vuelve a guardar el stock en el documento del producto
+    shards: int = Field(..., ge=0)
+    stock: Optional[int] = Field(None, ge=0)
+
 class ProductInDB(ProductBase):
     id: str
+    # Versiones reducidas de la imagen ({"thumb": url, "medium": url}); las
+    # genera el servidor al subir la imagen
+    image_variants: Optional[Dict[str, str]] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PriceBucket(BaseModel):
+    # None: tramo abierto (sin mínimo o sin máximo)
+    min: Optional[float] = None
+    max: Optional[float] = None
+    count: int
+
+class CatalogFacets(BaseModel):
+    categories: Dict[str, int]
+    price: List[PriceBucket]
+    in_stock: int
+
+class ProductSearchResult(BaseModel):
+    items: List[ProductInDB]
+    total: int
+    facets: CatalogFacets
@@ -0,0 +1,28 @@
+from pydantic import BaseModel
+from typing import Dict, List
+
+
+class PaymentMethodTotals(BaseModel):
+    count: int = 0
+    revenue: float = 0.0
+
+
+class OrderTotals(BaseModel):
+    count: int = 0
+    revenue: float = 0.0
+    by_payment_method: Dict[str, PaymentMethodTotals] = {}
+
+
+class ReportTotals(BaseModel):
+    appointments: Dict[str, int] = {}  # citas del día por estado
+    new_patients: int = 0
+    orders: OrderTotals = OrderTotals()
+
+
+class DailyReport(ReportTotals):
+    date: str  # YYYY-MM-DD
+
+
+class DailyReportRange(BaseModel):
+    days: List[DailyReport]
+    totals: ReportTotals